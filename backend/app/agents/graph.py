@@ -5,17 +5,22 @@ START → intent_router → planner → tool_executor ↺ → reflector
                                                     ├─ pass → aggregator → END
                                                     └─ fail (≤replan) → planner
 ```
+
+tool_executor 节点默认为 dag_executor（按 depends_on 并发执行就绪步骤）；
+AGENT_PARALLEL_STEPS=false 时回退为逐步顺序执行的 tool_executor_node。
 """
 
 from __future__ import annotations
 
 import logging
+import os
 from functools import lru_cache
 
 from langgraph.graph import END, START, StateGraph
 
 from .nodes import (
     aggregator_node,
+    dag_executor_node,
     intent_router_node,
     planner_node,
     reflector_node,
@@ -29,7 +34,7 @@ MAX_PLAN_REPLAN = 1
 
 
 def _route_after_executor(state: AgentState) -> str:
-    """工具循环出口：plan 还有剩余且未超时 → 继续 tool_executor，否则进入 reflector。"""
+    """工具循环出口：plan 还有未完成的步骤且未超时 → 继续 tool_executor，否则进入 reflector。"""
 
     plan = state.get("plan") or []
     cursor = int(state.get("cursor") or 0)
@@ -51,6 +56,11 @@ def _route_after_reflector(state: AgentState) -> str:
     return "planner"
 
 
+def _parallel_steps_enabled() -> bool:
+    value = os.getenv("AGENT_PARALLEL_STEPS", "true").strip().lower()
+    return value not in {"0", "false", "no"}
+
+
 @lru_cache(maxsize=1)
 def get_agent_graph():
     """构建并缓存 LangGraph 编译产物。"""
@@ -59,7 +69,10 @@ def get_agent_graph():
 
     graph.add_node("intent_router", intent_router_node)
     graph.add_node("planner", planner_node)
-    graph.add_node("tool_executor", tool_executor_node)
+    graph.add_node(
+        "tool_executor",
+        dag_executor_node if _parallel_steps_enabled() else tool_executor_node,
+    )
     graph.add_node("reflector", reflector_node)
     graph.add_node("aggregator", aggregator_node)
 
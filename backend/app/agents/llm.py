@@ -13,6 +13,7 @@ from typing import Any
 
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from .. import metrics
 from ..services.langchain_client import get_chat_model, is_dashscope_configured
 from ..services.model_client import parse_json_payload
 
@@ -35,9 +36,10 @@ def call_json(
     if not llm:
         return None
     try:
-        response = llm.invoke(
-            [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
-        )
+        with metrics.track_llm_call("agent_json"):
+            response = llm.invoke(
+                [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
+            )
         text = getattr(response, "content", str(response))
     except Exception:
         logger.exception("LLM call failed")
@@ -56,12 +58,13 @@ def call_json(
         "不要添加任何解释。原始内容：\n" + str(text)
     )
     try:
-        repaired = llm.invoke(
-            [
-                SystemMessage(content="你是 JSON 修复助手，只输出严格 JSON。"),
-                HumanMessage(content=repair_prompt),
-            ]
-        )
+        with metrics.track_llm_call("agent_json_repair"):
+            repaired = llm.invoke(
+                [
+                    SystemMessage(content="你是 JSON 修复助手，只输出严格 JSON。"),
+                    HumanMessage(content=repair_prompt),
+                ]
+            )
         repaired_text = getattr(repaired, "content", str(repaired))
         payload = parse_json_payload(repaired_text)
         if isinstance(payload, dict):
@@ -78,9 +81,10 @@ def call_text(system_prompt: str, user_prompt: str) -> str | None:
     if not llm:
         return None
     try:
-        response = llm.invoke(
-            [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
-        )
+        with metrics.track_llm_call("agent_text"):
+            response = llm.invoke(
+                [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
+            )
         text = getattr(response, "content", str(response))
         return str(text).strip() if text else None
     except Exception:
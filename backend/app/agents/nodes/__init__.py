@@ -1,6 +1,7 @@
 """LangGraph 节点实现。"""
 
 from .aggregator import aggregator_node
+from .dag_executor import dag_executor_node
 from .intent_router import intent_router_node
 from .planner import planner_node
 from .reflector import reflector_node
@@ -8,6 +9,7 @@ from .tool_executor import tool_executor_node
 
 __all__ = [
     "aggregator_node",
+    "dag_executor_node",
     "intent_router_node",
     "planner_node",
     "reflector_node",
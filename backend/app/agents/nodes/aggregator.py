@@ -8,7 +8,7 @@ from __future__ import annotations
 import logging
 from typing import Any
 
-from ...services.memory_store import add_message, get_or_create_conversation
+from ...services.memory_store import record_turn
 from ...services.rag_utils import build_citations
 from ..intents import Intent
 from ..llm import call_text, llm_available, safe_json_dumps
@@ -168,13 +168,11 @@ def _persist_to_memory(state: AgentState, answer_obj: dict[str, Any]) -> None:
     if not user_id or not course_id:
         return
     try:
-        conv = get_or_create_conversation(
-            user_id, course_id, state.get("conversation_id")
-        )
-        add_message(conv["id"], "user", state.get("user_input", ""))
-        add_message(
-            conv["id"],
-            "assistant",
+        record_turn(
+            user_id,
+            course_id,
+            state.get("conversation_id"),
+            state.get("user_input", ""),
             str(answer_obj.get("answer") or ""),
             answer_obj.get("citations") or [],
         )
@@ -0,0 +1,173 @@
+"""并行工具调用节点：按 depends_on 把 plan 当作 DAG 执行。
+
+- 依赖全部完成（成功或失败）的步骤即为就绪，提交到进程共享的线程池并发执行；
+  每次运行同时执行的步骤不超过 AGENT_STEP_CONCURRENCY，池大小为 AGENT_STEP_WORKERS
+- 未声明 depends_on 的步骤依赖前一步，行为与顺序执行一致
+- 就绪步骤提交前在主线程调用 _backfill_args，只传入其（直接或间接）前置步骤的结果，
+  按 plan 顺序排列，与顺序执行时看到的输入一致，不受其他步骤完成先后影响
+- 截止时间在工作线程开始执行时按剩余运行预算计算（见 tool_executor.step_deadline），
+  在线程池中排队的时间不占用单步时限，单步超时也不会拖过整次预算
+- 每次调用至少收回一个完成的步骤后返回，流式事件仍按步骤完成推送；
+  尚未完成的 Future 按 run_id 保存在 run_context，下次调用继续等待
+- step_results 按完成先后追加；cursor 记录已完成的步骤数
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ..run_context import running_steps
+from ..state import AgentState, PlannedStep, StepResult, time_elapsed
+from .tool_executor import _backfill_args, execute_step, step_deadline
+
+logger = logging.getLogger(__name__)
+
+_STEP_EXECUTOR: ThreadPoolExecutor | None = None
+_STEP_EXECUTOR_LOCK = threading.Lock()
+
+
+def _step_concurrency() -> int:
+    """单次运行内同时执行的步骤数上限。"""
+    return max(1, int(os.getenv("AGENT_STEP_CONCURRENCY", "4")))
+
+
+def _step_workers() -> int:
+    return max(1, int(os.getenv("AGENT_STEP_WORKERS", "32")))
+
+
+def _get_step_executor() -> ThreadPoolExecutor:
+    global _STEP_EXECUTOR
+    with _STEP_EXECUTOR_LOCK:
+        if _STEP_EXECUTOR is None:
+            _STEP_EXECUTOR = ThreadPoolExecutor(
+                max_workers=_step_workers(),
+                thread_name_prefix="agent-step",
+            )
+        return _STEP_EXECUTOR
+
+
+def shutdown_step_executor() -> None:
+    global _STEP_EXECUTOR
+    with _STEP_EXECUTOR_LOCK:
+        if _STEP_EXECUTOR is not None:
+            _STEP_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            _STEP_EXECUTOR = None
+
+
+def step_dependencies(plan: list[PlannedStep]) -> dict[str, list[str]]:
+    """step_id → 前置 step_id 列表；忽略未知或指向自身的依赖。"""
+
+    known = {step.get("step_id") for step in plan}
+    dependencies: dict[str, list[str]] = {}
+    previous: str | None = None
+    for step in plan:
+        step_id = step.get("step_id") or ""
+        if "depends_on" in step:
+            dependencies[step_id] = [
+                dep for dep in step.get("depends_on") or [] if dep in known and dep != step_id
+            ]
+        else:
+            dependencies[step_id] = [previous] if previous else []
+        previous = step_id
+    return dependencies
+
+
+def _ancestors(step_id: str, dependencies: dict[str, list[str]]) -> set[str]:
+    seen: set[str] = set()
+    stack = list(dependencies.get(step_id) or [])
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        stack.extend(dependencies.get(current) or [])
+    return seen
+
+
+def _upstream_results(
+    step_id: str,
+    plan: list[PlannedStep],
+    results: list[StepResult],
+    dependencies: dict[str, list[str]],
+) -> list[StepResult]:
+    """step 的前置步骤（含间接依赖）的结果，按 plan 顺序排列。"""
+
+    ancestors = _ancestors(step_id, dependencies)
+    by_id = {result.get("step_id"): result for result in results}
+    return [
+        by_id[step["step_id"]]
+        for step in plan
+        if step.get("step_id") in ancestors and step.get("step_id") in by_id
+    ]
+
+
+def _run_step(step: PlannedStep, run_id: str, state: AgentState) -> StepResult:
+    # 截止时间从工作线程真正开始执行时算起
+    return execute_step(step, run_id, step_deadline(state))
+
+
+def dag_executor_node(state: AgentState) -> dict:
+    plan = list(state.get("plan") or [])
+    results = list(state.get("step_results") or [])
+    if len(results) >= len(plan):
+        return {}
+
+    run_id = state.get("run_id") or ""
+    # 没有 run_id 时无法跨调用保存 Future，本次调用内等全部完成
+    running = running_steps(run_id) if run_id else {}
+    plan_ids = {step.get("step_id") for step in plan}
+    for step_id in [step_id for step_id in running if step_id not in plan_ids]:
+        running.pop(step_id)[1].cancel()  # 重新规划前遗留的步骤
+
+    finished = {result.get("step_id") for result in results}
+    dependencies = step_dependencies(plan)
+    executor = _get_step_executor()
+
+    def submit(index: int) -> None:
+        step_id = plan[index].get("step_id") or ""
+        upstream = _upstream_results(step_id, plan, results, dependencies)
+        step = _backfill_args({**state, "step_results": upstream}, dict(plan[index]))
+        plan[index] = step
+        running[step_id] = (step, executor.submit(_run_step, step, run_id, state))
+
+    remaining = [
+        index
+        for index, step in enumerate(plan)
+        if step.get("step_id") not in finished and step.get("step_id") not in running
+    ]
+    for index in remaining:
+        if len(running) >= _step_concurrency():
+            break
+        if all(dep in finished for dep in dependencies[plan[index].get("step_id") or ""]):
+            submit(index)
+    if not running and remaining:
+        # 依赖成环：按 plan 顺序放行一步，避免死锁
+        logger.warning("dag_executor: dependency cycle in plan, running steps in order")
+        submit(remaining[0])
+
+    budget = float(state.get("time_budget_seconds") or 60.0)
+    done, _ = wait(
+        [future for _, future in running.values()],
+        timeout=max(0.0, budget - time_elapsed(state)),
+        return_when=FIRST_COMPLETED if run_id else ALL_COMPLETED,
+    )
+
+    completed_ids = [step_id for step_id, (_, future) in running.items() if future in done]
+    for step_id in completed_ids:
+        step, future = running.pop(step_id)
+        results.append(future.result())
+        logger.info(
+            "dag_executor: step %s (%s) finished, %s still running",
+            step_id,
+            step.get("tool_name"),
+            len(running),
+        )
+
+    return {
+        "plan": plan,
+        "cursor": len(results),
+        "step_results": results,
+    }
@@ -1,6 +1,7 @@
 """任务拆解节点（agent-spec §3.2）。
 
 简单意图直接套用 Skill 预设步骤序列；mixed 意图调用 LLM 自由拆解。
+每个步骤通过 depends_on 声明前置步骤，互不依赖的步骤由 dag_executor 并发执行。
 """
 
 from __future__ import annotations
@@ -22,13 +23,21 @@ logger = logging.getLogger(__name__)
 # ── 通用工具 ──────────────────────────────────────────────────────────
 
 
-def _step(tool: str, args: dict[str, Any], description: str = "") -> PlannedStep:
-    return PlannedStep(
+def _step(
+    tool: str,
+    args: dict[str, Any],
+    description: str = "",
+    depends_on: list[str] | None = None,
+) -> PlannedStep:
+    step = PlannedStep(
         step_id=generate_id("step"),
         tool_name=tool,
         tool_args=args,
         description=description,
     )
+    if depends_on is not None:
+        step["depends_on"] = depends_on
+    return step
 
 
 def _extract_int(text: str, default: int) -> int:
@@ -86,6 +95,7 @@ def _plan_qa(state: AgentState) -> list[PlannedStep]:
             "search_kb",
             {"course_id": course_id, "query": user_input, "top_k": 5},
             description="检索课程知识库",
+            depends_on=[],
         )
     ]
 
@@ -109,6 +119,7 @@ def _plan_exercise_gen(state: AgentState) -> list[PlannedStep]:
                 "knowledge_scope": knowledge_scope,
             },
             description=f"生成 {count} 道{('/'.join(types))}",
+            depends_on=[],
         )
     ]
 
@@ -123,7 +134,7 @@ def _plan_exercise_grade(state: AgentState) -> list[PlannedStep]:
         "answer": extra.get("answer", ""),
     }
     return [
-        _step("grade_answer", args, description="单题评分"),
+        _step("grade_answer", args, description="单题评分", depends_on=[]),
     ]
 
 
@@ -137,12 +148,15 @@ def _plan_lesson_plan(state: AgentState) -> list[PlannedStep]:
     duration = int(extra.get("duration_minutes") or _extract_int(user_input, 90))
     knowledge_points = extra.get("knowledge_points")
 
+    search = _step(
+        "search_kb",
+        {"course_id": course_id, "query": chapter, "top_k": 8},
+        description=f"检索章节 {chapter} 资料",
+        depends_on=[],
+    )
+    # 提纲与配套练习都只依赖章节检索（复用其片段），两者并发生成
     steps: list[PlannedStep] = [
-        _step(
-            "search_kb",
-            {"course_id": course_id, "query": chapter, "top_k": 8},
-            description=f"检索章节 {chapter} 资料",
-        ),
+        search,
         _step(
             "lesson_outline",
             {
@@ -152,6 +166,7 @@ def _plan_lesson_plan(state: AgentState) -> list[PlannedStep]:
                 "knowledge_points": knowledge_points,
             },
             description=f"生成 {duration} 分钟讲解提纲",
+            depends_on=[search["step_id"]],
         ),
     ]
     if extra.get("with_exercises", True):
@@ -166,6 +181,7 @@ def _plan_lesson_plan(state: AgentState) -> list[PlannedStep]:
                     "knowledge_scope": knowledge_points,
                 },
                 description="配套生成 8 道课后练习",
+                depends_on=[search["step_id"]],
             )
         )
     return steps
@@ -179,16 +195,18 @@ def _plan_recommend(state: AgentState) -> list[PlannedStep]:
     extra = state.get("extra_inputs") or {}
     count = int(extra.get("count") or 5)
 
+    mastery = _step(
+        "get_mastery",
+        {
+            "student_id": student_id,
+            "course_id": course_id,
+            "weak_threshold": float(extra.get("weak_threshold") or 0.6),
+        },
+        description="查询学生掌握度",
+        depends_on=[],
+    )
     return [
-        _step(
-            "get_mastery",
-            {
-                "student_id": student_id,
-                "course_id": course_id,
-                "weak_threshold": float(extra.get("weak_threshold") or 0.6),
-            },
-            description="查询学生掌握度",
-        ),
+        mastery,
         _step(
             "generate_exercise",
             {
@@ -200,6 +218,7 @@ def _plan_recommend(state: AgentState) -> list[PlannedStep]:
                 "knowledge_scope": None,
             },
             description=f"针对薄弱知识点生成 {count} 道练习",
+            depends_on=[mastery["step_id"]],
         ),
     ]
 
@@ -214,6 +233,30 @@ def _tool_catalog() -> str:
     return "\n".join(lines)
 
 
+def _parse_depends_on(raw: dict[str, Any], step_ids: list[str | None]) -> list[str] | None:
+    """把 LLM 给出的 1-based 步骤序号换成 step_id。
+
+    step_ids 按 LLM 原始序号排列（被丢弃的步骤为 None，对它的依赖直接忽略）；
+    缺省或序号非法时返回 None，即依赖上一步。
+    """
+
+    value = raw.get("depends_on")
+    if not isinstance(value, list):
+        return None
+    depends_on: list[str] = []
+    for item in value:
+        try:
+            position = int(item)
+        except (TypeError, ValueError):
+            return None
+        if not 1 <= position <= len(step_ids):
+            return None
+        step_id = step_ids[position - 1]
+        if step_id:
+            depends_on.append(step_id)
+    return depends_on
+
+
 def _plan_with_llm(state: AgentState) -> list[PlannedStep]:
     if not llm_available():
         return _plan_qa(state)
@@ -231,8 +274,11 @@ def _plan_with_llm(state: AgentState) -> list[PlannedStep]:
         f"上下文 course_id={course_id}; student_id={student_id};\n"
         f"用户请求：{user_input}\n\n"
         "返回 JSON 结构：\n"
-        '{"steps": [{"tool": "<工具名>", "args": {...}, "description": "<本步目的>"}, ...]}\n'
-        "要求：每个 args 必须可直接传给工具；step 数 1-5；前后步骤可隐式依赖（执行器会自动传值）。"
+        '{"steps": [{"tool": "<工具名>", "args": {...}, "description": "<本步目的>", '
+        '"depends_on": [<前置步骤序号>]}, ...]}\n'
+        "要求：每个 args 必须可直接传给工具；step 数 1-5；"
+        "depends_on 填本步依赖的前置步骤序号（从 1 开始，执行器会自动传值），"
+        "互不依赖的步骤填 [] 以便并行执行；不确定时省略，默认依赖上一步。"
     )
     payload = call_json(system_prompt, user_prompt)
     if not isinstance(payload, dict):
@@ -242,15 +288,22 @@ def _plan_with_llm(state: AgentState) -> list[PlannedStep]:
         return _plan_qa(state)
 
     steps: list[PlannedStep] = []
+    step_ids: list[str | None] = []
     for raw in raw_steps[:5]:
         if not isinstance(raw, dict):
+            step_ids.append(None)
             continue
         tool = str(raw.get("tool") or "").strip()
         if tool not in REGISTRY:
+            step_ids.append(None)
             continue
         args = raw.get("args") if isinstance(raw.get("args"), dict) else {}
         description = str(raw.get("description") or "")
-        steps.append(_step(tool, args, description=description))
+        step = _step(
+            tool, args, description=description, depends_on=_parse_depends_on(raw, step_ids)
+        )
+        steps.append(step)
+        step_ids.append(step["step_id"])
     return steps or _plan_qa(state)
 
 
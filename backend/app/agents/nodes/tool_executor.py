@@ -1,24 +1,185 @@
 """工具调用节点（agent-spec §3.3）。
 
 执行 plan[cursor] 一步，写入 step_results，cursor += 1。
-- 单步重试上限：2 次（含首次共 3 次尝试）
-- 单步超时：>15s 视为软超时（仅记录），DashScope 客户端层自带网络超时
+- 单步重试上限：2 次（含首次共 3 次尝试），重试前按指数退避 + 随机抖动等待
+- 单步截止时间：min(剩余运行预算, AGENT_STEP_TIMEOUT_SECONDS)，到点即判失败返回，
+  不再等待工具；同时置位取消事件，支持协作取消的工具（如批量出题）随后自行停止
+- 熔断：同一工具连续 AGENT_TOOL_BREAKER_FAILURES 个步骤因上游瞬时故障失败后熔断
+  AGENT_TOOL_BREAKER_COOLDOWN_SECONDS 秒，期间直接失败；冷却后放行一次试探调用。
+  每步最多计一次；业务错误（ValueError 等）与排队中即被取消的调用不计入，也不重试；
+  只有调用成功才重置计数 / 关闭熔断，参数校验失败的步骤不触碰熔断器
 - 步骤间依赖：自动从前一步结果回填关键字段（如 search_kb → 后续 knowledge_scope）
+- 检索复用：同一 run_id 的工具共享 RetrievalContext，提纲 / 出题复用前序 search_kb 片段
 """
 
 from __future__ import annotations
 
 import logging
+import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import Any
 
+from ... import metrics
+from ..run_context import get_retrieval_context
 from ..state import AgentState, PlannedStep, StepResult
 from ..tools import REGISTRY, get_tool, summarize_result
 
 logger = logging.getLogger(__name__)
 
 MAX_STEP_RETRIES = 2
-SOFT_TIMEOUT_MS = 15_000
+RETRY_BACKOFF_CAP_SECONDS = 4.0
+
+_TOOL_CALLS = metrics.counter(
+    "agent_tool_calls_total",
+    "Agent tool step executions by tool and outcome.",
+    labelnames=("tool", "outcome"),
+)
+_TOOL_SECONDS = metrics.histogram(
+    "agent_tool_duration_seconds",
+    "Agent tool step latency including retries.",
+    labelnames=("tool",),
+)
+_BREAKER_TRANSITIONS = metrics.counter(
+    "agent_tool_breaker_transitions_total",
+    "Agent tool circuit breaker state changes.",
+    labelnames=("tool", "state"),
+)
+
+# 工具调用在独立线程中执行，调用方只等待到截止时间；超时的调用被放弃（线程随工具返回而释放）
+_CALL_EXECUTOR: ThreadPoolExecutor | None = None
+_CALL_EXECUTOR_LOCK = threading.Lock()
+
+
+def _step_timeout_seconds() -> float:
+    return max(1.0, float(os.getenv("AGENT_STEP_TIMEOUT_SECONDS", "30")))
+
+
+def _retry_backoff_seconds() -> float:
+    return max(0.0, float(os.getenv("AGENT_RETRY_BACKOFF_SECONDS", "0.5")))
+
+
+def _call_workers() -> int:
+    return max(1, int(os.getenv("AGENT_TOOL_WORKERS", "32")))
+
+
+def _get_call_executor() -> ThreadPoolExecutor:
+    global _CALL_EXECUTOR
+    with _CALL_EXECUTOR_LOCK:
+        if _CALL_EXECUTOR is None:
+            _CALL_EXECUTOR = ThreadPoolExecutor(
+                max_workers=_call_workers(),
+                thread_name_prefix="agent-tool",
+            )
+        return _CALL_EXECUTOR
+
+
+def shutdown_tool_executor() -> None:
+    global _CALL_EXECUTOR
+    with _CALL_EXECUTOR_LOCK:
+        if _CALL_EXECUTOR is not None:
+            _CALL_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            _CALL_EXECUTOR = None
+
+
+def step_deadline(state: AgentState) -> float:
+    """本步截止时间（time.time() 时间戳）：不超过单步上限，也不超过整次运行的预算。"""
+
+    started = float(state.get("started_at") or time.time())
+    budget = float(state.get("time_budget_seconds") or 60.0)
+    return min(started + budget, time.time() + _step_timeout_seconds())
+
+
+def _backoff_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待：指数退避 + full jitter。"""
+
+    ceiling = min(RETRY_BACKOFF_CAP_SECONDS, _retry_backoff_seconds() * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling)
+
+
+# ── 熔断器 ────────────────────────────────────────────────────────────
+
+
+class _CircuitBreaker:
+    """按工具统计连续失败：closed → open（冷却期内直接拒绝）→ half_open（放行一次试探）。"""
+
+    def __init__(self, tool_name: str) -> None:
+        self.tool_name = tool_name
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @staticmethod
+    def _threshold() -> int:
+        return max(1, int(os.getenv("AGENT_TOOL_BREAKER_FAILURES", "5")))
+
+    @staticmethod
+    def _cooldown() -> float:
+        return max(0.0, float(os.getenv("AGENT_TOOL_BREAKER_COOLDOWN_SECONDS", "30")))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.time() - self._opened_at < self._cooldown():
+                return False
+            self._probing = True
+        _BREAKER_TRANSITIONS.inc(tool=self.tool_name, state="half_open")
+        return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            was_open = self._opened_at is not None
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+        if was_open:
+            _BREAKER_TRANSITIONS.inc(tool=self.tool_name, state="closed")
+
+    def release_probe(self) -> None:
+        """试探调用未真正到达上游（如排队超时）：不改变状态，允许下一次试探。"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if not self._probing and (
+                self._opened_at is not None or self._failures < self._threshold()
+            ):
+                return
+            self._opened_at = time.time()
+            self._probing = False
+        logger.warning("tool %s circuit opened after %s failures", self.tool_name, self._failures)
+        _BREAKER_TRANSITIONS.inc(tool=self.tool_name, state="open")
+
+
+_BREAKERS: dict[str, _CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def _is_transient(exc: Exception) -> bool:
+    """是否为值得重试、计入熔断的上游瞬时故障；业务 / 参数错误返回 False。"""
+
+    if isinstance(exc, (ValueError, LookupError)):
+        return False
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int) and status < 500 and status != 429:
+        return False
+    return True
+
+
+def _get_breaker(tool_name: str) -> _CircuitBreaker:
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(tool_name)
+        if breaker is None:
+            breaker = _CircuitBreaker(tool_name)
+            _BREAKERS[tool_name] = breaker
+        return breaker
 
 
 # ── 步骤间依赖回填 ────────────────────────────────────────────────────
@@ -66,66 +227,133 @@ def _backfill_args(state: AgentState, step: PlannedStep) -> PlannedStep:
     return step
 
 
-# ── 节点入口 ──────────────────────────────────────────────────────────
+# ── 单步执行 ──────────────────────────────────────────────────────────
 
 
-def tool_executor_node(state: AgentState) -> dict:
-    plan = list(state.get("plan") or [])
-    cursor = int(state.get("cursor") or 0)
-    if cursor >= len(plan):
-        return {}
+def execute_step(
+    step: PlannedStep,
+    run_id: str | None = None,
+    deadline: float | None = None,
+) -> StepResult:
+    """执行一个已回填参数的步骤（含重试），返回 StepResult。
+
+    ``deadline`` 为 time.time() 时间戳，缺省为当前时间加单步上限；到点即返回失败。
+    不读写 AgentState，可在线程池中并发调用（见 dag_executor）。
+    """
 
-    step = _backfill_args(state, dict(plan[cursor]))
-    plan[cursor] = step
     tool_name = step.get("tool_name") or ""
     tool = get_tool(tool_name)
+    if deadline is None:
+        deadline = time.time() + _step_timeout_seconds()
 
     started = time.time()
     retries = 0
     success = False
     result: Any = None
     error: str | None = None
-    summary = ""
+    outcome = "error"
+    args = step.get("tool_args") or {}
 
     if not tool:
         error = f"未注册的工具：{tool_name}"
-        summary = error
     else:
-        last_exc: Exception | None = None
-        while retries <= MAX_STEP_RETRIES:
-            try:
-                result = tool.call(step.get("tool_args") or {})
-                success = True
-                summary = summarize_result(tool_name, result)
-                break
-            except Exception as exc:  # noqa: BLE001 — 工具异常向上聚合
-                last_exc = exc
-                retries += 1
-                logger.warning(
-                    "tool %s failed (attempt=%s): %s", tool_name, retries, exc
+        breaker = _get_breaker(tool_name)
+        retrieval_context = get_retrieval_context(run_id) if run_id else None
+        cancel_event = threading.Event()
+        # 熔断按步骤计数：整步（含重试）因上游瞬时故障失败才记一次
+        upstream_failure = False
+        try:
+            tool.validate_args(args)
+        except ValueError as exc:
+            # 参数错误：工具未被调用，不重试，也不改动熔断状态
+            error = str(exc)
+        if error is not None:
+            pass
+        elif not breaker.allow():
+            error = f"CircuitOpen: 工具 {tool_name} 熔断中，暂停调用"
+            outcome = "circuit_open"
+        else:
+            while error is None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    error = f"TimeoutError: 工具 {tool_name} 已超过本步截止时间"
+                    outcome = "timeout"
+                    break
+                future = _get_call_executor().submit(
+                    tool.call, args, retrieval_context, cancel_event
                 )
-        if not success and last_exc is not None:
-            error = f"{type(last_exc).__name__}: {last_exc}"
-            summary = error[:120]
+                try:
+                    result = future.result(timeout=remaining)
+                    success = True
+                    outcome = "ok"
+                    break
+                except FutureTimeoutError:
+                    # 线程无法强杀：取消排队中的调用，并通知支持协作取消的工具尽快停止；
+                    # 仍在排队（取消成功）说明工具根本没被调用，不算上游故障
+                    upstream_failure = not future.cancel()
+                    cancel_event.set()
+                    error = f"TimeoutError: 工具 {tool_name} 超过截止时间（{remaining:.1f}s）"
+                    outcome = "timeout"
+                    break
+                except Exception as exc:  # noqa: BLE001 — 工具异常向上聚合
+                    retries += 1
+                    logger.warning(
+                        "tool %s failed (attempt=%s): %s", tool_name, retries, exc
+                    )
+                    if not _is_transient(exc):
+                        # 业务错误（如课程为空）重试无益，上游本身正常
+                        error = f"{type(exc).__name__}: {exc}"
+                        break
+                    upstream_failure = True
+                    if retries > MAX_STEP_RETRIES:
+                        error = f"{type(exc).__name__}: {exc}"
+                        break
+                    delay = _backoff_delay(retries)
+                    if time.time() + delay >= deadline:
+                        error = f"{type(exc).__name__}: {exc}"
+                        break
+                    time.sleep(delay)
+            # 只有真正调用成功才关闭 / 重置熔断；业务错误与排队超时不改变状态
+            if success:
+                breaker.record_success()
+            elif upstream_failure:
+                breaker.record_failure()
+            else:
+                breaker.release_probe()
 
+    summary = summarize_result(tool_name, result) if success else (error or "")[:120]
     duration_ms = int((time.time() - started) * 1000)
-    if duration_ms > SOFT_TIMEOUT_MS:
-        logger.warning(
-            "tool %s soft timeout: %sms (>%sms)", tool_name, duration_ms, SOFT_TIMEOUT_MS
-        )
+    _TOOL_CALLS.inc(tool=tool_name, outcome=outcome)
+    _TOOL_SECONDS.observe(duration_ms / 1000, tool=tool_name)
+    if outcome == "timeout":
+        logger.warning("tool %s timed out after %sms", tool_name, duration_ms)
 
-    step_result: StepResult = {
+    return {
         "step_id": step.get("step_id", ""),
         "tool_name": tool_name,
-        "tool_args": step.get("tool_args") or {},
+        "tool_args": args,
         "success": success,
         "result": result,
         "result_summary": summary,
         "error": error,
-        "retries": max(0, retries - (0 if success else 1)) if success else retries,
+        "retries": retries,
         "duration_ms": duration_ms,
     }
 
+
+# ── 节点入口 ──────────────────────────────────────────────────────────
+
+
+def tool_executor_node(state: AgentState) -> dict:
+    plan = list(state.get("plan") or [])
+    cursor = int(state.get("cursor") or 0)
+    if cursor >= len(plan):
+        return {}
+
+    step = _backfill_args(state, dict(plan[cursor]))
+    plan[cursor] = step
+    step_result = execute_step(step, state.get("run_id"), step_deadline(state))
+
     new_results = list(state.get("step_results") or [])
     new_results.append(step_result)
 
@@ -0,0 +1,41 @@
+"""单次 Agent 运行的共享上下文（按 run_id 登记）。
+
+LangGraph state 只放可序列化的数据；检索片段、执行中的步骤等运行期对象放在这里，
+由 tool_executor / dag_executor 按 run_id 取用，runner 在运行结束时释放。
+"""
+
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future
+from typing import Any
+
+from ..services.retrieval_context import RetrievalContext
+
+_RETRIEVAL_CONTEXTS: dict[str, RetrievalContext] = {}
+# run_id -> {step_id: (已回填参数的 step, Future)}，跨 dag_executor 多次调用保留
+_RUNNING_STEPS: dict[str, dict[str, tuple[dict[str, Any], Future]]] = {}
+_CONTEXT_LOCK = threading.Lock()
+
+
+def get_retrieval_context(run_id: str) -> RetrievalContext:
+    with _CONTEXT_LOCK:
+        context = _RETRIEVAL_CONTEXTS.get(run_id)
+        if context is None:
+            context = RetrievalContext()
+            _RETRIEVAL_CONTEXTS[run_id] = context
+        return context
+
+
+def running_steps(run_id: str) -> dict[str, tuple[dict[str, Any], Future]]:
+    with _CONTEXT_LOCK:
+        return _RUNNING_STEPS.setdefault(run_id, {})
+
+
+def release_run_context(run_id: str) -> None:
+    with _CONTEXT_LOCK:
+        _RETRIEVAL_CONTEXTS.pop(run_id, None)
+        running = _RUNNING_STEPS.pop(run_id, None) or {}
+    # 超出时间预算时仍在执行的步骤：尚未开始的直接取消，已开始的结果丢弃
+    for _, future in running.values():
+        future.cancel()
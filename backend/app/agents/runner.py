@@ -12,12 +12,27 @@ import logging
 import time
 from typing import Any, Iterable
 
+from .. import metrics
+from ..tracing import RequestTrace
 from ..utils import generate_id
 from .graph import get_agent_graph
+from .run_context import release_run_context
 from .state import AgentState, new_state
 
 logger = logging.getLogger(__name__)
 
+_AGENT_RUNS = metrics.counter(
+    "agent_runs_total",
+    "Agent runs by entry point, intent and outcome.",
+    labelnames=("entry", "intent", "outcome"),
+)
+
+
+def _run_outcome(final_state: AgentState | None, failed: bool = False) -> str:
+    if failed:
+        return "error"
+    return "degraded" if (final_state or {}).get("degraded") else "ok"
+
 
 # ── 工具：把 state 关键信息序列化为 JSON 友好结构 ──
 
@@ -39,6 +54,24 @@ def _format_sse(event: str, data: dict[str, Any]) -> str:
     return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
+def _infer_stage(previous: AgentState | None, current: AgentState) -> str | None:
+    """根据相邻两次 state 快照的差异推断刚完成的节点（用于阶段计时）。"""
+
+    if previous is None:
+        return None
+    if current.get("answer") and not previous.get("answer"):
+        return "aggregate"
+    if len(current.get("reflect_history") or []) != len(previous.get("reflect_history") or []):
+        return "reflect"
+    if current.get("plan_attempts") != previous.get("plan_attempts"):
+        return "plan"
+    if len(current.get("step_results") or []) != len(previous.get("step_results") or []):
+        return "tools"
+    if current.get("intent") != previous.get("intent"):
+        return "intent"
+    return None
+
+
 # ── 同步入口 ──────────────────────────────────────────────────────────
 
 
@@ -72,6 +105,7 @@ def run_agent(
         final_state: AgentState = graph.invoke(initial)
     except Exception as exc:
         logger.exception("Agent run failed: %s", exc)
+        _AGENT_RUNS.inc(entry="run", intent=str(initial.get("intent")), outcome="error")
         return {
             "run_id": rid,
             "intent": initial.get("intent"),
@@ -86,10 +120,15 @@ def run_agent(
             "error": str(exc),
             "duration_ms": int((time.time() - started) * 1000),
         }
+    finally:
+        release_run_context(rid)
 
     answer = final_state.get("answer") or {}
     if not isinstance(answer, dict):
         answer = {"answer": str(answer)}
+    _AGENT_RUNS.inc(
+        entry="run", intent=str(final_state.get("intent")), outcome=_run_outcome(final_state),
+    )
 
     return {
         "run_id": rid,
@@ -126,7 +165,7 @@ def stream_agent_events(
     - plan：planner 输出步骤列表
     - tool_start / tool_end：每步工具调用
     - reflect：反思结果
-    - done：最终聚合输出
+    - done：最终聚合输出（timings 字段为各阶段耗时）
     """
 
     graph = get_agent_graph()
@@ -144,6 +183,8 @@ def stream_agent_events(
     )
 
     yield _format_sse("run_start", {"run_id": rid})
+    trace = RequestTrace("agent_stream")
+    last_tick = time.perf_counter()
 
     last_step_count = 0
     last_intent_emitted = False
@@ -154,6 +195,11 @@ def stream_agent_events(
     try:
         for event in graph.stream(initial, stream_mode="values"):
             current: AgentState = event  # stream_mode=values 时 event 即为最新 state
+            tick = time.perf_counter()
+            stage = _infer_stage(final_state, current)
+            if stage:
+                trace.add(stage, tick - last_tick)
+            last_tick = tick
             final_state = current
 
             if not last_intent_emitted and current.get("intent") and current.get("intent") != "unknown":
@@ -164,6 +210,7 @@ def stream_agent_events(
                         "skill": current.get("skill"),
                     },
                 )
+                trace.mark("first_event")
                 last_intent_emitted = True
 
             plan = current.get("plan") or []
@@ -210,6 +257,9 @@ def stream_agent_events(
                 last_reflect_count += 1
     except Exception as exc:
         logger.exception("Agent stream failed: %s", exc)
+        _AGENT_RUNS.inc(
+            entry="stream", intent=str((final_state or {}).get("intent")), outcome="error",
+        )
         yield _format_sse(
             "done",
             {
@@ -218,13 +268,21 @@ def stream_agent_events(
                 "error": str(exc),
                 "degraded": True,
                 "duration_ms": int((time.time() - started) * 1000),
+                "timings": trace.finish(),
             },
         )
         return
+    finally:
+        release_run_context(rid)
 
     answer = (final_state or {}).get("answer") or {}
     if not isinstance(answer, dict):
         answer = {"answer": str(answer)}
+    _AGENT_RUNS.inc(
+        entry="stream",
+        intent=str((final_state or {}).get("intent")),
+        outcome=_run_outcome(final_state),
+    )
 
     yield _format_sse(
         "done",
@@ -235,5 +293,6 @@ def stream_agent_events(
             "answer": answer,
             "degraded": bool((final_state or {}).get("degraded")),
             "duration_ms": int((time.time() - started) * 1000),
+            "timings": trace.finish(),
         },
     )
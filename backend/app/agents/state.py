@@ -15,6 +15,8 @@ class PlannedStep(TypedDict, total=False):
     tool_name: str
     tool_args: dict[str, Any]
     description: str  # 该步骤目的的简短说明（可选，便于流式展示与调试）
+    # 前置步骤的 step_id；缺省表示依赖前一步（顺序执行），[] 表示无依赖可立即执行
+    depends_on: list[str]
 
 
 class StepResult(TypedDict, total=False):
@@ -63,7 +65,7 @@ class AgentState(TypedDict, total=False):
     intent: str
     skill: str | None
     plan: list[PlannedStep]
-    cursor: int  # 下一个待执行 step 的下标
+    cursor: int  # 已完成的 step 数（顺序执行时即下一个待执行 step 的下标）
     step_results: list[StepResult]
     reflect_history: list[ReflectVerdict]
     plan_attempts: int  # planner 重试计数（上限 1）
@@ -6,6 +6,9 @@
 - input_schema：Pydantic 模型，参数校验
 - runner：实际执行函数（接受 dict，返回 dict）
 - summary_keys：从结果中抽取展示字段，用于 step.result_summary
+- uses_retrieval_context：runner 额外接收本次运行的 RetrievalContext，
+  复用前序 search_kb 的片段，只对未覆盖的知识点补充检索
+- cancellable：runner 额外接收 cancel_event，步骤超时后被置位，runner 应尽快停止
 
 工具实现仅做"薄包装"：调用 backend/app/services/* 现有函数，
 不重写业务，业务异常向上抛出由 tool_executor 捕获。
@@ -14,6 +17,7 @@
 from __future__ import annotations
 
 import logging
+import threading
 from dataclasses import dataclass, field
 from typing import Any, Callable
 
@@ -23,6 +27,7 @@ from ...services import exercises as exercises_service
 from ...services import knowledge_base as kb_service
 from ...services import knowledge_tracking as kt_service
 from ...services import lesson_plans as lesson_service
+from ...services.retrieval_context import RetrievalContext
 
 logger = logging.getLogger(__name__)
 
@@ -76,15 +81,18 @@ class WebSearchArgs(BaseModel):
 # ── Tool runners ──────────────────────────────────────────────────────
 
 
-def _run_search_kb(args: dict[str, Any]) -> dict[str, Any]:
+def _run_search_kb(
+    args: dict[str, Any], retrieval_context: RetrievalContext | None = None,
+) -> dict[str, Any]:
     parsed = SearchKbArgs(**args)
-    results = kb_service.search_documents(
-        parsed.course_id, parsed.query, parsed.top_k, parsed.filters,
-    )
+    search = retrieval_context.search if retrieval_context else kb_service.search_documents
+    results = search(parsed.course_id, parsed.query, parsed.top_k, parsed.filters)
     return {"results": results, "count": len(results)}
 
 
-def _run_lesson_outline(args: dict[str, Any]) -> dict[str, Any]:
+def _run_lesson_outline(
+    args: dict[str, Any], retrieval_context: RetrievalContext | None = None,
+) -> dict[str, Any]:
     parsed = LessonOutlineArgs(**args)
     outline = lesson_service.generate_lesson_outline(
         course_id=parsed.course_id,
@@ -93,11 +101,16 @@ def _run_lesson_outline(args: dict[str, Any]) -> dict[str, Any]:
         knowledge_scope=parsed.knowledge_points,
         audience_level=parsed.audience_level,
         include_practice=parsed.include_practice,
+        retrieval_context=retrieval_context,
     )
     return outline
 
 
-def _run_generate_exercise(args: dict[str, Any]) -> dict[str, Any]:
+def _run_generate_exercise(
+    args: dict[str, Any],
+    retrieval_context: RetrievalContext | None = None,
+    cancel_event: threading.Event | None = None,
+) -> dict[str, Any]:
     parsed = GenerateExerciseArgs(**args)
     generated = exercises_service.generate_exercises(
         course_id=parsed.course_id,
@@ -105,6 +118,8 @@ def _run_generate_exercise(args: dict[str, Any]) -> dict[str, Any]:
         types=parsed.types,
         difficulty=parsed.difficulty,
         knowledge_scope=parsed.knowledge_scope,
+        retrieval_context=retrieval_context,
+        cancel_event=cancel_event,
     )
     return {"generated": generated, "count": len(generated)}
 
@@ -197,9 +212,11 @@ class ToolSpec:
     name: str
     description: str
     input_schema: type[BaseModel]
-    runner: Callable[[dict[str, Any]], dict[str, Any]]
+    runner: Callable[..., dict[str, Any]]
     summarizer: Callable[[dict[str, Any]], str]
     output_required_fields: list[str] = field(default_factory=list)
+    uses_retrieval_context: bool = False
+    cancellable: bool = False
 
     def validate_args(self, args: dict[str, Any]) -> dict[str, Any]:
         try:
@@ -207,9 +224,17 @@ class ToolSpec:
         except ValidationError as exc:
             raise ValueError(f"工具 {self.name} 参数校验失败：{exc}") from exc
 
-    def call(self, args: dict[str, Any]) -> dict[str, Any]:
+    def call(
+        self,
+        args: dict[str, Any],
+        retrieval_context: RetrievalContext | None = None,
+        cancel_event: threading.Event | None = None,
+    ) -> dict[str, Any]:
         validated = self.validate_args(args)
-        return self.runner(validated)
+        kwargs: dict[str, Any] = {"cancel_event": cancel_event} if self.cancellable else {}
+        if self.uses_retrieval_context:
+            return self.runner(validated, retrieval_context, **kwargs)
+        return self.runner(validated, **kwargs)
 
     def summary(self, result: Any) -> str:
         try:
@@ -231,6 +256,7 @@ REGISTRY: dict[str, ToolSpec] = {
         runner=_run_search_kb,
         summarizer=_summarize_search_kb,
         output_required_fields=["results", "count"],
+        uses_retrieval_context=True,
     ),
     "lesson_outline": ToolSpec(
         name="lesson_outline",
@@ -242,6 +268,7 @@ REGISTRY: dict[str, ToolSpec] = {
         runner=_run_lesson_outline,
         summarizer=_summarize_lesson_outline,
         output_required_fields=["objectives", "key_points", "teaching_flow"],
+        uses_retrieval_context=True,
     ),
     "generate_exercise": ToolSpec(
         name="generate_exercise",
@@ -253,6 +280,8 @@ REGISTRY: dict[str, ToolSpec] = {
         runner=_run_generate_exercise,
         summarizer=_summarize_generate_exercise,
         output_required_fields=["generated"],
+        uses_retrieval_context=True,
+        cancellable=True,
     ),
     "grade_answer": ToolSpec(
         name="grade_answer",
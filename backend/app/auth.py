@@ -1,14 +1,71 @@
+import asyncio
 import hashlib
+import hmac
+import multiprocessing
+import os
 import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
 
 from fastapi import Header, HTTPException
 
+from . import metrics
 from .db import get_connection
 from .utils import generate_id, now_iso
 
 
 ALLOWED_ROLES = {"admin", "teacher", "student"}
+MAX_CACHED_TOKENS = 10_000
+MAX_TOKEN_CACHE_TTL_SECONDS = 30.0
+SESSION_PURGE_INTERVAL_SECONDS = 600
+
+# token -> (user, cached_until)；cached_until 不超过会话本身的过期时间。
+# 缓存是进程内的：invalidate_token / invalidate_user（注销、改角色）只清当前进程，
+# 多 worker 部署时其他进程里的旧 token / 旧角色最多再有效 AUTH_TOKEN_CACHE_TTL 秒，
+# 因此 TTL 默认很短，且上限为 MAX_TOKEN_CACHE_TTL_SECONDS；设为 0 可关闭缓存。
+_TOKEN_CACHE: dict[str, tuple[dict, float]] = {}
+_TOKEN_CACHE_LOCK = threading.Lock()
+_LAST_SESSION_PURGE = 0.0
+
+
+_HASH_EXECUTOR: ProcessPoolExecutor | None = None
+_HASH_EXECUTOR_LOCK = threading.Lock()
+_HASH_PENDING = 0
+_HASH_PENDING_LOCK = threading.Lock()
+
+_HASH_QUEUE_DEPTH = metrics.gauge(
+    "auth_password_hash_queue_depth",
+    "Password hashing jobs submitted and not yet finished (running + queued).",
+)
+_HASH_REJECTED = metrics.counter(
+    "auth_password_hash_rejected_total",
+    "Password hashing jobs rejected because the queue was full.",
+)
+_HASH_SECONDS = metrics.histogram(
+    "auth_password_hash_seconds",
+    "Wall time of one password hash including queueing.",
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+def _hash_workers() -> int:
+    default = min(4, os.cpu_count() or 1)
+    return max(0, int(os.getenv("AUTH_HASH_WORKERS", str(default))))
+
+
+def _hash_max_pending() -> int:
+    return max(1, int(os.getenv("AUTH_HASH_MAX_PENDING", "256")))
+
+
+def _session_ttl_seconds() -> int:
+    return int(float(os.getenv("AUTH_SESSION_TTL_HOURS", "168")) * 3600)
+
+
+def _token_cache_ttl_seconds() -> float:
+    ttl = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "5"))
+    return min(ttl, MAX_TOKEN_CACHE_TTL_SECONDS)
 
 
 def hash_password(password: str, salt: str) -> str:
@@ -26,37 +83,183 @@ def create_password_hash(password: str) -> tuple[str, str]:
     return hash_password(password, salt), salt
 
 
+def _get_hash_executor() -> ProcessPoolExecutor | None:
+    global _HASH_EXECUTOR
+    workers = _hash_workers()
+    if workers == 0:
+        return None
+    with _HASH_EXECUTOR_LOCK:
+        if _HASH_EXECUTOR is None:
+            # spawn：避免在已有线程（uvicorn / 连接池）的进程里 fork
+            _HASH_EXECUTOR = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _HASH_EXECUTOR
+
+
+def shutdown_hash_executor() -> None:
+    global _HASH_EXECUTOR
+    with _HASH_EXECUTOR_LOCK:
+        if _HASH_EXECUTOR is not None:
+            _HASH_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            _HASH_EXECUTOR = None
+
+
+async def hash_password_async(password: str, salt: str) -> str:
+    """Run PBKDF2 off the event loop and request threadpool.
+
+    Jobs go to a process pool of ``AUTH_HASH_WORKERS`` processes. Set it to 0 to
+    use a thread instead. When ``AUTH_HASH_MAX_PENDING`` jobs are already
+    waiting, the call fails fast with 503 so bursts do not queue without bound.
+    """
+    global _HASH_PENDING
+    with _HASH_PENDING_LOCK:
+        if _HASH_PENDING >= _hash_max_pending():
+            _HASH_REJECTED.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Too many concurrent logins, please retry",
+                headers={"Retry-After": "1"},
+            )
+        _HASH_PENDING += 1
+        _HASH_QUEUE_DEPTH.set(_HASH_PENDING)
+    started = time.perf_counter()
+    try:
+        executor = _get_hash_executor()
+        if executor is None:
+            return await asyncio.to_thread(hash_password, password, salt)
+        return await asyncio.wrap_future(executor.submit(hash_password, password, salt))
+    finally:
+        _HASH_SECONDS.observe(time.perf_counter() - started)
+        with _HASH_PENDING_LOCK:
+            _HASH_PENDING -= 1
+            _HASH_QUEUE_DEPTH.set(_HASH_PENDING)
+
+
+async def create_password_hash_async(password: str) -> tuple[str, str]:
+    salt = secrets.token_hex(16)
+    return await hash_password_async(password, salt), salt
+
+
+async def verify_password_async(password: str, salt: str, expected_hash: str) -> bool:
+    actual = await hash_password_async(password, salt)
+    return hmac.compare_digest(actual, expected_hash)
+
+
 def create_session(user_id: str) -> str:
     token = generate_id("token")
     conn = get_connection()
     conn.execute(
-        "INSERT INTO sessions (token, user_id, created_at) VALUES (?, ?, ?)",
-        (token, user_id, now_iso()),
+        "INSERT INTO sessions (token, user_id, created_at, expires_at) VALUES (?, ?, ?, ?)",
+        (token, user_id, now_iso(), int(time.time()) + _session_ttl_seconds()),
     )
     conn.commit()
     conn.close()
+    _maybe_purge_expired_sessions()
     return token
 
 
+def delete_session(token: str) -> bool:
+    invalidate_token(token)
+    conn = get_connection()
+    cursor = conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+def purge_expired_sessions() -> int:
+    conn = get_connection()
+    cursor = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (int(time.time()),))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount
+
+
+def _maybe_purge_expired_sessions() -> None:
+    """登录时顺带清理过期会话，最多每 SESSION_PURGE_INTERVAL_SECONDS 执行一次。"""
+    global _LAST_SESSION_PURGE
+    now = time.time()
+    if now - _LAST_SESSION_PURGE < SESSION_PURGE_INTERVAL_SECONDS:
+        return
+    _LAST_SESSION_PURGE = now
+    purge_expired_sessions()
+
+
+def invalidate_token(token: str) -> None:
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE.pop(token, None)
+
+
+def invalidate_user(user_id: str) -> None:
+    """Drop every cached token of ``user_id`` (e.g. after a role change).
+
+    Only affects this process; other workers see the change once their cache
+    entry expires (at most ``AUTH_TOKEN_CACHE_TTL`` seconds).
+    """
+    with _TOKEN_CACHE_LOCK:
+        stale = [token for token, (user, _) in _TOKEN_CACHE.items() if user.get("id") == user_id]
+        for token in stale:
+            _TOKEN_CACHE.pop(token, None)
+
+
+def _get_cached_user(token: str) -> Optional[dict]:
+    with _TOKEN_CACHE_LOCK:
+        entry = _TOKEN_CACHE.get(token)
+        if entry and entry[1] > time.time():
+            return dict(entry[0])
+        if entry:
+            _TOKEN_CACHE.pop(token, None)
+    return None
+
+
+def _cache_user(token: str, user: dict, session_expires_at: int | None) -> None:
+    ttl = _token_cache_ttl_seconds()
+    if ttl <= 0:
+        return
+    cached_until = time.time() + ttl
+    if session_expires_at is not None:
+        cached_until = min(cached_until, float(session_expires_at))
+    with _TOKEN_CACHE_LOCK:
+        if len(_TOKEN_CACHE) >= MAX_CACHED_TOKENS:
+            _TOKEN_CACHE.pop(next(iter(_TOKEN_CACHE)))
+        _TOKEN_CACHE[token] = (dict(user), cached_until)
+
+
 def get_user_by_token(token: str) -> Optional[dict]:
+    cached = _get_cached_user(token)
+    metrics.record_cache("auth_token", cached is not None)
+    if cached is not None:
+        return cached
     conn = get_connection()
     row = conn.execute(
         """
-        SELECT users.id, users.name, users.email, users.role, users.created_at
+        SELECT users.id, users.name, users.email, users.role, users.created_at,
+               sessions.expires_at
         FROM sessions
         JOIN users ON users.id = sessions.user_id
-        WHERE sessions.token = ?
+        WHERE sessions.token = ? AND (sessions.expires_at IS NULL OR sessions.expires_at > ?)
         """,
-        (token,),
+        (token, int(time.time())),
     ).fetchone()
     conn.close()
-    return dict(row) if row else None
+    if not row:
+        return None
+    user = dict(row)
+    expires_at = user.pop("expires_at")
+    _cache_user(token, user, expires_at)
+    return user
 
 
-def require_user(authorization: str | None = Header(default=None)) -> dict:
+def extract_bearer_token(authorization: str | None) -> str:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing auth token")
-    token = authorization.split(" ", 1)[1].strip()
+    return authorization.split(" ", 1)[1].strip()
+
+
+def require_user(authorization: str | None = Header(default=None)) -> dict:
+    token = extract_bearer_token(authorization)
     user = get_user_by_token(token)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid auth token")
@@ -1,20 +1,198 @@
+"""SQLite 访问层：进程内连接池 + WAL。
+
+``get_connection()`` 从池中借出连接，调用方照旧 ``conn.close()``——对池化连接而言
+``close`` 只是归还（未提交的事务会先回滚）。连接在线程间传递但同一时刻只被一个
+线程使用，因此以 ``check_same_thread=False`` 打开。每个连接保留自己的预编译语句
+缓存（``cached_statements``），复用连接即复用已准备好的语句。
+"""
+
+import json
+import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Callable, Iterator, Mapping, Sequence
+
+from . import metrics
+from .utils import now_iso
+
+_logger = logging.getLogger(__name__)
 
 
 DB_PATH = Path(__file__).resolve().parent.parent / "app.db"
+_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+_CONNECTIONS_OPENED = metrics.counter(
+    "sqlite_connections_opened_total",
+    "Physical SQLite connections opened by the pool.",
+)
+_POOL_IDLE = metrics.gauge("sqlite_pool_idle_connections", "Idle connections held by the pool.")
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose ``close()`` returns it to the owning pool."""
+
+    pool: "ConnectionPool | None" = None
+    checked_out = False
+
+    def close(self) -> None:
+        pool = self.pool
+        if pool is None:
+            super().close()
+            return
+        if not self.checked_out:
+            # 重复 close()：连接已归还，不能再关闭池里的空闲连接
+            return
+        pool.release(self)
+
+    def close_physical(self) -> None:
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+    def __init__(self, path: Path, max_idle: int, busy_timeout_ms: int, synchronous: str) -> None:
+        self.path = path
+        self.max_idle = max_idle
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+        self._idle: "queue.LifoQueue[PooledConnection]" = queue.LifoQueue()
+        self._closed = False
+
+    def _open(self) -> PooledConnection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=256,
+            factory=PooledConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        # WAL：读写互不阻塞；NORMAL 在 WAL 下仍保证一致性，只放弃掉电时最后几个事务的持久性
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.pool = self
+        conn.checked_out = True
+        _CONNECTIONS_OPENED.inc()
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+        _POOL_IDLE.dec()
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close_physical()
+            return
+        if self._closed or self._idle.qsize() >= self.max_idle:
+            conn.close_physical()
+            return
+        self._idle.put(conn)
+        _POOL_IDLE.inc()
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            _POOL_IDLE.dec()
+            conn.close_physical()
+
+
+_POOL: ConnectionPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def _synchronous_mode() -> str:
+    value = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").strip().upper()
+    return value if value in _SYNCHRONOUS_MODES else "NORMAL"
+
+
+def _get_pool() -> ConnectionPool:
+    global _POOL
+    pool = _POOL
+    if pool is not None and pool.path == DB_PATH:
+        return pool
+    with _POOL_LOCK:
+        if _POOL is None or _POOL.path != DB_PATH:
+            if _POOL is not None:
+                _POOL.close()
+            _POOL = ConnectionPool(
+                DB_PATH,
+                max_idle=max(1, int(os.getenv("SQLITE_POOL_SIZE", "8"))),
+                busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+                synchronous=_synchronous_mode(),
+            )
+        return _POOL
 
 
 def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return _get_pool().acquire()
 
 
-def init_db() -> None:
+@contextmanager
+def connection() -> Iterator[sqlite3.Connection]:
+    """Borrow a pooled connection; uncommitted work is rolled back on return."""
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction(immediate: bool = False) -> Iterator[sqlite3.Connection]:
+    """Borrow a pooled connection and commit on success / roll back on error.
+
+    ``immediate=True`` takes the write lock up front (BEGIN IMMEDIATE), for
+    read-then-write sequences that must not interleave with another writer.
+    """
+    conn = get_connection()
+    try:
+        if immediate:
+            conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def close_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.close()
+            _POOL = None
+
+
+# ── Schema migrations ─────────────────────────────────────────────────
+#
+# 每个迁移只执行一次，版本号记录在 schema_migrations 中。新增表/列/索引时在
+# _MIGRATIONS 末尾追加一项，不要修改已发布的迁移。
+
+
+def _migration_0001_base_tables(conn: sqlite3.Connection) -> None:
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS users (
             id TEXT PRIMARY KEY,
@@ -27,7 +205,7 @@ def init_db() -> None:
         )
         """
     )
-    cursor.execute(
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS courses (
             id TEXT PRIMARY KEY,
@@ -39,7 +217,7 @@ def init_db() -> None:
         )
         """
     )
-    cursor.execute(
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS sessions (
             token TEXT PRIMARY KEY,
@@ -49,7 +227,7 @@ def init_db() -> None:
         )
         """
     )
-    cursor.execute(
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS knowledge_points (
             id TEXT PRIMARY KEY,
@@ -60,7 +238,7 @@ def init_db() -> None:
         )
         """
     )
-    cursor.execute(
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS conversations (
             id TEXT PRIMARY KEY,
@@ -74,7 +252,7 @@ def init_db() -> None:
         )
         """
     )
-    cursor.execute(
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS messages (
             id TEXT PRIMARY KEY,
@@ -87,7 +265,7 @@ def init_db() -> None:
         )
         """
     )
-    cursor.execute(
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS knowledge_mastery (
             id TEXT PRIMARY KEY,
@@ -103,7 +281,7 @@ def init_db() -> None:
         )
         """
     )
-    cursor.execute(
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS exercise_attempts (
             id TEXT PRIMARY KEY,
@@ -118,5 +296,365 @@ def init_db() -> None:
         )
         """
     )
-    conn.commit()
-    conn.close()
+
+
+def _migration_0002_query_indexes(conn: sqlite3.Connection) -> None:
+    # 对应 memory_store / knowledge_tracking / courses 中的热点查询，索引列顺序与
+    # WHERE 等值条件 + ORDER BY 一致，使排序可直接走索引
+    # 会话 / 消息分页按 (时间, id) 做 keyset，索引带上 id，时间戳并列时也无需临时排序
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation_created_id "
+        "ON messages (conversation_id, created_at, id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_course_updated_id "
+        "ON conversations (user_id, course_id, updated_at, id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_updated_id "
+        "ON conversations (user_id, updated_at, id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_exercise_attempts_student_course_created "
+        "ON exercise_attempts (student_id, course_id, created_at)"
+    )
+    # 覆盖索引：SELECT point ... WHERE course_id = ? ORDER BY created_at 无需回表
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_knowledge_points_course_created "
+        "ON knowledge_points (course_id, created_at, point)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)")
+
+
+def _migration_0003_session_expiry(conn: sqlite3.Connection) -> None:
+    # 过期时间存 Unix 秒，便于范围比较与清理；存量会话从迁移时刻起按默认 TTL 计算
+    conn.execute("ALTER TABLE sessions ADD COLUMN expires_at INTEGER")
+    ttl_seconds = int(float(os.getenv("AUTH_SESSION_TTL_HOURS", "168")) * 3600)
+    conn.execute(
+        "UPDATE sessions SET expires_at = ? WHERE expires_at IS NULL",
+        (int(time.time()) + ttl_seconds,),
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)")
+
+
+def _migration_0004_conversation_summary(conn: sqlite3.Connection) -> None:
+    # summary_upto：已并入滚动摘要的最后一条消息的 created_at
+    conn.execute("ALTER TABLE conversations ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+    conn.execute("ALTER TABLE conversations ADD COLUMN summary_upto TEXT")
+
+
+def _migration_0005_message_citations(conn: sqlite3.Connection) -> None:
+    # 引用只存 chunk_id 与分数，摘录等字段读取时从分块目录补全；存量 JSON 一并迁入
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS message_citations (
+            message_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            chunk_id TEXT NOT NULL,
+            score REAL,
+            rerank_score REAL,
+            bm25_score REAL,
+            hybrid_score REAL,
+            PRIMARY KEY (message_id, position),
+            FOREIGN KEY (message_id) REFERENCES messages (id)
+        ) WITHOUT ROWID
+        """
+    )
+    score_fields = ("score", "rerank_score", "bm25_score", "hybrid_score")
+
+    def as_ref(citation) -> tuple | None:
+        # 只迁移结构完整的引用：chunk_id 为非空字符串且分数均可解析；其余原样保留在 JSON 中
+        if not isinstance(citation, dict):
+            return None
+        chunk_id = citation.get("chunk_id")
+        if not chunk_id or not isinstance(chunk_id, str):
+            return None
+        scores = []
+        for field in score_fields:
+            value = citation.get(field)
+            if value is None:
+                scores.append(None)
+                continue
+            try:
+                scores.append(float(value))
+            except (TypeError, ValueError):
+                return None
+        return (chunk_id, *scores)
+
+    rows = conn.execute(
+        "SELECT id, citations FROM messages WHERE citations IS NOT NULL AND citations NOT IN ('', '[]')"
+    ).fetchall()
+    skipped_rows: list[str] = []
+    kept_citations = 0
+    for row in rows:
+        try:
+            citations = json.loads(row["citations"])
+        except (TypeError, ValueError):
+            skipped_rows.append(row["id"])
+            continue
+        if not isinstance(citations, list):
+            skipped_rows.append(row["id"])
+            continue
+        refs, extra = [], []
+        for citation in citations:
+            ref = as_ref(citation)
+            if ref is not None:
+                refs.append(ref)
+                continue
+            if isinstance(citation, dict) and citation.get("chunk_id"):
+                kept_citations += 1
+            extra.append(citation)
+        if not refs:
+            continue
+        conn.executemany(
+            "INSERT OR REPLACE INTO message_citations "
+            "(message_id, position, chunk_id, score, rerank_score, bm25_score, hybrid_score) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(row["id"], position, *ref) for position, ref in enumerate(refs)],
+        )
+        conn.execute(
+            "UPDATE messages SET citations = ? WHERE id = ?",
+            (json.dumps(extra, ensure_ascii=False), row["id"]),
+        )
+    if skipped_rows:
+        _logger.warning(
+            "message_citations: %d message(s) with unparseable citations left as-is, e.g. %s",
+            len(skipped_rows),
+            ", ".join(skipped_rows[:10]),
+        )
+    if kept_citations:
+        _logger.warning(
+            "message_citations: %d malformed chunk citation(s) kept in messages.citations",
+            kept_citations,
+        )
+
+
+def _migration_0006_class_mastery(conn: sqlite3.Connection) -> None:
+    # 课程 × 知识点的班级聚合，由 knowledge_mastery 上的触发器增量维护（与写入同一事务）。
+    # 只保留与阈值无关的原始和 / 计数；薄弱人数在查询时按 knowledge_tracking.WEAK_THRESHOLD
+    # （或请求传入的阈值）从 knowledge_mastery 统计，阈值不固化在触发器里。
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS class_mastery (
+            course_id TEXT NOT NULL,
+            knowledge_point TEXT NOT NULL,
+            student_count INTEGER NOT NULL DEFAULT 0,
+            mastery_sum REAL NOT NULL DEFAULT 0,
+            attempt_count INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (course_id, knowledge_point)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_knowledge_mastery_insert
+        AFTER INSERT ON knowledge_mastery
+        BEGIN
+            INSERT INTO class_mastery
+                (course_id, knowledge_point, student_count, mastery_sum, attempt_count, updated_at)
+            VALUES
+                (NEW.course_id, NEW.knowledge_point, 1, NEW.mastery, NEW.attempt_count, NEW.updated_at)
+            ON CONFLICT(course_id, knowledge_point) DO UPDATE SET
+                student_count = student_count + 1,
+                mastery_sum = mastery_sum + excluded.mastery_sum,
+                attempt_count = attempt_count + excluded.attempt_count,
+                updated_at = excluded.updated_at;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_knowledge_mastery_update
+        AFTER UPDATE OF mastery, attempt_count ON knowledge_mastery
+        BEGIN
+            UPDATE class_mastery SET
+                mastery_sum = mastery_sum - OLD.mastery + NEW.mastery,
+                attempt_count = attempt_count - OLD.attempt_count + NEW.attempt_count,
+                updated_at = NEW.updated_at
+            WHERE course_id = NEW.course_id AND knowledge_point = NEW.knowledge_point;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_knowledge_mastery_delete
+        AFTER DELETE ON knowledge_mastery
+        BEGIN
+            UPDATE class_mastery SET
+                student_count = student_count - 1,
+                mastery_sum = mastery_sum - OLD.mastery,
+                attempt_count = attempt_count - OLD.attempt_count
+            WHERE course_id = OLD.course_id AND knowledge_point = OLD.knowledge_point;
+            DELETE FROM class_mastery
+            WHERE course_id = OLD.course_id AND knowledge_point = OLD.knowledge_point
+              AND student_count <= 0;
+        END
+        """
+    )
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO class_mastery
+            (course_id, knowledge_point, student_count, mastery_sum, attempt_count, updated_at)
+        SELECT course_id, knowledge_point, COUNT(*), SUM(mastery), SUM(attempt_count), MAX(updated_at)
+        FROM knowledge_mastery
+        GROUP BY course_id, knowledge_point
+        """
+    )
+    # 查询时统计薄弱人数：按课程范围扫描索引，无需回表
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_knowledge_mastery_course_point "
+        "ON knowledge_mastery (course_id, knowledge_point, mastery)"
+    )
+
+
+def _migration_0007_exercise_index(conn: sqlite3.Connection) -> None:
+    # exercise_id -> (批次, 题目下标, 题目 JSON)，评测按主键查一次即可；
+    # 存量批次文件在首次未命中时由 exercises 服务按课程懒重建
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS exercise_index (
+            exercise_id TEXT PRIMARY KEY,
+            course_id TEXT NOT NULL,
+            batch_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            payload TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_exercise_index_course_batch "
+        "ON exercise_index (course_id, batch_id)"
+    )
+
+
+def _migration_0008_exercise_batches(conn: sqlite3.Connection) -> None:
+    # 批次清单：列表页只读这张表，不再加载整个批次文件；
+    # exercise_index_state 记录哪些课程已从磁盘完成首次同步
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS exercise_batches (
+            course_id TEXT NOT NULL,
+            batch_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT,
+            exercise_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (course_id, batch_id)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_exercise_batches_course_created_id "
+        "ON exercise_batches (course_id, created_at, batch_id)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS exercise_index_state (
+            course_id TEXT PRIMARY KEY,
+            synced_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def _migration_0009_question_bank(conn: sqlite3.Connection) -> None:
+    # simhash 为 64 位 SimHash（有符号存储），band0..3 为其 4 段 16 位，用于近似重复候选查询
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS question_bank (
+            exercise_id TEXT PRIMARY KEY,
+            course_id TEXT NOT NULL,
+            batch_id TEXT NOT NULL,
+            knowledge_point TEXT NOT NULL,
+            type TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            simhash INTEGER NOT NULL,
+            band0 INTEGER NOT NULL,
+            band1 INTEGER NOT NULL,
+            band2 INTEGER NOT NULL,
+            band3 INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            use_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_question_bank_reuse "
+        "ON question_bank (course_id, knowledge_point, type, difficulty, use_count, created_at)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_question_bank_course_batch "
+        "ON question_bank (course_id, batch_id)"
+    )
+    for band in range(4):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_question_bank_band{band} "
+            f"ON question_bank (course_id, band{band})"
+        )
+    # 存量课程需重新从磁盘同步一次以填充题库
+    conn.execute("DELETE FROM exercise_index_state")
+
+
+_MIGRATIONS: list[tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "base_tables", _migration_0001_base_tables),
+    (2, "query_indexes", _migration_0002_query_indexes),
+    (3, "session_expiry", _migration_0003_session_expiry),
+    (4, "conversation_summary", _migration_0004_conversation_summary),
+    (5, "message_citations", _migration_0005_message_citations),
+    (6, "class_mastery", _migration_0006_class_mastery),
+    (7, "exercise_index", _migration_0007_exercise_index),
+    (8, "exercise_batches", _migration_0008_exercise_batches),
+    (9, "question_bank", _migration_0009_question_bank),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return int(row[0] or 0)
+
+
+def init_db() -> None:
+    """Apply pending migrations in order, each in its own transaction."""
+    conn = get_connection()
+    try:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+            """
+        )
+        conn.commit()
+        for version, name, migrate in _MIGRATIONS:
+            # BEGIN IMMEDIATE 取得写锁，多个 worker 同时启动时只有一个会执行迁移
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                applied = conn.execute(
+                    "SELECT 1 FROM schema_migrations WHERE version = ?", (version,)
+                ).fetchone()
+                if not applied:
+                    migrate(conn)
+                    conn.execute(
+                        "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                        (version, name, now_iso()),
+                    )
+                    _logger.info("Applied schema migration %04d_%s", version, name)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.close()
+
+
+def explain_query_plan(sql: str, params: Sequence | Mapping = ()) -> list[str]:
+    """Return the ``detail`` column of EXPLAIN QUERY PLAN, e.g. for asserting index usage."""
+    if not isinstance(params, Mapping):
+        params = tuple(params)
+    with connection() as conn:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row["detail"] for row in rows]
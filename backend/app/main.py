@@ -1,9 +1,12 @@
 import logging
+import time
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
-from .db import init_db
+from . import metrics as app_metrics
+from .auth import shutdown_hash_executor
+from .db import close_pool, init_db
 from .routers import (
     agents,
     auth,
@@ -13,8 +16,12 @@ from .routers import (
     knowledge_base,
     knowledge_tracking,
     lesson_plans,
+    metrics,
     rag_qa,
 )
+from .agents.nodes.dag_executor import shutdown_step_executor
+from .agents.nodes.tool_executor import shutdown_tool_executor
+from .services.exercises import shutdown_executors
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
@@ -29,6 +36,27 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    @app.middleware("http")
+    async def _record_http_metrics(request: Request, call_next):
+        started = time.perf_counter()
+        app_metrics.HTTP_IN_FLIGHT.inc()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            app_metrics.HTTP_IN_FLIGHT.dec()
+            # 使用路由模板作为标签，避免路径参数导致时间序列膨胀
+            route = request.scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            app_metrics.HTTP_REQUESTS.inc(
+                method=request.method, route=route_label, status=str(status),
+            )
+            app_metrics.HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, method=request.method, route=route_label,
+            )
+
     app.include_router(auth.router)
     app.include_router(courses.router)
     app.include_router(knowledge_base.router)
@@ -38,11 +66,20 @@ def create_app() -> FastAPI:
     app.include_router(knowledge_tracking.router)
     app.include_router(conversations.router)
     app.include_router(agents.router)
+    app.include_router(metrics.router)
 
     @app.on_event("startup")
     def _startup() -> None:
         init_db()
 
+    @app.on_event("shutdown")
+    def _shutdown() -> None:
+        shutdown_hash_executor()
+        shutdown_executors()
+        shutdown_step_executor()
+        shutdown_tool_executor()
+        close_pool()
+
     return app
 
 
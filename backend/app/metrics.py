@@ -0,0 +1,254 @@
+"""进程内指标注册表，按 Prometheus text exposition 格式导出。
+
+仅依赖标准库；多 worker 部署时每个进程各自统计。
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+_REGISTRY: dict[str, "_Metric"] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Iterable[tuple[str, str]]) -> str:
+    items = [f'{key}="{_escape_label(value)}"' for key, value in pairs]
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = self._header()
+        for key, value in values:
+            labels = _format_labels(zip(self.labelnames, key))
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down (queue depth, in-flight requests)."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram keyed by label values."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (bucket counts, sum, count)
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[key] = series
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> dict[tuple[str, ...], dict]:
+        with self._lock:
+            return {
+                key: {"buckets": list(series[0]), "sum": series[1], "count": series[2]}
+                for key, series in self._series.items()
+            }
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, series in sorted(self.snapshot().items()):
+            base = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, series["buckets"]):
+                labels = _format_labels(base + [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(base + [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {series['count']}")
+        return lines
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+def _register(metric: _Metric) -> _Metric:
+    with _REGISTRY_LOCK:
+        existing = _REGISTRY.get(metric.name)
+        if existing is None:
+            _REGISTRY[metric.name] = metric
+            return metric
+    if existing.kind != metric.kind:
+        raise ValueError(f"metric {metric.name} already registered as {existing.kind}")
+    return existing
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    """Return the registered counter ``name``, creating it on first use."""
+    return _register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+    return _register(Gauge(name, documentation, labelnames))  # type: ignore[return-value]
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Iterable[str] = (),
+    buckets: Iterable[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return _register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+
+# ── 跨模块共享的指标 ──────────────────────────────────────────────────
+
+HTTP_REQUESTS = counter(
+    "http_requests_total",
+    "HTTP requests by method, route template and status code.",
+    labelnames=("method", "route", "status"),
+)
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "Time until response headers are sent (streaming bodies continue afterwards).",
+    labelnames=("method", "route"),
+)
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "HTTP requests currently being handled.")
+
+LLM_REQUESTS = counter(
+    "llm_requests_total",
+    "Chat model calls by calling component and outcome.",
+    labelnames=("component", "outcome"),
+)
+LLM_REQUEST_SECONDS = histogram(
+    "llm_request_duration_seconds",
+    "Chat model call latency (non-streaming calls; streams are covered by request_stage_seconds).",
+    labelnames=("component",),
+)
+EMBEDDING_REQUESTS = counter(
+    "embedding_requests_total",
+    "Embedding calls: kind=query for searches, kind=documents for indexing batches.",
+    labelnames=("kind",),
+)
+EMBEDDING_TEXTS = counter(
+    "embedding_texts_total",
+    "Texts sent to the embedding model.",
+    labelnames=("kind",),
+)
+CACHE_REQUESTS = counter(
+    "cache_requests_total",
+    "In-process cache lookups by cache name and result (hit/miss).",
+    labelnames=("cache", "result"),
+)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def track_llm_call(component: str) -> Iterator[None]:
+    """Count and time one chat model call; exceptions are counted and re-raised."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        LLM_REQUESTS.inc(component=component, outcome="error")
+        raise
+    else:
+        LLM_REQUESTS.inc(component=component, outcome="ok")
+    finally:
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, component=component)
+
+
+def render_latest() -> str:
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY.values())
+    lines: list[str] = []
+    for metric in sorted(metrics, key=lambda item: item.name):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
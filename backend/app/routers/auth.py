@@ -1,7 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends
-
-from ..auth import ALLOWED_ROLES, create_password_hash, create_session, hash_password, require_user
-from ..db import get_connection
+import sqlite3
+
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.concurrency import run_in_threadpool
+
+from ..auth import (
+    ALLOWED_ROLES,
+    create_password_hash_async,
+    create_session,
+    delete_session,
+    extract_bearer_token,
+    invalidate_user,
+    require_user,
+    verify_password_async,
+)
+from ..db import get_connection, transaction
 from ..schemas import AuthResponse, LoginRequest, RegisterRequest, UserResponse
 from ..utils import generate_id, now_iso
 
@@ -19,62 +31,74 @@ def _row_to_user(row) -> UserResponse:
     )
 
 
+def _get_user_by_email(email: str):
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT * FROM users WHERE email = ?",
+        (email,),
+    ).fetchone()
+    conn.close()
+    return row
+
+
+def _insert_user(payload: RegisterRequest, password_hash: str, password_salt: str):
+    user_id = generate_id("user")
+    with transaction() as conn:
+        conn.execute(
+            """
+            INSERT INTO users (id, name, email, role, password_hash, password_salt, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                user_id,
+                payload.name,
+                payload.email,
+                payload.role,
+                password_hash,
+                password_salt,
+                now_iso(),
+            ),
+        )
+        return conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+
+
+# register / login 为 async：PBKDF2 在哈希进程池中执行，等待期间不占用请求线程池；
+# 数据库读写仍是短小的同步调用，交给 run_in_threadpool
+
+
 @router.post("/register", response_model=dict)
-def register(payload: RegisterRequest) -> dict:
+async def register(payload: RegisterRequest) -> dict:
     if payload.role not in ALLOWED_ROLES:
         raise HTTPException(status_code=400, detail="Invalid role")
 
-    conn = get_connection()
-    existing = conn.execute(
-        "SELECT id FROM users WHERE email = ?",
-        (payload.email,),
-    ).fetchone()
+    existing = await run_in_threadpool(_get_user_by_email, payload.email)
     if existing:
-        conn.close()
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    password_hash, password_salt = create_password_hash(payload.password)
-    user_id = generate_id("user")
-    conn.execute(
-        """
-        INSERT INTO users (id, name, email, role, password_hash, password_salt, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            user_id,
-            payload.name,
-            payload.email,
-            payload.role,
-            password_hash,
-            password_salt,
-            now_iso(),
-        ),
-    )
-    conn.commit()
-    row = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
+    password_hash, password_salt = await create_password_hash_async(payload.password)
+    try:
+        row = await run_in_threadpool(_insert_user, payload, password_hash, password_salt)
+    except sqlite3.IntegrityError:
+        # 哈希期间同一邮箱被并发注册
+        raise HTTPException(status_code=400, detail="Email already registered")
 
-    token = create_session(user_id)
+    token = await run_in_threadpool(create_session, row["id"])
     response = AuthResponse(token=token, user=_row_to_user(row))
     return {"data": response.model_dump(), "meta": {}}
 
 
 @router.post("/login", response_model=dict)
-def login(payload: LoginRequest) -> dict:
-    conn = get_connection()
-    row = conn.execute(
-        "SELECT * FROM users WHERE email = ?",
-        (payload.email,),
-    ).fetchone()
-    conn.close()
+async def login(payload: LoginRequest) -> dict:
+    row = await run_in_threadpool(_get_user_by_email, payload.email)
     if not row:
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
-    expected = hash_password(payload.password, row["password_salt"])
-    if expected != row["password_hash"]:
+    if not await verify_password_async(
+        payload.password, row["password_salt"], row["password_hash"],
+    ):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
-    token = create_session(row["id"])
+    token = await run_in_threadpool(create_session, row["id"])
     response = AuthResponse(token=token, user=_row_to_user(row))
     return {"data": response.model_dump(), "meta": {}}
 
@@ -93,5 +117,14 @@ def update_my_role(payload: dict, user: dict = Depends(require_user)) -> dict:
     conn.commit()
     row = conn.execute("SELECT * FROM users WHERE id = ?", (user["id"],)).fetchone()
     conn.close()
+    invalidate_user(user["id"])
 
     return {"data": _row_to_user(row).model_dump(), "meta": {}}
+
+
+@router.post("/logout", response_model=dict)
+def logout(authorization: str | None = Header(default=None)) -> dict:
+    token = extract_bearer_token(authorization)
+    if not delete_session(token):
+        raise HTTPException(status_code=401, detail="Invalid auth token")
+    return {"data": {"logged_out": True}, "meta": {}}
@@ -10,13 +10,26 @@ from ..schemas import (
 from ..services.memory_store import (
     create_conversation,
     delete_conversation,
+    get_conversation,
     get_conversation_with_messages,
     list_conversations,
+    list_conversations_page,
+    list_messages_page,
     update_conversation_title,
 )
 
 router = APIRouter(prefix="/api/v1/conversations", tags=["conversations"])
 
+DEFAULT_PAGE_SIZE = 20
+DEFAULT_MESSAGE_PAGE_SIZE = 50
+
+
+def _get_owned_conversation(conversation_id: str, user: dict) -> dict:
+    conv = get_conversation(conversation_id)
+    if not conv or conv["user_id"] != user["id"]:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conv
+
 
 @router.post("", response_model=ConversationResponse)
 def create(payload: ConversationCreateRequest, user: dict = Depends(require_user)):
@@ -33,12 +46,73 @@ def list_all(
     return [ConversationResponse(**c) for c in convs]
 
 
+# 须在 /{conversation_id} 之前注册
+@router.get("/page", response_model=dict)
+def list_page(
+    course_id: str | None = Query(default=None),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=100),
+    cursor: str | None = Query(default=None),
+    user: dict = Depends(require_user),
+) -> dict:
+    """Keyset pages ordered by ``updated_at`` desc; the next cursor is in ``meta.next_cursor``."""
+    try:
+        convs, next_cursor = list_conversations_page(user["id"], course_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {
+        "data": [ConversationResponse(**c).model_dump() for c in convs],
+        "meta": {"count": len(convs), "next_cursor": next_cursor},
+    }
+
+
 @router.get("/{conversation_id}", response_model=ConversationDetailResponse)
-def detail(conversation_id: str, user: dict = Depends(require_user)):
-    conv = get_conversation_with_messages(conversation_id)
-    if not conv or conv["user_id"] != user["id"]:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-    return ConversationDetailResponse(**conv)
+def detail(
+    conversation_id: str,
+    message_limit: int | None = Query(default=None, ge=1, le=200),
+    include_citations: bool = Query(default=True),
+    user: dict = Depends(require_user),
+):
+    """``message_limit`` 时只返回最近的 N 条消息。
+
+    更早消息的游标在响应体 ``next_cursor`` 中，交给 /messages 继续翻页。
+    """
+    if message_limit is None and include_citations:
+        conv = get_conversation_with_messages(conversation_id)
+        if not conv or conv["user_id"] != user["id"]:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return ConversationDetailResponse(**conv)
+
+    conv = _get_owned_conversation(conversation_id, user)
+    messages, next_cursor = list_messages_page(
+        conversation_id,
+        limit=message_limit or 10_000,
+        include_citations=include_citations,
+    )
+    for message in messages:
+        message.setdefault("citations", [])
+    return ConversationDetailResponse(**conv, messages=messages, next_cursor=next_cursor)
+
+
+@router.get("/{conversation_id}/messages", response_model=dict)
+def list_messages(
+    conversation_id: str,
+    limit: int = Query(default=DEFAULT_MESSAGE_PAGE_SIZE, ge=1, le=200),
+    cursor: str | None = Query(default=None),
+    include_citations: bool = Query(default=False),
+    user: dict = Depends(require_user),
+) -> dict:
+    """Newest-first message pages (chronological within a page); citations omitted by default."""
+    _get_owned_conversation(conversation_id, user)
+    try:
+        messages, next_cursor = list_messages_page(
+            conversation_id, limit=limit, cursor=cursor, include_citations=include_citations,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {
+        "data": messages,
+        "meta": {"count": len(messages), "next_cursor": next_cursor},
+    }
 
 
 @router.patch("/{conversation_id}", response_model=ConversationResponse)
@@ -9,6 +9,7 @@ from ..schemas import (
     KnowledgePointCreateRequest,
     KnowledgePointsSyncRequest,
 )
+from ..services.knowledge_tracking import invalidate_course_knowledge_state
 from ..utils import generate_id, now_iso
 
 
@@ -99,6 +100,7 @@ def add_knowledge_point(
         (point_id, course_id, payload.point, now_iso()),
     )
     conn.commit()
+    invalidate_course_knowledge_state(course_id)
     row = conn.execute(
         "SELECT * FROM knowledge_points WHERE id = ?", (point_id,)
     ).fetchone()
@@ -133,6 +135,7 @@ def sync_knowledge_points(
             (point_id, course_id, point, now),
         )
     conn.commit()
+    invalidate_course_knowledge_state(course_id)
     conn.close()
     return list_knowledge_points(course_id, user)
 
@@ -150,6 +153,7 @@ def delete_knowledge_point(
         (point_id, course_id),
     )
     conn.commit()
+    invalidate_course_knowledge_state(course_id)
     conn.close()
     return {"data": {"deleted": True}, "meta": {}}
 
@@ -168,6 +172,7 @@ def update_knowledge_point(
         (payload.point, point_id, course_id),
     )
     conn.commit()
+    invalidate_course_knowledge_state(course_id)
     row = conn.execute(
         "SELECT * FROM knowledge_points WHERE id = ?", (point_id,)
     ).fetchone()
@@ -1,9 +1,12 @@
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
 from ..auth import require_teacher, require_user
 from ..schemas import (
+    ExerciseBatchGradingRequest,
+    ExerciseBatchGradingResponse,
     ExerciseGenerationRequest,
     ExerciseGenerationResponse,
     ExerciseGradingRequest,
@@ -16,13 +19,15 @@ from ..schemas import (
 from ..services.exercises import (
     generate_exercises, 
     grade_exercise, 
+    grade_exercises,
     save_exercise_batch, 
     list_exercise_batches, 
     get_exercise_batch, 
     update_exercise_batch, 
-    delete_exercise_batch
+    delete_exercise_batch,
+    stream_exercise_events,
 )
-from ..services.knowledge_tracking import record_attempt
+from ..services.knowledge_tracking import record_attempt, record_attempts
 
 logger = logging.getLogger(__name__)
 
@@ -45,11 +50,38 @@ def generate_course_exercises(
         types=payload.types,
         difficulty=payload.difficulty,
         knowledge_scope=payload.knowledge_scope,
+        batched=payload.batch_prompt,
+        reuse_bank=payload.reuse_bank,
     )
     response = ExerciseGenerationResponse(generated=exercises)
     return {"data": response.model_dump(), "meta": {"count": len(exercises)}}
 
 
+@router.post("/{course_id}/exercises/generate/stream")
+def generate_course_exercises_stream(
+    course_id: str,
+    payload: ExerciseGenerationRequest,
+    user: dict = Depends(require_user),
+) -> StreamingResponse:
+    _ = user
+    if payload.course_id != course_id:
+        raise HTTPException(status_code=400, detail="course_id mismatch")
+    event_stream = stream_exercise_events(
+        course_id=course_id,
+        count=payload.count,
+        types=payload.types,
+        difficulty=payload.difficulty,
+        knowledge_scope=payload.knowledge_scope,
+        batched=payload.batch_prompt,
+        reuse_bank=payload.reuse_bank,
+    )
+    return StreamingResponse(
+        event_stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 @router.post("/{course_id}/exercises/batches", response_model=dict)
 def save_course_exercise_batch(
     course_id: str,
@@ -67,10 +99,18 @@ def save_course_exercise_batch(
 @router.get("/{course_id}/exercises/batches", response_model=dict)
 def get_course_exercise_batches(
     course_id: str,
+    limit: int | None = Query(default=None, ge=1, le=100),
+    cursor: str | None = Query(default=None),
     user: dict = Depends(require_user),
 ) -> dict:
-    batches = list_exercise_batches(course_id)
-    return {"data": batches, "meta": {"count": len(batches)}}
+    """不带 limit/cursor 时返回全部（兼容旧前端）；分页时下一页游标在 meta.next_cursor。"""
+    if cursor is not None and limit is None:
+        limit = 20
+    try:
+        batches, next_cursor = list_exercise_batches(course_id, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"data": batches, "meta": {"count": len(batches), "next_cursor": next_cursor}}
 
 
 @router.get("/{course_id}/exercises/batches/{batch_id}", response_model=dict)
@@ -142,3 +182,38 @@ def grade_course_exercise(
 
     response = ExerciseGradingResponse(**result)
     return {"data": response.model_dump(), "meta": {"graded": True}}
+
+
+@router.post("/{course_id}/exercises/grade/batch", response_model=dict)
+def grade_course_exercise_batch(
+    course_id: str,
+    payload: ExerciseBatchGradingRequest,
+    user: dict = Depends(require_user),
+) -> dict:
+    if payload.course_id != course_id:
+        raise HTTPException(status_code=400, detail="course_id mismatch")
+    results = grade_exercises(course_id, [item.model_dump() for item in payload.answers])
+
+    attempts = [
+        {
+            "student_id": user["id"],
+            "exercise_id": result["exercise_id"],
+            "course_id": course_id,
+            "score": result.get("score", 0),
+            "knowledge_points": result.get("knowledge_points") or [],
+        }
+        for result in results
+        if result.get("knowledge_points")
+    ]
+    if attempts and user.get("id"):
+        try:
+            record_attempts(attempts)
+        except Exception:
+            logger.warning("Failed to record attempts for knowledge tracking", exc_info=True)
+
+    response = ExerciseBatchGradingResponse(
+        results=[ExerciseGradingResponse(**result) for result in results],
+        total_score=round(sum(float(result.get("score", 0)) for result in results), 2),
+        correct_count=sum(1 for result in results if result.get("correct")),
+    )
+    return {"data": response.model_dump(), "meta": {"count": len(results), "graded": True}}
@@ -1,15 +1,22 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 
-from ..auth import require_user
+from ..auth import require_teacher, require_user
 from ..schemas import (
+    ClassMasteryResponse,
+    ExerciseAttemptBatchRequest,
     ExerciseGenerationResponse,
     KnowledgeStateResponse,
     RecommendedExercisesRequest,
 )
 from ..services.knowledge_tracking import (
+    WEAK_THRESHOLD,
+    course_exists,
     generate_recommended_exercises,
+    get_class_mastery,
     get_exercise_attempts,
     get_knowledge_state,
+    record_attempts,
+    unknown_student_ids,
 )
 
 router = APIRouter(prefix="/api/v1", tags=["knowledge-tracking"])
@@ -25,6 +32,17 @@ def api_get_knowledge_state(
     return {"data": response.model_dump(), "meta": {"count": len(response.items)}}
 
 
+@router.get("/class-mastery", response_model=dict)
+def api_get_class_mastery(
+    course_id: str = Query(..., min_length=1),
+    weak_threshold: float = Query(WEAK_THRESHOLD, ge=0.0, le=1.0),
+    user: dict = Depends(require_user),
+) -> dict:
+    require_teacher(user)
+    response = ClassMasteryResponse(**get_class_mastery(course_id, weak_threshold))
+    return {"data": response.model_dump(), "meta": {"count": len(response.items)}}
+
+
 @router.post("/recommended-exercises", response_model=dict)
 def api_recommended_exercises(
     payload: RecommendedExercisesRequest,
@@ -48,3 +66,37 @@ def api_get_exercise_attempts(
 ) -> dict:
     attempts = get_exercise_attempts(user["id"], course_id, limit=limit)
     return {"data": attempts, "meta": {"count": len(attempts)}}
+
+
+@router.post("/exercise-attempts/batch", response_model=dict)
+def api_record_exercise_attempts(
+    payload: ExerciseAttemptBatchRequest,
+    user: dict = Depends(require_user),
+) -> dict:
+    """Record a batch of teacher-graded attempts (e.g. a class quiz) in one transaction.
+
+    Scores come from the client, so only teachers may write them; students submit
+    answers to ``/courses/{course_id}/exercises/grade/batch`` and are scored there.
+    """
+    require_teacher(user)
+    if not course_exists(payload.course_id):
+        raise HTTPException(status_code=404, detail="Course not found")
+    # 任一 student_id 无效则整批拒绝，不写入部分数据
+    unknown = unknown_student_ids([item.student_id for item in payload.attempts])
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown student ids: {', '.join(unknown[:20])}",
+        )
+    attempts = [
+        {
+            "student_id": item.student_id,
+            "exercise_id": item.exercise_id,
+            "course_id": payload.course_id,
+            "score": item.score,
+            "knowledge_points": item.knowledge_points,
+        }
+        for item in payload.attempts
+    ]
+    recorded = record_attempts(attempts)
+    return {"data": {"recorded": recorded}, "meta": {"count": recorded}}
@@ -136,6 +136,7 @@ class RagQaResponse(BaseModel):
     answer: str
     citations: list[RagCitation]
     conversation_id: str | None = None
+    cache: dict | None = None
 
 
 # ── Conversation / Memory ──
@@ -175,6 +176,8 @@ class ConversationDetailResponse(BaseModel):
     created_at: str
     updated_at: str
     messages: list[MessageResponse]
+    # 仅在按 message_limit 截取时返回：更早消息的游标（用于 /messages 翻页）
+    next_cursor: str | None = None
 
 
 class RagEvaluationRequest(BaseModel):
@@ -200,6 +203,10 @@ class ExerciseGenerationRequest(BaseModel):
     types: list[str] = Field(default_factory=list)
     difficulty: str = Field(default="easy")
     knowledge_scope: list[str] | None = None
+    # 同一知识点的多道题合并为一次模型调用；不传时取 EXERCISE_GENERATION_BATCHED
+    batch_prompt: bool | None = None
+    # 优先复用课程题库中的同类题目；不传时取 EXERCISE_BANK_REUSE
+    reuse_bank: bool | None = None
 
 
 class ExerciseOption(BaseModel):
@@ -316,6 +323,23 @@ class ExerciseGradingResponse(BaseModel):
     knowledge_points: list[str] | None = None
 
 
+class ExerciseSubmissionItem(BaseModel):
+    exercise_id: str = Field(min_length=1)
+    type: str = Field(min_length=1)
+    answer: str | bool | list
+
+
+class ExerciseBatchGradingRequest(BaseModel):
+    course_id: str = Field(min_length=1)
+    answers: list[ExerciseSubmissionItem] = Field(min_length=1, max_length=200)
+
+
+class ExerciseBatchGradingResponse(BaseModel):
+    results: list[ExerciseGradingResponse]
+    total_score: float
+    correct_count: int
+
+
 # ── Knowledge Tracking ──
 
 
@@ -332,6 +356,21 @@ class KnowledgeStateResponse(BaseModel):
     weak_points: list[str]
 
 
+class ClassMasteryItem(BaseModel):
+    knowledge_point: str
+    mean_mastery: float | None
+    student_count: int
+    attempt_count: int
+    weak_count: int
+    updated_at: str
+
+
+class ClassMasteryResponse(BaseModel):
+    course_id: str
+    items: list[ClassMasteryItem]
+    weak_threshold: float
+
+
 class RecommendedExercisesRequest(BaseModel):
     course_id: str = Field(min_length=1)
     count: int = Field(default=5, ge=1, le=20)
@@ -347,6 +386,19 @@ class ExerciseAttemptItem(BaseModel):
     created_at: str
 
 
+class ExerciseAttemptRecord(BaseModel):
+    exercise_id: str = Field(min_length=1)
+    score: float = Field(ge=0, le=1)
+    knowledge_points: list[str] = Field(default_factory=list)
+    # 作答的学生；须为已注册的学生账号
+    student_id: str = Field(min_length=1)
+
+
+class ExerciseAttemptBatchRequest(BaseModel):
+    course_id: str = Field(min_length=1)
+    attempts: list[ExerciseAttemptRecord] = Field(min_length=1, max_length=5000)
+
+
 # ── Agent (P0-1, agent-spec §9) ──
 
 
@@ -0,0 +1,171 @@
+"""课程级语义答案缓存。
+
+同一课程内语义几乎相同的问题（问题向量余弦相似度 ≥ 阈值）直接复用上一次的
+回答与引用，跳过检索与生成。每条缓存记录所属课程的索引代数
+（``knowledge_base.get_index_generation``），知识库增删改后旧条目自动失效。
+
+只缓存无对话历史、未开启联网搜索的首轮提问：追问依赖上下文，联网结果随时间变化。
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import operator
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any
+
+from .. import metrics
+from .knowledge_base import get_index_generation
+from .langchain_client import get_embeddings, is_dashscope_configured
+
+logger = logging.getLogger(__name__)
+
+# course_id -> OrderedDict[entry_id, entry]，按 LRU 淘汰
+_CACHE: dict[str, "OrderedDict[int, dict]"] = defaultdict(OrderedDict)
+_CACHE_LOCK = threading.Lock()
+_NEXT_ENTRY_ID = 0
+
+
+def _cache_enabled() -> bool:
+    value = os.getenv("RAG_ANSWER_CACHE_ENABLED", "true").strip().lower()
+    return value not in {"0", "false", "no"}
+
+
+def _similarity_threshold() -> float:
+    return float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+def _max_entries() -> int:
+    return max(1, int(os.getenv("RAG_ANSWER_CACHE_SIZE", "256")))
+
+
+def _ttl_seconds() -> float:
+    return float(os.getenv("RAG_ANSWER_CACHE_TTL", "86400"))
+
+
+def _normalize(vector: list[float]) -> tuple[float, ...]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    if not norm:
+        return tuple(vector)
+    return tuple(value / norm for value in vector)
+
+
+def _dot(left: tuple[float, ...], right: tuple[float, ...]) -> float:
+    return sum(map(operator.mul, left, right))
+
+
+def is_cacheable(history: list[dict] | None, use_web_search: bool | None) -> bool:
+    return _cache_enabled() and is_dashscope_configured() and not history and not use_web_search
+
+
+def embed_question(question: str) -> list[float] | None:
+    """Embed ``question`` once; the vector is reused for the lookup and for retrieval."""
+    try:
+        metrics.EMBEDDING_REQUESTS.inc(kind="query")
+        metrics.EMBEDDING_TEXTS.inc(kind="query")
+        return list(get_embeddings().embed_query(question))
+    except Exception:
+        logger.warning("Question embedding failed; answer cache bypassed", exc_info=True)
+        return None
+
+
+def lookup(course_id: str, embedding: list[float] | None) -> dict | None:
+    """Return the closest fresh cached entry for ``course_id``, or None on a miss."""
+    if embedding is None:
+        return None
+    vector = _normalize(embedding)
+    generation = get_index_generation(course_id)
+    threshold = _similarity_threshold()
+    expires_before = time.time() - _ttl_seconds()
+
+    best: dict | None = None
+    best_score = threshold
+    with _CACHE_LOCK:
+        entries = _CACHE.get(course_id)
+        if entries:
+            stale = [
+                entry_id
+                for entry_id, entry in entries.items()
+                if entry["generation"] != generation or entry["created_at"] < expires_before
+            ]
+            for entry_id in stale:
+                entries.pop(entry_id, None)
+            for entry_id, entry in entries.items():
+                if len(entry["vector"]) != len(vector):
+                    continue
+                score = _dot(vector, entry["vector"])
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is not None:
+                entries.move_to_end(best["id"])
+                best["hits"] += 1
+
+    metrics.record_cache("qa_answer", best is not None)
+    if best is None:
+        return None
+    return {
+        "answer": best["answer"],
+        "citations": [dict(item) for item in best["citations"]],
+        "disclaimer": best["disclaimer"],
+        "question": best["question"],
+        "similarity": round(best_score, 4),
+    }
+
+
+def store(
+    course_id: str,
+    question: str,
+    embedding: list[float] | None,
+    answer: str,
+    citations: list[dict],
+    disclaimer: str = "",
+    generation: int | None = None,
+) -> None:
+    """Cache an answer generated against index ``generation`` (read before retrieval)."""
+    global _NEXT_ENTRY_ID
+    if embedding is None or not answer:
+        return
+    if generation is None:
+        generation = get_index_generation(course_id)
+    if generation != get_index_generation(course_id):
+        # 生成期间知识库发生了变化，回答可能基于旧资料
+        return
+    with _CACHE_LOCK:
+        _NEXT_ENTRY_ID += 1
+        entry_id = _NEXT_ENTRY_ID
+        entries = _CACHE[course_id]
+        entries[entry_id] = {
+            "id": entry_id,
+            "question": question,
+            "vector": _normalize(embedding),
+            "answer": answer,
+            "citations": [dict(item) for item in citations],
+            "disclaimer": disclaimer,
+            "generation": generation,
+            "created_at": time.time(),
+            "hits": 0,
+        }
+        limit = _max_entries()
+        while len(entries) > limit:
+            entries.popitem(last=False)
+
+
+def invalidate(course_id: str | None = None) -> None:
+    with _CACHE_LOCK:
+        if course_id is None:
+            _CACHE.clear()
+        else:
+            _CACHE.pop(course_id, None)
+
+
+def split_for_stream(text: str, size: int = 24) -> list[str]:
+    """Split a cached answer into SSE-sized deltas so clients render it like a live stream."""
+    return [text[start:start + size] for start in range(0, len(text), size)] or [""]
+
+
+def cache_meta(hit: dict[str, Any]) -> dict[str, Any]:
+    return {"hit": True, "similarity": hit["similarity"], "matched_question": hit["question"]}
@@ -1,20 +1,86 @@
 import json
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from itertools import cycle
-from typing import Iterable
+from typing import Iterable, Iterator
 
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
+from .. import metrics
+from ..db import get_connection, transaction
 from ..utils import generate_id, now_iso
 from .knowledge_base import generate_knowledge_points, search_documents
 from .langchain_client import get_chat_model, is_dashscope_configured
+from . import question_bank
+from .memory_store import decode_cursor, encode_cursor
+from .retrieval_context import RetrievalContext
 from .model_client import parse_json_payload
 
 
+logger = logging.getLogger(__name__)
+
 _PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
 _EXERCISE_ROOT = os.path.join(_PROJECT_ROOT, "data", "exercises")
+_EXERCISES_GENERATED = metrics.counter(
+    "exercises_generated_total",
+    "Generated exercises by type and source (model / placeholder).",
+    labelnames=("type", "source"),
+)
+_EXERCISE_GRADINGS = metrics.counter(
+    "exercise_gradings_total",
+    "Graded answers by exercise type.",
+    labelnames=("type",),
+)
+
+# 串行化按课程从磁盘重建 exercise_index / exercise_batches
+_INDEX_REBUILD_LOCK = threading.Lock()
+
+# 批量评测中简答题的 LLM 评分并发上限；进程级共享，避免多个并发提交叠加打满模型限流
+_GRADING_EXECUTOR: ThreadPoolExecutor | None = None
+_GRADING_EXECUTOR_LOCK = threading.Lock()
+
+# 出题：检索与 LLM 调用共用的并发池；LLM 调用另受全局速率限制
+_GENERATION_EXECUTOR: ThreadPoolExecutor | None = None
+_GENERATION_EXECUTOR_LOCK = threading.Lock()
+
+
+def _grading_concurrency() -> int:
+    return max(1, int(os.getenv("EXERCISE_GRADING_CONCURRENCY", "4")))
+
+
+def _generation_concurrency() -> int:
+    return max(1, int(os.getenv("EXERCISE_GENERATION_CONCURRENCY", "4")))
+
+
+def _generation_rate_per_second() -> float:
+    # 0 表示不限速
+    return max(0.0, float(os.getenv("EXERCISE_GENERATION_RPS", "5")))
+
+
+class _RateLimiter:
+    """Space call starts at least ``1 / rate`` seconds apart across all threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self, rate: float) -> None:
+        if rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot)
+            self._next_slot = start + 1.0 / rate
+        if start > now:
+            time.sleep(start - now)
+
+
+_GENERATION_RATE_LIMITER = _RateLimiter()
 
 
 def _ensure_course_exercise_dir(course_id: str) -> str:
@@ -43,6 +109,218 @@ def _load_exercise_file(file_path: str) -> dict | None:
         return None
 
 
+# ── Exercise index & batch manifest ──────────────────────────────────
+#
+# 批次文件仍是题目的权威存储；exercise_index（按题）与 exercise_batches（按批次）
+# 是随 save/update/delete 同步维护的索引。课程首次被访问时从磁盘整体重建一次，
+# 完成后在 exercise_index_state 中记一笔，此后以索引为准。
+
+
+def _index_rows(course_id: str, batch_id: str, exercises: list[dict]) -> list[tuple]:
+    return [
+        (
+            exercise["exercise_id"],
+            course_id,
+            batch_id,
+            position,
+            json.dumps(exercise, ensure_ascii=False),
+        )
+        for position, exercise in enumerate(exercises)
+        if isinstance(exercise, dict) and exercise.get("exercise_id")
+    ]
+
+
+def _manifest_row(course_id: str, batch: dict) -> tuple:
+    batch_id = batch["batch_id"]
+    return (
+        course_id,
+        batch_id,
+        batch.get("title") or f"练习批次 {batch_id}",
+        batch.get("created_at") or now_iso(),
+        batch.get("updated_at"),
+        len(batch.get("exercises") or []),
+    )
+
+
+_INSERT_INDEX_SQL = (
+    "INSERT OR REPLACE INTO exercise_index "
+    "(exercise_id, course_id, batch_id, position, payload) VALUES (?, ?, ?, ?, ?)"
+)
+_INSERT_MANIFEST_SQL = (
+    "INSERT OR REPLACE INTO exercise_batches "
+    "(course_id, batch_id, title, created_at, updated_at, exercise_count) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def _is_placeholder_exercise(exercise: dict) -> bool:
+    knowledge_points = exercise.get("knowledge_points") or [""]
+    placeholder = _build_placeholder_exercise(
+        "", 0, str(exercise.get("type") or ""), str(knowledge_points[0]), "", []
+    )
+    return exercise.get("question") == placeholder["question"]
+
+
+def _bankable(exercises: list[dict]) -> list[dict]:
+    return [
+        exercise
+        for exercise in exercises
+        if isinstance(exercise, dict) and not _is_placeholder_exercise(exercise)
+    ]
+
+
+def _reindex_batch(course_id: str, batch_id: str, batch: dict | None) -> list[dict]:
+    """Replace the index, manifest and question bank rows of one batch.
+
+    ``batch=None`` only removes them. Returns the near-duplicates that were kept
+    out of the question bank.
+    """
+    exercises = (batch or {}).get("exercises") or []
+    rows = _index_rows(course_id, batch_id, exercises)
+    duplicates: list[dict] = []
+    try:
+        with transaction() as conn:
+            conn.execute(
+                "DELETE FROM exercise_index WHERE course_id = ? AND batch_id = ?",
+                (course_id, batch_id),
+            )
+            conn.execute(
+                "DELETE FROM exercise_batches WHERE course_id = ? AND batch_id = ?",
+                (course_id, batch_id),
+            )
+            if batch is not None:
+                conn.execute(_INSERT_MANIFEST_SQL, _manifest_row(course_id, batch))
+                conn.executemany(_INSERT_INDEX_SQL, rows)
+            duplicates = question_bank.sync_batch(conn, course_id, batch_id, _bankable(exercises))
+    except Exception:
+        # 索引只是加速结构；写失败时清除同步标记，下次访问该课程时从磁盘重建
+        logger.exception("Failed to update exercise index for batch %s", batch_id)
+        try:
+            with transaction() as conn:
+                conn.execute("DELETE FROM exercise_index_state WHERE course_id = ?", (course_id,))
+        except Exception:
+            logger.exception("Failed to reset exercise index state for course %s", course_id)
+    return duplicates
+
+
+def _collect_batches_from_disk(course_id: str) -> list[dict]:
+    batch_map: dict[str, dict] = {}
+    for file_path in _iter_exercise_files(course_id):
+        data = _load_exercise_file(file_path)
+        if not data:
+            continue
+        batch_id = data.get("batch_id")
+        if not batch_id:
+            continue
+        # Batch file format
+        if isinstance(data.get("exercises"), list):
+            batch_map[batch_id] = data
+            continue
+        # Legacy single-exercise file format：文件本身就是一道题
+        created_at = data.get("created_at") or now_iso()
+        entry = batch_map.setdefault(
+            batch_id,
+            {
+                "batch_id": batch_id,
+                "title": data.get("title"),
+                "created_at": created_at,
+                "updated_at": None,
+                "exercises": [],
+                "legacy": True,
+            },
+        )
+        if not entry.get("legacy"):
+            continue
+        entry["exercises"].append(data)
+        if created_at < entry["created_at"]:
+            entry["created_at"] = created_at
+    return list(batch_map.values())
+
+
+def rebuild_exercise_index(course_id: str) -> int:
+    """Rebuild index, manifest and question bank of ``course_id`` from disk; returns the exercise count."""
+    batches = _collect_batches_from_disk(course_id)
+    rows = [
+        row for batch in batches for row in _index_rows(course_id, batch["batch_id"], batch["exercises"])
+    ]
+    with transaction() as conn:
+        conn.execute("DELETE FROM exercise_index WHERE course_id = ?", (course_id,))
+        conn.execute("DELETE FROM exercise_batches WHERE course_id = ?", (course_id,))
+        conn.executemany(_INSERT_INDEX_SQL, rows)
+        conn.executemany(_INSERT_MANIFEST_SQL, [_manifest_row(course_id, batch) for batch in batches])
+        conn.execute("DELETE FROM question_bank WHERE course_id = ?", (course_id,))
+        for batch in sorted(batches, key=lambda item: item["created_at"]):
+            question_bank.sync_batch(conn, course_id, batch["batch_id"], _bankable(batch["exercises"]))
+        conn.execute(
+            "INSERT OR REPLACE INTO exercise_index_state (course_id, synced_at) VALUES (?, ?)",
+            (course_id, now_iso()),
+        )
+    return len(rows)
+
+
+def _is_course_synced(course_id: str) -> bool:
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            "SELECT 1 FROM exercise_index_state WHERE course_id = ?", (course_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def _ensure_course_synced(course_id: str) -> bool:
+    """Rebuild from disk unless already done; returns True if a rebuild ran."""
+    if _is_course_synced(course_id):
+        return False
+    with _INDEX_REBUILD_LOCK:
+        if _is_course_synced(course_id):
+            return False
+        try:
+            rebuild_exercise_index(course_id)
+        except Exception:
+            logger.exception("Failed to rebuild exercise index for course %s", course_id)
+            return False
+    return True
+
+
+def _select_indexed_exercises(course_id: str, exercise_ids: list[str]) -> dict[str, dict]:
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            "SELECT exercise_id, payload FROM exercise_index "
+            "WHERE course_id = ? AND exercise_id IN (SELECT value FROM json_each(?))",
+            (course_id, json.dumps(exercise_ids)),
+        ).fetchall()
+    finally:
+        conn.close()
+    found: dict[str, dict] = {}
+    for row in rows:
+        try:
+            payload = json.loads(row["payload"])
+        except (TypeError, ValueError):
+            continue
+        if isinstance(payload, dict):
+            found[row["exercise_id"]] = payload
+    return found
+
+
+def find_exercises(course_id: str, exercise_ids: list[str]) -> dict[str, dict]:
+    """Look up saved exercises by id in one indexed query; syncs the course from disk on first miss."""
+    wanted = list(dict.fromkeys(item for item in exercise_ids if item))
+    if not course_id or not wanted:
+        return {}
+    found = _select_indexed_exercises(course_id, wanted)
+    metrics.record_cache("exercise_index", len(found) == len(wanted))
+    if len(found) == len(wanted) or not _ensure_course_synced(course_id):
+        return found
+    return _select_indexed_exercises(course_id, wanted)
+
+
+def find_exercise(course_id: str, exercise_id: str) -> dict | None:
+    return find_exercises(course_id, [exercise_id]).get(exercise_id)
+
+
 def save_exercise_batch(course_id: str, exercises: list[dict], title: str | None = None) -> dict:
     batch_id = generate_id("batch")
     dir_path = _ensure_course_exercise_dir(course_id)
@@ -59,46 +337,54 @@ def save_exercise_batch(course_id: str, exercises: list[dict], title: str | None
     
     with open(file_path, "w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=2)
+    duplicates = _reindex_batch(course_id, batch_id, payload)
     
-    return payload
+    # duplicates 仅随响应返回：这些题目照常保存在批次中，只是不再重复进入题库
+    return {**payload, "duplicates": duplicates}
 
 
-def list_exercise_batches(course_id: str) -> list[dict]:
-    batch_map: dict[str, dict] = {}
-    for file_path in _iter_exercise_files(course_id):
-        data = _load_exercise_file(file_path)
-        if not data:
-            continue
-        batch_id = data.get("batch_id")
-        if not batch_id:
-            continue
-        # Batch file format
-        if isinstance(data.get("exercises"), list):
-            count = len(data.get("exercises", []))
-            batch_map[batch_id] = {
-                "batch_id": batch_id,
-                "title": data.get("title") or f"练习批次 {batch_id}",
-                "created_at": data.get("created_at") or now_iso(),
-                "count": count,
-            }
-            continue
-        # Legacy single-exercise file format
-        entry = batch_map.get(batch_id)
-        created_at = data.get("created_at") or now_iso()
-        if not entry:
-            batch_map[batch_id] = {
-                "batch_id": batch_id,
-                "title": data.get("title") or f"练习批次 {batch_id}",
-                "created_at": created_at,
-                "count": 1,
-            }
-        else:
-            entry["count"] += 1
-            if created_at < entry["created_at"]:
-                entry["created_at"] = created_at
-
-    batches = list(batch_map.values())
-    return sorted(batches, key=lambda x: x["created_at"], reverse=True)
+def list_exercise_batches(
+    course_id: str,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """Read batch summaries from the manifest, newest first; returns (items, next_cursor).
+
+    ``limit=None`` returns every batch. Raises ValueError for a malformed cursor.
+    """
+    _ensure_course_synced(course_id)
+    clauses = ["course_id = ?"]
+    params: list = [course_id]
+    if cursor:
+        created_at, batch_id = decode_cursor(cursor)
+        clauses.append("(created_at, batch_id) < (?, ?)")
+        params.extend([created_at, batch_id])
+    # SQLite 中 LIMIT -1 表示不限制
+    page_size = -1 if limit is None else limit + 1
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            "SELECT batch_id, title, created_at, exercise_count FROM exercise_batches "
+            f"WHERE {' AND '.join(clauses)} "
+            "ORDER BY created_at DESC, batch_id DESC LIMIT ?",
+            (*params, page_size),
+        ).fetchall()
+    finally:
+        conn.close()
+    batches = [
+        {
+            "batch_id": row["batch_id"],
+            "title": row["title"],
+            "created_at": row["created_at"],
+            "count": row["exercise_count"],
+        }
+        for row in rows
+    ]
+    next_cursor = None
+    if limit is not None and len(batches) > limit:
+        batches = batches[:limit]
+        next_cursor = encode_cursor(batches[-1]["created_at"], batches[-1]["batch_id"])
+    return batches, next_cursor
 
 
 def get_exercise_batch(course_id: str, batch_id: str) -> dict | None:
@@ -160,6 +446,7 @@ def update_exercise_batch(course_id: str, batch_id: str, title: str | None = Non
                 os.remove(legacy_path)
             except OSError:
                 pass
+        _reindex_batch(course_id, batch_id, payload)
         return payload
     
     with open(file_path, "r", encoding="utf-8") as f:
@@ -174,6 +461,7 @@ def update_exercise_batch(course_id: str, batch_id: str, title: str | None = Non
     
     with open(file_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    _reindex_batch(course_id, batch_id, data)
     
     return data
 
@@ -196,12 +484,11 @@ def delete_exercise_batch(course_id: str, batch_id: str) -> bool:
             deleted = True
         except OSError:
             pass
+    _reindex_batch(course_id, batch_id, None)
     return deleted
 
 
 def _get_saved_knowledge_points(course_id: str) -> list[str]:
-    from ..db import get_connection
-
     conn = get_connection()
     rows = conn.execute(
         "SELECT point FROM knowledge_points WHERE course_id = ? ORDER BY created_at ASC",
@@ -231,15 +518,18 @@ def _normalize_boolean(value: object) -> bool | None:
     return None
 
 
-def generate_exercises(
-    course_id: str,
-    count: int,
-    types: list[str],
-    difficulty: str,
-    knowledge_scope: list[str] | None,
-) -> list[dict]:
-    normalized_types = _normalize_types(types)
+def _get_generation_executor() -> ThreadPoolExecutor:
+    global _GENERATION_EXECUTOR
+    with _GENERATION_EXECUTOR_LOCK:
+        if _GENERATION_EXECUTOR is None:
+            _GENERATION_EXECUTOR = ThreadPoolExecutor(
+                max_workers=_generation_concurrency(),
+                thread_name_prefix="exercise-generation",
+            )
+        return _GENERATION_EXECUTOR
+
 
+def _resolve_knowledge_points(course_id: str, knowledge_scope: list[str] | None, count: int) -> list[str]:
     # 优先使用用户提交的范围
     knowledge_points = [item for item in (knowledge_scope or []) if item]
 
@@ -254,83 +544,409 @@ def generate_exercises(
     # 万能兜底
     if not knowledge_points:
         knowledge_points = ["核心知识点"]
+    return knowledge_points
+
+
+def _prefetch_retrieval(
+    course_id: str,
+    knowledge_points: list[str],
+    retrieval_context: RetrievalContext | None = None,
+) -> dict[str, list[dict]]:
+    """Retrieve context once per distinct knowledge point, concurrently.
+
+    Points already covered by ``retrieval_context`` reuse those chunks; only the
+    uncovered ones are searched, and their results are recorded back.
+    """
+    retrieval: dict[str, list[dict]] = {}
+    pending: list[str] = []
+    for point in dict.fromkeys(knowledge_points):
+        covered = retrieval_context.covering(course_id, point, 2) if retrieval_context else []
+        if covered:
+            retrieval[point] = covered
+        else:
+            pending.append(point)
+    if not pending:
+        return retrieval
+    search = retrieval_context.search if retrieval_context else search_documents
+    if len(pending) == 1:
+        retrieval[pending[0]] = search(course_id, pending[0], 2)
+        return retrieval
+    executor = _get_generation_executor()
+    futures = {point: executor.submit(search, course_id, point, 2) for point in pending}
+    retrieval.update({point: future.result() for point, future in futures.items()})
+    return retrieval
+
+
+def _build_placeholder_exercise(
+    course_id: str,
+    index: int,
+    exercise_type: str,
+    knowledge_point: str,
+    difficulty: str,
+    results: list[dict],
+) -> dict:
+    chunk_id = f"chunk_{index + 1:03d}"
+    source_chunks = (
+        [result.get("chunk_id", chunk_id) for result in results[:1]] or [chunk_id]
+    )
+    exercise = {
+        "exercise_id": generate_id("ex"),
+        "course_id": course_id,
+        "type": exercise_type,
+        "question": f"关于“{knowledge_point}”的描述，哪一项最准确？",
+        "knowledge_points": [knowledge_point],
+        "source_chunks": source_chunks,
+        "difficulty": difficulty,
+    }
+
+    if exercise_type == "single_choice":
+        exercise.update(
+            {
+                "options": [
+                    {"key": "A", "text": f"{knowledge_point}是固定不变的规则。"},
+                    {"key": "B", "text": f"{knowledge_point}用于定义核心概念或约束。"},
+                    {"key": "C", "text": f"{knowledge_point}仅用于性能优化。"},
+                    {"key": "D", "text": f"{knowledge_point}与课程无直接关系。"},
+                ],
+                "answer": "B",
+                "analysis": "占位解析：基于课程知识库的核心概念进行归纳。",
+            }
+        )
+    elif exercise_type == "true_false":
+        exercise.update(
+            {
+                "answer": True,
+                "analysis": "占位解析：该说法与知识点核心定义一致。",
+            }
+        )
+    elif exercise_type == "short_answer":
+        exercise.update(
+            {
+                "answer": f"{knowledge_point}用于说明课程中的关键概念与应用场景。",
+                "rubric": [
+                    {"point": f"说明{knowledge_point}的定义或作用", "score": 0.6},
+                    {"point": "结合课程场景举例", "score": 0.4},
+                ],
+            }
+        )
+    elif exercise_type == "fill_in_blank":
+        exercise.update(
+            {
+                "question": f"____的定义是指{knowledge_point}中最核心的基础概念。",
+                "blanks": [
+                    {"index": 1, "answer": knowledge_point, "alternatives": []},
+                ],
+                "analysis": f'本题考查的关键术语是"{knowledge_point}"。',
+            }
+        )
+    return exercise
+
+
+def _complete_with_model(exercise: dict, difficulty: str, results: list[dict]) -> dict:
+    """Fill ``exercise`` from the model; keeps the placeholder on any failure."""
+    exercise_type = exercise["type"]
+    _GENERATION_RATE_LIMITER.acquire(_generation_rate_per_second())
+    model_payload = _generate_with_model(
+        exercise_type,
+        exercise["knowledge_points"][0],
+        difficulty,
+        results,
+    )
+    source = "placeholder"
+    if model_payload:
+        _apply_model_payload(exercise, exercise_type, model_payload)
+        source = "model"
+    _EXERCISES_GENERATED.inc(type=exercise_type, source=source)
+    return exercise
+
+
+def _complete_batch_with_model(exercises: list[dict], difficulty: str, results: list[dict]) -> list[dict]:
+    """Generate several questions of one knowledge point in a single call.
+
+    Returned items are matched to the requested slots by type in order. Slots whose
+    item is missing or fails the schema check fall back to a single-question call.
+    """
+    _GENERATION_RATE_LIMITER.acquire(_generation_rate_per_second())
+    exercise_types = [exercise["type"] for exercise in exercises]
+    items = _generate_batch_with_model(
+        exercise_types,
+        exercises[0]["knowledge_points"][0],
+        difficulty,
+        results,
+    ) or []
+
+    by_type: dict[str, list[dict]] = {}
+    for position, item in enumerate(items):
+        # 模型漏写 type 时按位置推断
+        item_type = item.get("type") or (exercise_types[position] if position < len(exercise_types) else "")
+        by_type.setdefault(str(item_type), []).append(item)
+
+    completed = []
+    for exercise in exercises:
+        exercise_type = exercise["type"]
+        candidates = by_type.get(exercise_type, [])
+        payload = next((item for item in candidates if _is_valid_model_payload(exercise_type, item)), None)
+        if payload is None:
+            completed.append(_complete_with_model(exercise, difficulty, results))
+            continue
+        candidates.remove(payload)
+        _apply_model_payload(exercise, exercise_type, payload)
+        _EXERCISES_GENERATED.inc(type=exercise_type, source="model_batch")
+        completed.append(exercise)
+    return completed
+
+
+def _complete_group(
+    exercises: list[dict],
+    difficulty: str,
+    results: list[dict],
+) -> list[dict]:
+    if len(exercises) > 1:
+        return _complete_batch_with_model(exercises, difficulty, results)
+    return [_complete_with_model(exercises[0], difficulty, results)]
+
+
+def _batch_prompt_enabled() -> bool:
+    value = os.getenv("EXERCISE_GENERATION_BATCHED", "false").strip().lower()
+    return value in {"1", "true", "yes"}
+
+
+def _questions_per_call() -> int:
+    return max(1, int(os.getenv("EXERCISE_BATCH_QUESTIONS_PER_CALL", "5")))
+
+
+def _bank_reuse_enabled() -> bool:
+    # 默认关闭：未显式要求时始终生成新题，不改变原有出题行为
+    return os.getenv("EXERCISE_BANK_REUSE", "false").strip().lower() in {"1", "true", "yes"}
+
+
+def _take_from_bank(course_id: str, plan: list[tuple[str, str]], difficulty: str) -> dict[int, dict]:
+    """Fill plan slots from the question bank; returns {slot index: exercise}."""
+    slots: dict[tuple[str, str], list[int]] = {}
+    for index, key in enumerate(plan):
+        slots.setdefault(key, []).append(index)
+    reused: dict[int, dict] = {}
+    for (exercise_type, knowledge_point), indexes in slots.items():
+        stored = question_bank.take_questions(
+            course_id, knowledge_point, exercise_type, difficulty, len(indexes)
+        )
+        for index, exercise in zip(indexes, stored):
+            # 新批次中的题目使用新 id，避免与原批次在 exercise_index 中互相覆盖
+            reused[index] = {**exercise, "exercise_id": generate_id("ex"), "course_id": course_id}
+    return reused
+
+
+def iter_generated_exercises(
+    course_id: str,
+    count: int,
+    types: list[str],
+    difficulty: str,
+    knowledge_scope: list[str] | None,
+    batched: bool | None = None,
+    reuse_bank: bool | None = None,
+    retrieval_context: RetrievalContext | None = None,
+) -> Iterator[tuple[int, dict]]:
+    """Yield ``(index, exercise)`` pairs as each exercise becomes ready.
+
+    Retrieval runs once per distinct knowledge point; model calls run concurrently
+    on the shared generation pool under the global rate limit, so pairs arrive in
+    completion order. ``index`` is the position in the requested set.
+
+    With ``batched`` (default: ``EXERCISE_GENERATION_BATCHED``) the questions of one
+    knowledge point are requested together, up to ``EXERCISE_BATCH_QUESTIONS_PER_CALL``
+    per call, so its context is sent once instead of once per question.
+
+    With ``reuse_bank`` (default: ``EXERCISE_BANK_REUSE``) slots are first filled from
+    the course question bank (same knowledge point, type and difficulty, least used
+    first); only the remaining slots are retrieved for and sent to the model.
+
+    ``retrieval_context`` shares chunks already retrieved earlier in the same agent
+    run, so only knowledge points it does not cover are searched again.
+    """
+    if batched is None:
+        batched = _batch_prompt_enabled()
+    if reuse_bank is None:
+        reuse_bank = _bank_reuse_enabled()
+    normalized_types = _normalize_types(types)
+    knowledge_points = _resolve_knowledge_points(course_id, knowledge_scope, count)
 
     type_cycle = cycle(normalized_types)
     knowledge_cycle = cycle(knowledge_points)
+    plan = [(next(type_cycle), next(knowledge_cycle)) for _ in range(count)]
+    reused = _take_from_bank(course_id, plan, difficulty) if reuse_bank else {}
+    retrieval = _prefetch_retrieval(
+        course_id,
+        [point for index, (_, point) in enumerate(plan) if index not in reused],
+        retrieval_context,
+    )
 
-    generated: list[dict] = []
-    for index in range(count):
-        exercise_type = next(type_cycle)
-        knowledge_point = next(knowledge_cycle)
-        chunk_id = f"chunk_{index + 1:03d}"
-        results = search_documents(course_id, knowledge_point, top_k=2)
-        source_chunks = (
-            [result.get("chunk_id", chunk_id) for result in results[:1]] or [chunk_id]
+    use_model = is_dashscope_configured()
+    ready: list[tuple[int, dict]] = []
+    # 每组共享同一知识点的检索结果，作为一次模型任务提交
+    groups: list[list[tuple[int, dict]]] = []
+    open_groups: dict[str, list[tuple[int, dict]]] = {}
+    group_size = _questions_per_call() if batched else 1
+    for index, (exercise_type, knowledge_point) in enumerate(plan):
+        if index in reused:
+            _EXERCISES_GENERATED.inc(type=exercise_type, source="bank")
+            ready.append((index, reused[index]))
+            continue
+        results = retrieval.get(knowledge_point) or []
+        exercise = _build_placeholder_exercise(
+            course_id, index, exercise_type, knowledge_point, difficulty, results
         )
-        exercise = {
-            "exercise_id": generate_id("ex"),
-            "course_id": course_id,
-            "type": exercise_type,
-            "question": f"关于“{knowledge_point}”的描述，哪一项最准确？",
-            "knowledge_points": [knowledge_point],
-            "source_chunks": source_chunks,
-            "difficulty": difficulty,
-        }
+        if not (use_model and results):
+            _EXERCISES_GENERATED.inc(type=exercise_type, source="placeholder")
+            ready.append((index, exercise))
+            continue
+        group = open_groups.get(knowledge_point)
+        if group is None or len(group) >= group_size:
+            group = []
+            open_groups[knowledge_point] = group
+            groups.append(group)
+        group.append((index, exercise))
+
+    futures = {
+        _get_generation_executor().submit(
+            _complete_group,
+            [exercise for _, exercise in group],
+            difficulty,
+            retrieval[group[0][1]["knowledge_points"][0]],
+        ): group
+        for group in groups
+    }
+    try:
+        yield from ready
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                completed = future.result()
+            except Exception:
+                logger.warning(
+                    "Exercise generation failed for items %s",
+                    [index for index, _ in group],
+                    exc_info=True,
+                )
+                for _, exercise in group:
+                    _EXERCISES_GENERATED.inc(type=exercise["type"], source="placeholder")
+                completed = [exercise for _, exercise in group]
+            for (index, _), exercise in zip(group, completed):
+                yield index, exercise
+    finally:
+        # 调用方提前停止迭代（如流式连接断开）时，取消尚未开始的调用
+        for future in futures:
+            future.cancel()
 
-        if exercise_type == "single_choice":
-            exercise.update(
-                {
-                    "options": [
-                        {"key": "A", "text": f"{knowledge_point}是固定不变的规则。"},
-                        {"key": "B", "text": f"{knowledge_point}用于定义核心概念或约束。"},
-                        {"key": "C", "text": f"{knowledge_point}仅用于性能优化。"},
-                        {"key": "D", "text": f"{knowledge_point}与课程无直接关系。"},
-                    ],
-                    "answer": "B",
-                    "analysis": "占位解析：基于课程知识库的核心概念进行归纳。",
-                }
-            )
-        elif exercise_type == "true_false":
-            exercise.update(
-                {
-                    "answer": True,
-                    "analysis": "占位解析：该说法与知识点核心定义一致。",
-                }
-            )
-        elif exercise_type == "short_answer":
-            exercise.update(
-                {
-                    "answer": f"{knowledge_point}用于说明课程中的关键概念与应用场景。",
-                    "rubric": [
-                        {"point": f"说明{knowledge_point}的定义或作用", "score": 0.6},
-                        {"point": "结合课程场景举例", "score": 0.4},
-                    ],
-                }
-            )
-        elif exercise_type == "fill_in_blank":
-            exercise.update(
-                {
-                    "question": f"____的定义是指{knowledge_point}中最核心的基础概念。",
-                    "blanks": [
-                        {"index": 1, "answer": knowledge_point, "alternatives": []},
-                    ],
-                    "analysis": f'本题考查的关键术语是"{knowledge_point}"。',
-                }
-            )
 
-        if is_dashscope_configured() and results:
-            model_payload = _generate_with_model(
-                exercise_type,
-                knowledge_point,
-                difficulty,
-                results,
-            )
-            if model_payload:
-                _apply_model_payload(exercise, exercise_type, model_payload)
+def generate_exercises(
+    course_id: str,
+    count: int,
+    types: list[str],
+    difficulty: str,
+    knowledge_scope: list[str] | None,
+    batched: bool | None = None,
+    reuse_bank: bool | None = None,
+    retrieval_context: RetrievalContext | None = None,
+    cancel_event: threading.Event | None = None,
+) -> list[dict]:
+    """Generate ``count`` exercises in request order.
+
+    Once ``cancel_event`` is set, collection stops at the next finished exercise
+    and model calls that have not started yet are cancelled.
+    """
+    generated: list[dict | None] = [None] * count
+    exercises = iter_generated_exercises(
+        course_id,
+        count,
+        types,
+        difficulty,
+        knowledge_scope,
+        batched=batched,
+        reuse_bank=reuse_bank,
+        retrieval_context=retrieval_context,
+    )
+    try:
+        for index, exercise in exercises:
+            generated[index] = exercise
+            if cancel_event is not None and cancel_event.is_set():
+                break
+    finally:
+        exercises.close()
+    return [exercise for exercise in generated if exercise is not None]
+
+
+_TYPE_PROMPTS = {
+    "single_choice": (
+        "题型：单选题。字段：question, options(含key/text), answer, analysis。"
+        "options 需包含 A/B/C/D 四项。"
+    ),
+    "true_false": "题型：判断题。字段：question, answer(true/false), analysis。",
+    "short_answer": (
+        "题型：简答题。字段：question, answer, rubric(数组包含point与score)。"
+    ),
+    "fill_in_blank": (
+        "题型：填空题。字段：question, blanks, analysis。"
+        "question 中用连续四个下划线 ____ 标记空位。"
+        "要求：空位必须是该知识点的核心术语、专有名词、关键定义或重要概念，"
+        "不要挖出动词、介词、形容词等普通词汇。"
+        "题目的上下文应提供充足线索，让学过该知识点的学生能够推断出答案。"
+        "优先出 1 个空的题目，最多不超过 2 个空。"
+        "blanks 是数组，每项包含 index(从1开始的空位序号)、answer(标准答案)、"
+        "alternatives(可接受的替代答案数组，如同义术语、英文名、常用缩写等)。"
+    ),
+}
+
+
+def _format_retrieval_context(results: list[dict]) -> str:
+    return "\n\n".join(
+        f"[{idx}] {result.get('title_path', '')}\n{result.get('content', '')}"
+        for idx, result in enumerate(results, start=1)
+    )
+
 
-        generated.append(exercise)
+def _format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    return generated
+
+def stream_exercise_events(
+    course_id: str,
+    count: int,
+    types: list[str],
+    difficulty: str,
+    knowledge_scope: list[str] | None,
+    batched: bool | None = None,
+    reuse_bank: bool | None = None,
+) -> Iterator[str]:
+    """SSE stream over ``iter_generated_exercises``.
+
+    Events: ``start`` {total}; per exercise ``exercise`` {index, exercise} followed by
+    ``progress`` {completed, total}; ``error`` {message} if generation aborts; and a
+    final ``done`` {count, exercise_ids} with ids in the requested order.
+    """
+    yield _format_sse("start", {"total": count})
+    exercise_ids: list[str | None] = [None] * count
+    completed = 0
+    try:
+        for index, exercise in iter_generated_exercises(
+            course_id,
+            count,
+            types,
+            difficulty,
+            knowledge_scope,
+            batched=batched,
+            reuse_bank=reuse_bank,
+        ):
+            exercise_ids[index] = exercise["exercise_id"]
+            completed += 1
+            yield _format_sse("exercise", {"index": index, "exercise": exercise})
+            yield _format_sse("progress", {"completed": completed, "total": count})
+    except Exception:
+        logger.exception("Streaming exercise generation failed for course %s", course_id)
+        yield _format_sse("error", {"message": "题目生成中断，已返回的题目仍可使用。"})
+    yield _format_sse(
+        "done",
+        {"count": completed, "exercise_ids": [item for item in exercise_ids if item]},
+    )
 
 
 def _build_prompt(
@@ -339,37 +955,13 @@ def _build_prompt(
     difficulty: str,
     results: list[dict],
 ) -> tuple[str, str]:
-    context_lines = []
-    for idx, result in enumerate(results, start=1):
-        context_lines.append(
-            f"[{idx}] {result.get('title_path', '')}\n{result.get('content', '')}"
-        )
     base_prompt = (
         "你是教学出题助手，请根据知识点与检索内容生成一道题目。"
         "返回严格 JSON，不要包含多余文本。"
     )
-    type_prompt = {
-        "single_choice": (
-            "题型：单选题。字段：question, options(含key/text), answer, analysis。"
-            "options 需包含 A/B/C/D 四项。"
-        ),
-        "true_false": "题型：判断题。字段：question, answer(true/false), analysis。",
-        "short_answer": (
-            "题型：简答题。字段：question, answer, rubric(数组包含point与score)。"
-        ),
-        "fill_in_blank": (
-            "题型：填空题。字段：question, blanks, analysis。"
-            "question 中用连续四个下划线 ____ 标记空位。"
-            "要求：空位必须是该知识点的核心术语、专有名词、关键定义或重要概念，"
-            "不要挖出动词、介词、形容词等普通词汇。"
-            "题目的上下文应提供充足线索，让学过该知识点的学生能够推断出答案。"
-            "优先出 1 个空的题目，最多不超过 2 个空。"
-            "blanks 是数组，每项包含 index(从1开始的空位序号)、answer(标准答案)、"
-            "alternatives(可接受的替代答案数组，如同义术语、英文名、常用缩写等)。"
-        ),
-    }.get(exercise_type, "")
-
-    context = "\n\n".join(context_lines)
+    type_prompt = _TYPE_PROMPTS.get(exercise_type, "")
+
+    context = _format_retrieval_context(results)
     user_prompt = (
         f"难度：{difficulty}\n知识点：{knowledge_point}\n\n检索资料：\n{context}"
     )
@@ -396,7 +988,8 @@ def _generate_with_model(
     ]
     
     try:
-        response = llm.invoke(messages)
+        with metrics.track_llm_call("exercise_generation"):
+            response = llm.invoke(messages)
         text = getattr(response, "content", str(response))
         if not text:
             return None
@@ -405,6 +998,82 @@ def _generate_with_model(
         return None
 
 
+def _build_batch_prompt(
+    exercise_types: list[str],
+    knowledge_point: str,
+    difficulty: str,
+    results: list[dict],
+) -> tuple[str, str]:
+    type_specs = "\n".join(_TYPE_PROMPTS[t] for t in dict.fromkeys(exercise_types) if t in _TYPE_PROMPTS)
+    system_prompt = (
+        f"你是教学出题助手，请根据知识点与检索内容一次生成 {len(exercise_types)} 道题目，"
+        "题目之间考查角度不要重复。"
+        '返回严格 JSON，格式为 {"exercises": [...]}，数组元素按要求的顺序排列，'
+        "每个元素额外包含 type 字段标明题型，不要包含多余文本。\n"
+        f"{type_specs}"
+    )
+    user_prompt = (
+        f"难度：{difficulty}\n知识点：{knowledge_point}\n"
+        f"题型顺序：{', '.join(exercise_types)}\n\n"
+        f"检索资料：\n{_format_retrieval_context(results)}"
+    )
+    return system_prompt, user_prompt
+
+
+def _generate_batch_with_model(
+    exercise_types: list[str],
+    knowledge_point: str,
+    difficulty: str,
+    results: list[dict],
+) -> list[dict] | None:
+    llm = get_chat_model()
+    if not llm:
+        return None
+    system_prompt, user_prompt = _build_batch_prompt(
+        exercise_types, knowledge_point, difficulty, results
+    )
+    messages = [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=user_prompt),
+    ]
+    try:
+        with metrics.track_llm_call("exercise_generation_batch"):
+            response = llm.invoke(messages)
+        text = getattr(response, "content", str(response))
+        if not text:
+            return None
+        payload = parse_json_payload(text)
+    except Exception:
+        return None
+    items = payload.get("exercises") if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        return None
+    return [item for item in items if isinstance(item, dict)]
+
+
+def _is_valid_model_payload(exercise_type: str, payload: dict) -> bool:
+    """Schema check for one model-generated item before it replaces the placeholder."""
+    question = payload.get("question")
+    if not isinstance(question, str) or not question.strip():
+        return False
+    if exercise_type == "single_choice":
+        options = payload.get("options")
+        return (
+            isinstance(options, list)
+            and len([item for item in options if isinstance(item, dict)]) >= 2
+            and isinstance(payload.get("answer"), str)
+        )
+    if exercise_type == "true_false":
+        return _normalize_boolean(payload.get("answer")) is not None
+    if exercise_type == "short_answer":
+        answer = payload.get("answer")
+        return isinstance(answer, str) and bool(answer.strip())
+    if exercise_type == "fill_in_blank":
+        blanks = payload.get("blanks")
+        return "____" in question and isinstance(blanks, list) and bool(blanks)
+    return False
+
+
 def _build_short_answer_grading_prompt(
     question: str,
     answer: str,
@@ -444,7 +1113,8 @@ def _grade_short_answer_with_llm(
         HumanMessage(content=user_prompt),
     ]
     try:
-        response = llm.invoke(messages)
+        with metrics.track_llm_call("short_answer_grading"):
+            response = llm.invoke(messages)
         text = getattr(response, "content", str(response))
         if not text:
             return None
@@ -518,34 +1188,77 @@ def _apply_model_payload(exercise: dict, exercise_type: str, payload: dict) -> N
 
 
 def grade_exercise(payload: dict) -> dict:
+    # 通过 exercise_index 按 id 取出题目，获取标准答案
+    stored = find_exercise(payload.get("course_id", ""), payload.get("exercise_id", ""))
+    return _grade_with_stored(payload, stored or {})
+
+
+def _get_grading_executor() -> ThreadPoolExecutor:
+    global _GRADING_EXECUTOR
+    with _GRADING_EXECUTOR_LOCK:
+        if _GRADING_EXECUTOR is None:
+            _GRADING_EXECUTOR = ThreadPoolExecutor(
+                max_workers=_grading_concurrency(),
+                thread_name_prefix="exercise-grading",
+            )
+        return _GRADING_EXECUTOR
+
+
+def shutdown_executors() -> None:
+    global _GRADING_EXECUTOR, _GENERATION_EXECUTOR
+    with _GRADING_EXECUTOR_LOCK:
+        if _GRADING_EXECUTOR is not None:
+            _GRADING_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            _GRADING_EXECUTOR = None
+    with _GENERATION_EXECUTOR_LOCK:
+        if _GENERATION_EXECUTOR is not None:
+            _GENERATION_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            _GENERATION_EXECUTOR = None
+
+
+def _needs_llm_grading(submission: dict) -> bool:
+    answer = submission.get("answer")
+    return (
+        submission.get("type") == "short_answer"
+        and answer is not None
+        and bool(str(answer).strip())
+        and is_dashscope_configured()
+    )
+
+
+def grade_exercises(course_id: str, submissions: list[dict]) -> list[dict]:
+    """Grade a whole quiz submission; results keep the order of ``submissions``.
+
+    Reference answers are fetched in one index query. Objective items are graded
+    inline, and short answers that need the LLM are scored concurrently on a bounded
+    shared pool, so wall time is roughly one LLM call.
+    """
+    stored = find_exercises(course_id, [item.get("exercise_id", "") for item in submissions])
+    payloads = [{**item, "course_id": course_id} for item in submissions]
+
+    results: list[dict | None] = [None] * len(payloads)
+    futures = {}
+    for index, payload in enumerate(payloads):
+        reference = stored.get(payload.get("exercise_id", ""), {})
+        if _needs_llm_grading(payload):
+            futures[index] = _get_grading_executor().submit(_grade_with_stored, payload, reference)
+        else:
+            results[index] = _grade_with_stored(payload, reference)
+    for index, future in futures.items():
+        results[index] = future.result()
+    return results  # type: ignore[return-value]
+
+
+def _grade_with_stored(payload: dict, stored: dict) -> dict:
     exercise_type = payload.get("type")
     exercise_id = payload.get("exercise_id", "")
-    course_id = payload.get("course_id", "")
     student_answer = payload.get("answer")
+    _EXERCISE_GRADINGS.inc(type=str(exercise_type))
 
-    # 尝试从该课程的所有批次中找到这道题，以获取标准答案
-    correct_answer = None
-    rubric = None
-    question = None
-    knowledge_points_found: list[str] = []
-    dir_path = os.path.join(_EXERCISE_ROOT, course_id)
-    if os.path.exists(dir_path):
-        for filename in os.listdir(dir_path):
-            if filename.endswith(".json"):
-                try:
-                    with open(os.path.join(dir_path, filename), "r", encoding="utf-8") as f:
-                        batch_data = json.load(f)
-                        for ex in batch_data.get("exercises", []):
-                            if ex.get("exercise_id") == exercise_id:
-                                correct_answer = ex.get("answer")
-                                rubric = ex.get("rubric")
-                                question = ex.get("question")
-                                knowledge_points_found = ex.get("knowledge_points", [])
-                                break
-                except Exception:
-                    continue
-            if correct_answer is not None:
-                break
+    correct_answer = stored.get("answer")
+    rubric = stored.get("rubric")
+    question = stored.get("question")
+    knowledge_points_found: list[str] = stored.get("knowledge_points", [])
 
     if exercise_type == "single_choice":
         expected = str(correct_answer).strip().upper() if correct_answer else "B"
@@ -583,23 +1296,7 @@ def grade_exercise(payload: dict) -> dict:
         }
 
     if exercise_type == "fill_in_blank":
-        blanks = None
-        # Re-scan for blanks from exercise data
-        if os.path.exists(dir_path):
-            for filename in os.listdir(dir_path):
-                if not filename.endswith(".json"):
-                    continue
-                try:
-                    with open(os.path.join(dir_path, filename), "r", encoding="utf-8") as f:
-                        batch_data = json.load(f)
-                        for ex in batch_data.get("exercises", []):
-                            if ex.get("exercise_id") == exercise_id:
-                                blanks = ex.get("blanks")
-                                break
-                except Exception:
-                    continue
-                if blanks is not None:
-                    break
+        blanks = stored.get("blanks")
 
         if not blanks:
             return {
@@ -0,0 +1,209 @@
+"""对话历史的 token 预算管理与滚动摘要。
+
+每轮问答送入模型的历史 = 对话摘要（≤ SUMMARY_TOKEN_BUDGET）+ 预算内的最近消息
+（≤ RAG_HISTORY_TOKEN_BUDGET）。放不进预算的较早消息由后台线程压缩进
+``conversations.summary``，``summary_upto`` 记录已并入摘要的最后一条消息时间；
+压缩滞后时超出预算的消息也只是暂不入 prompt，因此单轮 prompt 始终有界。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from .. import metrics
+from ..db import get_connection
+from ..utils import estimate_tokens
+from .langchain_client import get_chat_model, is_dashscope_configured
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "【此前对话摘要】"
+SUMMARY_TOKEN_BUDGET = 400
+MAX_MESSAGE_TOKENS = 600
+# 每轮最多从库里取这么多条未摘要消息，再按 token 预算截取
+HISTORY_FETCH_LIMIT = 20
+
+_COMPACTION_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-compact")
+_IN_FLIGHT: set[str] = set()
+_IN_FLIGHT_LOCK = threading.Lock()
+
+_COMPACTIONS = metrics.counter(
+    "conversation_compactions_total",
+    "Rolling summary compactions by outcome (llm / extractive / skipped / error).",
+    labelnames=("outcome",),
+)
+
+
+def history_token_budget() -> int:
+    return max(0, int(os.getenv("RAG_HISTORY_TOKEN_BUDGET", "1500")))
+
+
+@dataclass
+class HistoryWindow:
+    messages: list[dict] = field(default_factory=list)
+    # True 表示本轮有未摘要的消息因预算被挤出窗口，DashScope 复用的 thread 需重建
+    truncated: bool = False
+    # 窗口所用摘要的截止时间；与 thread 建立时不同说明摘要已更新，thread 同样需重建
+    summary_upto: str = ""
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cut ``text`` so that ``estimate_tokens`` stays within ``budget``."""
+    if estimate_tokens(text) <= budget:
+        return text
+    used = 0.0
+    for index, ch in enumerate(text):
+        used += 1.0 if "\u4e00" <= ch <= "\u9fff" else 0.25
+        if used > budget:
+            return text[:index].rstrip() + "…"
+    return text
+
+
+def build_window(
+    conversation: dict | None,
+    recent: list[dict],
+    fetch_limit: int | None = None,
+) -> HistoryWindow:
+    """Fit summary + newest messages into the token budget and schedule compaction.
+
+    ``recent`` holds the unsummarised messages, oldest first, as returned by
+    ``memory_store.begin_turn``. ``fetch_limit`` is the LIMIT used to load them.
+    When exactly that many came back, older unsummarised messages may exist, so
+    compaction is scheduled as well.
+    """
+    budget = history_token_budget()
+    summary = (conversation or {}).get("summary") or ""
+
+    kept: list[dict] = []
+    used = 0
+    for message in reversed(recent):
+        content = truncate_to_tokens(message.get("content", ""), MAX_MESSAGE_TOKENS)
+        cost = estimate_tokens(content)
+        if used + cost > budget:
+            break
+        kept.append({**message, "content": content})
+        used += cost
+    kept.reverse()
+
+    evicted = len(recent) - len(kept) > 0
+    needs_compaction = evicted or (fetch_limit is not None and len(recent) >= fetch_limit)
+    if conversation and needs_compaction and kept:
+        schedule_compaction(conversation["id"], kept[0]["created_at"])
+    elif conversation and needs_compaction and recent:
+        schedule_compaction(conversation["id"], recent[-1]["created_at"])
+
+    messages: list[dict] = []
+    if summary:
+        messages.append({"role": "assistant", "content": f"{SUMMARY_PREFIX}{summary}"})
+    messages.extend(kept)
+    return HistoryWindow(
+        messages=messages,
+        truncated=evicted,
+        summary_upto=(conversation or {}).get("summary_upto") or "",
+    )
+
+
+def schedule_compaction(conversation_id: str, cutoff: str) -> None:
+    """Fold messages older than ``cutoff`` into the stored summary in the background."""
+    with _IN_FLIGHT_LOCK:
+        if conversation_id in _IN_FLIGHT:
+            return
+        _IN_FLIGHT.add(conversation_id)
+    _COMPACTION_EXECUTOR.submit(_compact_safely, conversation_id, cutoff)
+
+
+def _compact_safely(conversation_id: str, cutoff: str) -> None:
+    try:
+        compact_conversation(conversation_id, cutoff)
+    except Exception:
+        _COMPACTIONS.inc(outcome="error")
+        logger.exception("History compaction failed for %s", conversation_id)
+    finally:
+        with _IN_FLIGHT_LOCK:
+            _IN_FLIGHT.discard(conversation_id)
+
+
+def compact_conversation(conversation_id: str, cutoff: str) -> bool:
+    """Merge messages in ``(summary_upto, cutoff)`` into the summary; returns True if updated."""
+    conn = get_connection()
+    try:
+        conv = conn.execute(
+            "SELECT summary, summary_upto FROM conversations WHERE id = ?",
+            (conversation_id,),
+        ).fetchone()
+        if not conv:
+            return False
+        previous_upto = conv["summary_upto"] or ""
+        rows = conn.execute(
+            "SELECT role, content, created_at FROM messages "
+            "WHERE conversation_id = ? AND created_at > ? AND created_at < ? "
+            "ORDER BY created_at ASC",
+            (conversation_id, previous_upto, cutoff),
+        ).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        _COMPACTIONS.inc(outcome="skipped")
+        return False
+
+    summary, outcome = _summarize(conv["summary"] or "", [dict(row) for row in rows])
+    conn = get_connection()
+    try:
+        # 乐观并发：只有 summary_upto 未被其他进程推进时才写入
+        cursor = conn.execute(
+            "UPDATE conversations SET summary = ?, summary_upto = ? "
+            "WHERE id = ? AND COALESCE(summary_upto, '') = ?",
+            (summary, rows[-1]["created_at"], conversation_id, previous_upto),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    _COMPACTIONS.inc(outcome=outcome if cursor.rowcount else "skipped")
+    return cursor.rowcount > 0
+
+
+def _format_transcript(messages: list[dict]) -> str:
+    lines = []
+    for msg in messages:
+        role_label = "用户" if msg["role"] == "user" else "助手"
+        lines.append(f"{role_label}：{truncate_to_tokens(msg['content'], MAX_MESSAGE_TOKENS)}")
+    return "\n".join(lines)
+
+
+def _summarize(previous: str, messages: list[dict]) -> tuple[str, str]:
+    transcript = _format_transcript(messages)
+    if is_dashscope_configured():
+        llm = get_chat_model()
+        if llm:
+            system_prompt = (
+                "你是对话摘要助手。将已有摘要与新增对话合并为一段简洁的中文摘要，"
+                "保留学生关心的知识点、已给出的关键结论和尚未解决的疑问，"
+                f"不超过 {SUMMARY_TOKEN_BUDGET} 字，只输出摘要正文。"
+            )
+            user_prompt = f"已有摘要：\n{previous or '（无）'}\n\n新增对话：\n{transcript}"
+            try:
+                with metrics.track_llm_call("history_summary"):
+                    response = llm.invoke(
+                        [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
+                    )
+                text = str(getattr(response, "content", response) or "").strip()
+                if text:
+                    return truncate_to_tokens(text, SUMMARY_TOKEN_BUDGET), "llm"
+            except Exception:
+                logger.warning("LLM summary failed, falling back to extractive", exc_info=True)
+
+    # 无模型时的抽取式摘要：保留每条提问与回答开头，整体截断到预算内（新内容优先）
+    snippets = [
+        f"{'问' if msg['role'] == 'user' else '答'}：{truncate_to_tokens(msg['content'], 40)}"
+        for msg in messages
+    ]
+    lines = ([previous] if previous else []) + snippets
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > SUMMARY_TOKEN_BUDGET:
+        lines.pop(0)
+    return truncate_to_tokens("\n".join(lines), SUMMARY_TOKEN_BUDGET), "extractive"
@@ -23,6 +23,7 @@ try:
 except Exception:
     jieba = None
 
+from .. import metrics, tracing
 from ..utils import generate_id, now_iso
 from .langchain_client import get_chat_model, get_embeddings, get_reranker
 from .rag_utils import _select_mcp_tool
@@ -33,9 +34,18 @@ _DOCUMENT_STORE: dict[str, list[dict]] = defaultdict(list)
 _CHUNK_STORE: dict[str, list[dict]] = defaultdict(list)
 _VECTOR_STORE_CACHE: dict[str, Chroma] = {}
 _BM25_CACHE: dict[str, dict] = {}
+# course_id -> 索引代数；每次增删改分块后递增，供下游缓存判断是否过期
+_INDEX_GENERATION: dict[str, int] = defaultdict(int)
+# course_id -> (索引代数, chunk_id -> chunk)
+_CHUNK_LOOKUP_CACHE: dict[str, tuple[int, dict[str, dict]]] = {}
 _PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
 _INDEX_ROOT = os.path.join(_PROJECT_ROOT, "data", "knowledge-base", "indexes")
 _logger = logging.getLogger(__name__)
+_RETRIEVAL_SECONDS = metrics.histogram(
+    "retrieval_duration_seconds",
+    "search_documents latency by stage (vector / bm25 / rerank / total).",
+    labelnames=("stage",),
+)
 _CONTROL_CHAR_PATTERN = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
 _HEADING_NUMBER_PATTERN = re.compile(r"^(\d+(?:\.\d+)*)\s+(.+)$")
 _HEADING_CN_PATTERN = re.compile(r"^([一二三四五六七八九十]+)、\s*(.+)$")
@@ -105,6 +115,23 @@ def list_documents(course_id: str) -> list[dict]:
     return list(_DOCUMENT_STORE.get(course_id, []))
 
 
+def get_chunks_by_ids(course_id: str, chunk_ids: list[str]) -> dict[str, dict]:
+    """Look up chunks of ``course_id`` by id (used to hydrate stored citations)."""
+    _load_indexes(course_id)
+    generation = get_index_generation(course_id)
+    cached = _CHUNK_LOOKUP_CACHE.get(course_id)
+    if cached is None or cached[0] != generation:
+        lookup = {
+            chunk.get("chunk_id"): chunk
+            for chunk in _CHUNK_STORE.get(course_id, [])
+            if chunk.get("chunk_id")
+        }
+        cached = (generation, lookup)
+        _CHUNK_LOOKUP_CACHE[course_id] = cached
+    lookup = cached[1]
+    return {chunk_id: lookup[chunk_id] for chunk_id in chunk_ids if chunk_id in lookup}
+
+
 def list_document_chunks(course_id: str, doc_id: str) -> list[dict]:
     _load_indexes(course_id)
     chunks = _CHUNK_STORE.get(course_id, [])
@@ -209,10 +236,17 @@ def _should_use_llm_chunking(course_id: str, doc_type: str, override: bool | Non
 
 def _clear_bm25_cache(course_id: str) -> None:
     _BM25_CACHE.pop(course_id, None)
+    _INDEX_GENERATION[course_id] += 1
+
+
+def get_index_generation(course_id: str) -> int:
+    """Return a counter that changes whenever the course's chunks change."""
+    return _INDEX_GENERATION[course_id]
 
 
 def _get_bm25_index(course_id: str) -> dict | None:
     cached = _BM25_CACHE.get(course_id)
+    metrics.record_cache("bm25_index", bool(cached))
     if cached:
         return cached
     chunks = list(_CHUNK_STORE.get(course_id, []))
@@ -551,7 +585,8 @@ def _llm_generate_knowledge_points(
         f"{context}\n"
     )
     try:
-        response = llm.invoke(prompt)
+        with metrics.track_llm_call("knowledge_points"):
+            response = llm.invoke(prompt)
     except Exception:
         _logger.exception("LLM knowledge points generation failed for %s", course_id)
         return []
@@ -743,7 +778,8 @@ def _llm_chunk_text(
         f"{content}\n"
     )
     try:
-        response = chat_model.invoke(prompt)
+        with metrics.track_llm_call("llm_chunking"):
+            response = chat_model.invoke(prompt)
     except Exception:
         _logger.exception("[LLM切分] 模型调用异常，回退规则切分 (doc=%s)", doc_name)
         return []
@@ -1418,12 +1454,24 @@ def search_documents(
     query: str,
     top_k: int,
     filters: dict | None = None,
+    query_embedding: list[float] | None = None,
 ) -> list[dict]:
     _load_indexes(course_id)
     if not query.strip():
         return []
     if not _CHUNK_STORE.get(course_id):
         return []
+    with _RETRIEVAL_SECONDS.time(stage="total"):
+        return _search_documents(course_id, query, top_k, filters, query_embedding)
+
+
+def _search_documents(
+    course_id: str,
+    query: str,
+    top_k: int,
+    filters: dict | None,
+    query_embedding: list[float] | None = None,
+) -> list[dict]:
 
     rerank_enabled = os.getenv("RAG_RERANK_ENABLED", "true").strip().lower() not in {
         "0",
@@ -1450,14 +1498,30 @@ def search_documents(
             filter_payload = {"source_doc_type": {"$in": allowed_types}}
 
     store = _get_vector_store(course_id)
-    try:
-        raw_results = store.similarity_search_with_score(
-            query,
-            k=fetch_k,
-            filter=filter_payload,
-        )
-    except TypeError:
-        raw_results = store.similarity_search_with_score(query, k=fetch_k)
+    with _RETRIEVAL_SECONDS.time(stage="vector"):
+        raw_results = None
+        if query_embedding is not None:
+            # 调用方已计算过问题向量（如语义答案缓存），避免重复请求 embedding
+            try:
+                raw_results = store.similarity_search_by_vector_with_relevance_scores(
+                    query_embedding,
+                    k=fetch_k,
+                    filter=filter_payload,
+                )
+            except (AttributeError, NotImplementedError):
+                # 部分向量库未实现按向量检索：退回按文本检索
+                _logger.debug("Vector store lacks search by vector, falling back to text query")
+        if raw_results is None:
+            metrics.EMBEDDING_REQUESTS.inc(kind="query")
+            metrics.EMBEDDING_TEXTS.inc(kind="query")
+            try:
+                raw_results = store.similarity_search_with_score(
+                    query,
+                    k=fetch_k,
+                    filter=filter_payload,
+                )
+            except TypeError:
+                raw_results = store.similarity_search_with_score(query, k=fetch_k)
 
     chunk_lookup = {chunk.get("chunk_id"): chunk for chunk in _CHUNK_STORE.get(course_id, [])}
     vector_results: dict[str, dict] = {}
@@ -1483,6 +1547,7 @@ def search_documents(
     bm25_pairs: list[tuple[str, float]] = []
     bm25_scores: dict[str, float] = {}
     if bm25_enabled:
+        bm25_started = time.perf_counter()
         bm25_index = _get_bm25_index(course_id)
         query_tokens = _tokenize_text(query)
         if bm25_index and query_tokens:
@@ -1500,6 +1565,7 @@ def search_documents(
             bm25_pairs.sort(key=lambda item: item[1], reverse=True)
             bm25_pairs = bm25_pairs[:fetch_k]
             bm25_scores = {chunk_id: score for chunk_id, score in bm25_pairs}
+        _RETRIEVAL_SECONDS.observe(time.perf_counter() - bm25_started, stage="bm25")
 
     for chunk_id, score in bm25_scores.items():
         if chunk_id in results_map:
@@ -1564,7 +1630,8 @@ def search_documents(
         for item in results
     ]
     try:
-        rerank_items = reranker.rerank(documents, query, top_n=len(documents))
+        with tracing.span("rerank"), _RETRIEVAL_SECONDS.time(stage="rerank"):
+            rerank_items = reranker.rerank(documents, query, top_n=len(documents))
     except Exception:
         _logger.exception("Rerank failed, falling back to vector similarity results.")
         return results[:top_k]
@@ -1654,8 +1721,10 @@ def _doc_chunks_path(course_id: str, doc_name: str, doc_id: str) -> str:
 
 
 def _get_vector_store(course_id: str) -> Chroma:
-    if course_id in _VECTOR_STORE_CACHE:
-        return _VECTOR_STORE_CACHE[course_id]
+    cached = _VECTOR_STORE_CACHE.get(course_id)
+    metrics.record_cache("vector_store", cached is not None)
+    if cached is not None:
+        return cached
     _ensure_course_dir(course_id)
     store = Chroma(
         collection_name=f"course_{course_id}",
@@ -1707,6 +1776,8 @@ def _index_chunks(course_id: str, chunks: list[dict]) -> None:
     batch_size = 10
     for start in range(0, len(documents), batch_size):
         end = start + batch_size
+        metrics.EMBEDDING_REQUESTS.inc(kind="documents")
+        metrics.EMBEDDING_TEXTS.inc(len(documents[start:end]), kind="documents")
         store.add_documents(documents[start:end], ids=ids[start:end])
     if hasattr(store, "persist"):
         store.persist()
@@ -1779,6 +1850,8 @@ def _sync_vector_store(course_id: str) -> None:
     batch_size = 10
     for start in range(0, len(documents), batch_size):
         end = start + batch_size
+        metrics.EMBEDDING_REQUESTS.inc(kind="documents")
+        metrics.EMBEDDING_TEXTS.inc(len(documents[start:end]), kind="documents")
         store.add_documents(documents[start:end], ids=ids[start:end])
     if hasattr(store, "persist"):
         store.persist()
@@ -1,6 +1,11 @@
 import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 
+from .. import metrics
 from ..db import get_connection
 from ..utils import generate_id, now_iso
 from .exercises import generate_exercises
@@ -10,78 +15,226 @@ logger = logging.getLogger(__name__)
 EMA_ALPHA = 0.3
 WEAK_THRESHOLD = 0.6
 DEFAULT_MASTERY = 0.5
+MAX_CACHED_STATES = 4096
 
+# (student_id, course_id) -> 缓存项；record_attempts 写入后按 key 失效，
+# 知识点清单变化时递增课程代数使该课程全部缓存失效。TTL 兜底多进程部署下的跨进程写入。
+_STATE_CACHE: "OrderedDict[tuple[str, str], dict]" = OrderedDict()
+_STATE_CACHE_LOCK = threading.Lock()
+_COURSE_GENERATION: dict[str, int] = {}
 
-def record_attempt(
-    student_id: str,
-    exercise_id: str,
-    course_id: str,
-    score: float,
-    knowledge_points: list[str],
-) -> None:
-    conn = get_connection()
-    try:
-        conn.execute(
-            "INSERT INTO exercise_attempts (id, student_id, exercise_id, course_id, score, knowledge_points, created_at) "
-            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+
+def _state_cache_ttl_seconds() -> float:
+    return float(os.getenv("KT_STATE_CACHE_TTL", "30"))
+
+
+def _cache_entry(student_id: str, course_id: str) -> dict:
+    """Return the live cache entry for the pair, creating a fresh one if needed (lock held)."""
+    key = (student_id, course_id)
+    generation = _COURSE_GENERATION.get(course_id, 0)
+    entry = _STATE_CACHE.get(key)
+    if entry is None or entry["generation"] != generation or entry["expires_at"] < time.monotonic():
+        entry = {
+            "generation": generation,
+            "expires_at": time.monotonic() + _state_cache_ttl_seconds(),
+            "state": None,
+            "weak": {},
+        }
+        _STATE_CACHE[key] = entry
+        while len(_STATE_CACHE) > MAX_CACHED_STATES:
+            _STATE_CACHE.popitem(last=False)
+    _STATE_CACHE.move_to_end(key)
+    return entry
+
+
+def _is_current(student_id: str, course_id: str, entry: dict) -> bool:
+    """True if ``entry`` was not invalidated meanwhile, so a fresh DB read may be stored in it (lock held)."""
+    return (
+        _STATE_CACHE.get((student_id, course_id)) is entry
+        and entry["generation"] == _COURSE_GENERATION.get(course_id, 0)
+    )
+
+
+def invalidate_knowledge_state(student_id: str, course_id: str) -> None:
+    with _STATE_CACHE_LOCK:
+        _STATE_CACHE.pop((student_id, course_id), None)
+
+
+def invalidate_course_knowledge_state(course_id: str) -> None:
+    """Drop every cached state of ``course_id``; call after its knowledge points change."""
+    with _STATE_CACHE_LOCK:
+        _COURSE_GENERATION[course_id] = _COURSE_GENERATION.get(course_id, 0) + 1
+
+
+# EMA 在 SQL 中计算：首次作答以 DEFAULT_MASTERY 为基线，之后基于已有掌握度更新。
+# executemany 按顺序逐行执行，同一学生同一知识点的多次作答会依次叠加。
+_UPSERT_MASTERY_SQL = (
+    "INSERT INTO knowledge_mastery "
+    "(id, student_id, course_id, knowledge_point, mastery, attempt_count, updated_at) "
+    "VALUES (:id, :student_id, :course_id, :knowledge_point, "
+    "ROUND(:alpha * :score + (1 - :alpha) * :default_mastery, 4), 1, :ts) "
+    "ON CONFLICT(student_id, course_id, knowledge_point) DO UPDATE SET "
+    "mastery = ROUND(:alpha * :score + (1 - :alpha) * knowledge_mastery.mastery, 4), "
+    "attempt_count = knowledge_mastery.attempt_count + 1, "
+    "updated_at = excluded.updated_at"
+)
+
+
+def record_attempts(attempts: list[dict]) -> int:
+    """Record many graded attempts and their mastery updates in one transaction.
+
+    Each attempt needs ``student_id``, ``exercise_id``, ``course_id``, ``score`` and
+    ``knowledge_points``. Returns the number of attempts written.
+    """
+    if not attempts:
+        return 0
+    ts = now_iso()
+    attempt_rows = []
+    mastery_rows = []
+    for attempt in attempts:
+        knowledge_points = list(attempt.get("knowledge_points") or [])
+        score = float(attempt["score"])
+        attempt_rows.append(
             (
                 generate_id("att"),
-                student_id,
-                exercise_id,
-                course_id,
+                attempt["student_id"],
+                attempt["exercise_id"],
+                attempt["course_id"],
                 score,
                 json.dumps(knowledge_points, ensure_ascii=False),
-                now_iso(),
-            ),
+                ts,
+            )
         )
-
-        ts = now_iso()
         for kp in knowledge_points:
-            row = conn.execute(
-                "SELECT mastery, attempt_count FROM knowledge_mastery "
-                "WHERE student_id = ? AND course_id = ? AND knowledge_point = ?",
-                (student_id, course_id, kp),
-            ).fetchone()
-
-            if row:
-                old_mastery = row["mastery"]
-                new_mastery = EMA_ALPHA * score + (1 - EMA_ALPHA) * old_mastery
-                conn.execute(
-                    "UPDATE knowledge_mastery SET mastery = ?, attempt_count = attempt_count + 1, updated_at = ? "
-                    "WHERE student_id = ? AND course_id = ? AND knowledge_point = ?",
-                    (round(new_mastery, 4), ts, student_id, course_id, kp),
-                )
-            else:
-                new_mastery = EMA_ALPHA * score + (1 - EMA_ALPHA) * DEFAULT_MASTERY
-                conn.execute(
-                    "INSERT INTO knowledge_mastery (id, student_id, course_id, knowledge_point, mastery, attempt_count, updated_at) "
-                    "VALUES (?, ?, ?, ?, ?, 1, ?)",
-                    (generate_id("km"), student_id, course_id, kp, round(new_mastery, 4), ts),
-                )
+            mastery_rows.append(
+                {
+                    "id": generate_id("km"),
+                    "student_id": attempt["student_id"],
+                    "course_id": attempt["course_id"],
+                    "knowledge_point": kp,
+                    "score": score,
+                    "alpha": EMA_ALPHA,
+                    "default_mastery": DEFAULT_MASTERY,
+                    "ts": ts,
+                }
+            )
 
+    conn = get_connection()
+    try:
+        conn.executemany(
+            "INSERT INTO exercise_attempts (id, student_id, exercise_id, course_id, score, knowledge_points, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            attempt_rows,
+        )
+        if mastery_rows:
+            conn.executemany(_UPSERT_MASTERY_SQL, mastery_rows)
         conn.commit()
     except Exception:
         conn.rollback()
-        logger.exception("Failed to record attempt")
+        logger.exception("Failed to record attempts")
         raise
     finally:
         conn.close()
+    for pair in {(attempt["student_id"], attempt["course_id"]) for attempt in attempts}:
+        invalidate_knowledge_state(*pair)
+    return len(attempt_rows)
+
+
+def course_exists(course_id: str) -> bool:
+    conn = get_connection()
+    try:
+        row = conn.execute("SELECT 1 FROM courses WHERE id = ?", (course_id,)).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def unknown_student_ids(student_ids: list[str]) -> list[str]:
+    """Ids that do not belong to a registered student account, sorted."""
+    unique = sorted(set(student_ids))
+    if not unique:
+        return []
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            "SELECT id FROM users WHERE role = 'student' "
+            "AND id IN (SELECT value FROM json_each(?))",
+            (json.dumps(unique),),
+        ).fetchall()
+    finally:
+        conn.close()
+    known = {row["id"] for row in rows}
+    return [student_id for student_id in unique if student_id not in known]
+
+
+def record_attempt(
+    student_id: str,
+    exercise_id: str,
+    course_id: str,
+    score: float,
+    knowledge_points: list[str],
+) -> None:
+    record_attempts(
+        [
+            {
+                "student_id": student_id,
+                "exercise_id": exercise_id,
+                "course_id": course_id,
+                "score": score,
+                "knowledge_points": knowledge_points,
+            }
+        ]
+    )
+
+
+def _copy_state(state: dict) -> dict:
+    return {
+        "course_id": state["course_id"],
+        "items": [dict(item) for item in state["items"]],
+        "weak_points": list(state["weak_points"]),
+    }
 
 
 def get_knowledge_state(student_id: str, course_id: str) -> dict:
+    with _STATE_CACHE_LOCK:
+        entry = _cache_entry(student_id, course_id)
+        cached = entry["state"]
+    metrics.record_cache("knowledge_state", cached is not None)
+    if cached is not None:
+        return _copy_state(cached)
+
+    state = _load_knowledge_state(student_id, course_id)
+    with _STATE_CACHE_LOCK:
+        if _is_current(student_id, course_id, entry):
+            entry["state"] = state
+    return _copy_state(state)
+
+
+_STUDENT_MASTERY_SQL = (
+    "SELECT knowledge_point, mastery, attempt_count, updated_at "
+    "FROM knowledge_mastery WHERE student_id = ? AND course_id = ? "
+    "ORDER BY mastery ASC"
+)
+_COURSE_POINTS_SQL = "SELECT point FROM knowledge_points WHERE course_id = ? ORDER BY created_at ASC"
+_EXERCISE_ATTEMPTS_SQL = (
+    "SELECT id, exercise_id, course_id, score, knowledge_points, created_at "
+    "FROM exercise_attempts WHERE student_id = ? AND course_id = ? "
+    "ORDER BY created_at DESC LIMIT ?"
+)
+
+
+def _load_knowledge_state(student_id: str, course_id: str) -> dict:
     conn = get_connection()
 
     rows = conn.execute(
-        "SELECT knowledge_point, mastery, attempt_count, updated_at "
-        "FROM knowledge_mastery WHERE student_id = ? AND course_id = ? "
-        "ORDER BY mastery ASC",
+        _STUDENT_MASTERY_SQL,
         (student_id, course_id),
     ).fetchall()
 
     tracked = {row["knowledge_point"] for row in rows}
 
     all_kp_rows = conn.execute(
-        "SELECT point FROM knowledge_points WHERE course_id = ? ORDER BY created_at ASC",
+        _COURSE_POINTS_SQL,
         (course_id,),
     ).fetchall()
     conn.close()
@@ -114,9 +267,124 @@ def get_knowledge_state(student_id: str, course_id: str) -> dict:
     }
 
 
-def get_weak_points(student_id: str, course_id: str, threshold: float = WEAK_THRESHOLD) -> list[str]:
-    state = get_knowledge_state(student_id, course_id)
-    return [item["knowledge_point"] for item in state["items"] if item["mastery"] < threshold]
+# 班级热力图：课程知识点清单 LEFT JOIN 聚合表，再补上已有作答但不在清单中的知识点，一次查询返回。
+# 聚合表只存原始和/计数，薄弱人数按请求阈值从 knowledge_mastery 现算（走 (course_id, knowledge_point, mastery) 索引）
+_CLASS_MASTERY_SQL = (
+    "WITH weak AS (SELECT knowledge_point, COUNT(*) AS weak_count FROM knowledge_mastery "
+    "WHERE course_id = :course_id AND mastery < :threshold GROUP BY knowledge_point) "
+    "SELECT kp.point AS knowledge_point, cm.student_count, cm.mastery_sum, "
+    "cm.attempt_count, weak.weak_count, cm.updated_at "
+    "FROM (SELECT point, MIN(created_at) AS created_at FROM knowledge_points "
+    "WHERE course_id = :course_id GROUP BY point) AS kp "
+    "LEFT JOIN class_mastery AS cm "
+    "ON cm.course_id = :course_id AND cm.knowledge_point = kp.point "
+    "LEFT JOIN weak ON weak.knowledge_point = kp.point "
+    "UNION ALL "
+    "SELECT cm.knowledge_point, cm.student_count, cm.mastery_sum, cm.attempt_count, "
+    "weak.weak_count, cm.updated_at "
+    "FROM class_mastery AS cm LEFT JOIN weak ON weak.knowledge_point = cm.knowledge_point "
+    "WHERE cm.course_id = :course_id AND cm.knowledge_point NOT IN "
+    "(SELECT point FROM knowledge_points WHERE course_id = :course_id)"
+)
+
+
+def get_class_mastery(course_id: str, weak_threshold: float = WEAK_THRESHOLD) -> dict:
+    """Per-knowledge-point class aggregates for a teacher heatmap, weakest first.
+
+    ``weak_count`` counts students whose mastery is below ``weak_threshold``.
+    """
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            _CLASS_MASTERY_SQL, {"course_id": course_id, "threshold": weak_threshold}
+        ).fetchall()
+    finally:
+        conn.close()
+
+    items = []
+    for row in rows:
+        student_count = row["student_count"] or 0
+        items.append({
+            "knowledge_point": row["knowledge_point"],
+            "mean_mastery": round(row["mastery_sum"] / student_count, 4) if student_count else None,
+            "student_count": student_count,
+            "attempt_count": row["attempt_count"] or 0,
+            "weak_count": row["weak_count"] or 0,
+            "updated_at": row["updated_at"] or "",
+        })
+    # 未作答的知识点排在最后
+    items.sort(key=lambda x: (x["mean_mastery"] is None, x["mean_mastery"] or 0.0))
+    return {
+        "course_id": course_id,
+        "items": items,
+        "weak_threshold": weak_threshold,
+    }
+
+
+# 与 get_knowledge_state 的排序一致：按掌握度升序，同分时已作答的在前，未作答的按创建顺序
+_LOWEST_MASTERY_SQL = (
+    "SELECT knowledge_point FROM ("
+    "SELECT knowledge_point, mastery, 0 AS untracked, '' AS created_at "
+    "FROM knowledge_mastery WHERE student_id = :student_id AND course_id = :course_id "
+    "UNION ALL "
+    "SELECT point, :default_mastery, 1, MIN(created_at) FROM knowledge_points "
+    "WHERE course_id = :course_id AND point NOT IN ("
+    "SELECT knowledge_point FROM knowledge_mastery "
+    "WHERE student_id = :student_id AND course_id = :course_id) "
+    "GROUP BY point"
+    ") WHERE :threshold IS NULL OR mastery < :threshold "
+    "ORDER BY mastery ASC, untracked ASC, created_at ASC "
+    "LIMIT :limit"
+)
+
+
+def get_top_weak_points(
+    student_id: str,
+    course_id: str,
+    k: int,
+    threshold: float | None = WEAK_THRESHOLD,
+) -> list[str]:
+    """Return at most ``k`` weakest knowledge points, sorted and limited in SQL.
+
+    ``threshold=None`` drops the mastery filter and returns the ``k`` lowest points.
+    """
+    key = (k, threshold)
+    with _STATE_CACHE_LOCK:
+        entry = _cache_entry(student_id, course_id)
+        cached = entry["weak"].get(key)
+    metrics.record_cache("weak_points", cached is not None)
+    if cached is not None:
+        return list(cached)
+
+    conn = get_connection()
+    try:
+        rows = conn.execute(
+            _LOWEST_MASTERY_SQL,
+            {
+                "student_id": student_id,
+                "course_id": course_id,
+                "default_mastery": DEFAULT_MASTERY,
+                "threshold": threshold,
+                "limit": k,
+            },
+        ).fetchall()
+    finally:
+        conn.close()
+    points = [row["knowledge_point"] for row in rows]
+    with _STATE_CACHE_LOCK:
+        if _is_current(student_id, course_id, entry):
+            entry["weak"][key] = points
+    return list(points)
+
+
+def get_weak_points(
+    student_id: str,
+    course_id: str,
+    threshold: float = WEAK_THRESHOLD,
+    limit: int = -1,
+) -> list[str]:
+    # SQLite 中 LIMIT -1 表示不限制
+    return get_top_weak_points(student_id, course_id, limit, threshold)
 
 
 def generate_recommended_exercises(
@@ -125,13 +393,12 @@ def generate_recommended_exercises(
     count: int = 5,
     difficulty: str = "easy",
 ) -> list[dict]:
-    state = get_knowledge_state(student_id, course_id)
-    weak = [item["knowledge_point"] for item in state["items"] if item["mastery"] < WEAK_THRESHOLD]
+    # generate_exercises 按 knowledge_scope 轮转出题，count 个以外的薄弱点不会被用到
+    weak = get_top_weak_points(student_id, course_id, count)
 
     if not weak:
-        sorted_items = [item for item in state["items"] if item["attempt_count"] > 0]
-        sorted_items.sort(key=lambda x: x["mastery"])
-        weak = [item["knowledge_point"] for item in sorted_items[:max(3, count)]]
+        # 没有低于阈值的知识点时（此时所有知识点都已作答），取掌握度最低的几个巩固
+        weak = get_top_weak_points(student_id, course_id, max(3, count), threshold=None)
 
     if not weak:
         weak = None
@@ -149,9 +416,7 @@ def generate_recommended_exercises(
 def get_exercise_attempts(student_id: str, course_id: str, limit: int = 50) -> list[dict]:
     conn = get_connection()
     rows = conn.execute(
-        "SELECT id, exercise_id, course_id, score, knowledge_points, created_at "
-        "FROM exercise_attempts WHERE student_id = ? AND course_id = ? "
-        "ORDER BY created_at DESC LIMIT ?",
+        _EXERCISE_ATTEMPTS_SQL,
         (student_id, course_id, limit),
     ).fetchall()
     conn.close()
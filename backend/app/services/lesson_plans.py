@@ -3,14 +3,17 @@ import os
 
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from .. import metrics
 from ..utils import generate_id, now_iso
 from .knowledge_base import generate_knowledge_points, search_documents
 from .langchain_client import get_chat_model, is_dashscope_configured
 from .model_client import parse_json_payload
+from .retrieval_context import RetrievalContext
 
 
 _PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
 _OUTLINE_ROOT = os.path.join(_PROJECT_ROOT, "data", "teaching-outlines")
+OUTLINE_TOP_K = 8
 
 
 def _ensure_course_outline_dir(course_id: str) -> str:
@@ -139,6 +142,7 @@ def generate_lesson_outline(
     knowledge_scope: list[str] | None = None,
     audience_level: str = "基础",
     include_practice: bool = True,
+    retrieval_context: RetrievalContext | None = None,
 ) -> dict:
     knowledge_points = [item.strip() for item in (knowledge_scope or []) if item and item.strip()]
     if not knowledge_points:
@@ -146,8 +150,13 @@ def generate_lesson_outline(
     if not knowledge_points:
         knowledge_points = [chapter_title]
 
-    query = " ".join([chapter_title, *knowledge_points[:6]])
-    results = search_documents(course_id, query, top_k=8)
+    if retrieval_context is not None:
+        results = _retrieve_with_context(
+            retrieval_context, course_id, chapter_title, knowledge_points[:6]
+        )
+    else:
+        query = " ".join([chapter_title, *knowledge_points[:6]])
+        results = search_documents(course_id, query, top_k=OUTLINE_TOP_K)
     citations = [_build_citation(result) for result in results]
 
     fallback = _build_fallback_outline(
@@ -180,6 +189,31 @@ def generate_lesson_outline(
     return fallback
 
 
+def _retrieve_with_context(
+    retrieval_context: RetrievalContext,
+    course_id: str,
+    chapter_title: str,
+    knowledge_points: list[str],
+) -> list[dict]:
+    """复用本次运行已检索的片段，只为未覆盖的知识点补一次检索。"""
+    prior = retrieval_context.chunks(course_id)
+    if not prior:
+        query = " ".join([chapter_title, *knowledge_points])
+        return retrieval_context.search(course_id, query, OUTLINE_TOP_K)
+
+    uncovered = [
+        point for point in knowledge_points if not retrieval_context.covering(course_id, point, 1)
+    ]
+    results = prior[:OUTLINE_TOP_K]
+    if uncovered:
+        seen = {result.get("chunk_id") for result in results}
+        extra = retrieval_context.search(
+            course_id, " ".join(uncovered), min(OUTLINE_TOP_K, 2 * len(uncovered))
+        )
+        results.extend(result for result in extra if result.get("chunk_id") not in seen)
+    return results
+
+
 def _build_citation(result: dict) -> dict:
     content = result.get("content") or ""
     return {
@@ -310,10 +344,11 @@ def _generate_outline_with_model(
         "不要返回对象、嵌套 JSON 或字典结构。"
     )
     try:
-        response = llm.invoke([
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt),
-        ])
+        with metrics.track_llm_call("lesson_outline"):
+            response = llm.invoke([
+                SystemMessage(content=system_prompt),
+                HumanMessage(content=user_prompt),
+            ])
         text = getattr(response, "content", str(response))
         payload = parse_json_payload(text)
         return payload if isinstance(payload, dict) else None
@@ -1,10 +1,57 @@
+import base64
 import json
+import sqlite3
 
-from ..db import get_connection
+from ..db import get_connection, transaction
 from ..utils import generate_id, now_iso
 
 MAX_HISTORY_MESSAGES = 10
 TITLE_MAX_LENGTH = 15
+DEFAULT_TITLE = "新对话"
+CITATION_SCORE_FIELDS = ("score", "rerank_score", "bm25_score", "hybrid_score")
+_SQLITE_MAX_PARAMS = 500
+
+# 热点查询集中定义，scripts/check_query_plans.py 直接导入校验其查询计划
+_CONVERSATIONS_BY_COURSE_SQL = (
+    "SELECT * FROM conversations WHERE user_id = ? AND course_id = ? ORDER BY updated_at DESC"
+)
+_CONVERSATIONS_BY_USER_SQL = "SELECT * FROM conversations WHERE user_id = ? ORDER BY updated_at DESC"
+_LATEST_CONVERSATION_SQL = f"{_CONVERSATIONS_BY_COURSE_SQL} LIMIT 1"
+_MESSAGES_CHRONOLOGICAL_SQL = "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at ASC"
+_PROMPT_MESSAGE_COLUMNS = "id, conversation_id, role, content, created_at"
+_RECENT_MESSAGES_SQL = (
+    f"SELECT {_PROMPT_MESSAGE_COLUMNS} FROM messages "
+    "WHERE conversation_id = ? ORDER BY created_at DESC LIMIT ?"
+)
+# 已并入滚动摘要（summary_upto 及之前）的消息不再加载
+_UNSUMMARIZED_MESSAGES_SQL = (
+    f"SELECT {_PROMPT_MESSAGE_COLUMNS} FROM messages "
+    "WHERE conversation_id = ? AND created_at > ? "
+    "ORDER BY created_at DESC LIMIT ?"
+)
+
+
+def _conversations_page_sql(by_course: bool, after_cursor: bool) -> str:
+    clauses = ["user_id = ?"]
+    if by_course:
+        clauses.append("course_id = ?")
+    if after_cursor:
+        clauses.append("(updated_at, id) < (?, ?)")
+    return (
+        f"SELECT * FROM conversations WHERE {' AND '.join(clauses)} "
+        "ORDER BY updated_at DESC, id DESC LIMIT ?"
+    )
+
+
+def _messages_page_sql(include_citations: bool, after_cursor: bool) -> str:
+    columns = "*" if include_citations else _PROMPT_MESSAGE_COLUMNS
+    clauses = ["conversation_id = ?"]
+    if after_cursor:
+        clauses.append("(created_at, id) < (?, ?)")
+    return (
+        f"SELECT {columns} FROM messages WHERE {' AND '.join(clauses)} "
+        "ORDER BY created_at DESC, id DESC LIMIT ?"
+    )
 
 
 def create_conversation(user_id: str, course_id: str, title: str | None = None) -> dict:
@@ -25,18 +72,93 @@ def list_conversations(user_id: str, course_id: str | None = None) -> list[dict]
     conn = get_connection()
     if course_id:
         rows = conn.execute(
-            "SELECT * FROM conversations WHERE user_id = ? AND course_id = ? ORDER BY updated_at DESC",
+            _CONVERSATIONS_BY_COURSE_SQL,
             (user_id, course_id),
         ).fetchall()
     else:
         rows = conn.execute(
-            "SELECT * FROM conversations WHERE user_id = ? ORDER BY updated_at DESC",
+            _CONVERSATIONS_BY_USER_SQL,
             (user_id,),
         ).fetchall()
     conn.close()
     return [dict(r) for r in rows]
 
 
+def encode_cursor(sort_value: str, row_id: str) -> str:
+    raw = f"{sort_value}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """Decode a keyset cursor; raises ValueError when it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+    return sort_value, row_id
+
+
+def list_conversations_page(
+    user_id: str,
+    course_id: str | None = None,
+    limit: int = 20,
+    cursor: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """Keyset page ordered by (updated_at, id) DESC; returns (items, next_cursor)."""
+    params: list = [user_id]
+    if course_id:
+        params.append(course_id)
+    if cursor:
+        params.extend(decode_cursor(cursor))
+    conn = get_connection()
+    rows = conn.execute(
+        _conversations_page_sql(bool(course_id), bool(cursor)),
+        (*params, limit + 1),
+    ).fetchall()
+    conn.close()
+    items = [dict(r) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit and items:
+        next_cursor = encode_cursor(items[-1]["updated_at"], items[-1]["id"])
+    return items, next_cursor
+
+
+def list_messages_page(
+    conversation_id: str,
+    limit: int = 50,
+    cursor: str | None = None,
+    include_citations: bool = True,
+) -> tuple[list[dict], str | None]:
+    """Newest-first keyset page of messages, returned in chronological order.
+
+    ``next_cursor`` points at older messages. With ``include_citations=False``
+    the citation JSON is neither read nor parsed.
+    """
+    params: list = [conversation_id]
+    if cursor:
+        params.extend(decode_cursor(cursor))
+    conn = get_connection()
+    rows = conn.execute(
+        _messages_page_sql(include_citations, bool(cursor)),
+        (*params, limit + 1),
+    ).fetchall()
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and page:
+        next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"])
+    if not include_citations:
+        conn.close()
+        return [dict(r) for r in reversed(page)], next_cursor
+    course_row = conn.execute(
+        "SELECT course_id FROM conversations WHERE id = ?", (conversation_id,)
+    ).fetchone()
+    messages = [_parse_message_row(r) for r in reversed(page)]
+    _attach_citations(conn, course_row["course_id"] if course_row else "", messages)
+    conn.close()
+    return messages, next_cursor
+
+
 def get_conversation(conversation_id: str) -> dict | None:
     conn = get_connection()
     row = conn.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
@@ -50,18 +172,20 @@ def get_conversation_with_messages(conversation_id: str) -> dict | None:
         return None
     conn = get_connection()
     rows = conn.execute(
-        "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at ASC",
+        _MESSAGES_CHRONOLOGICAL_SQL,
         (conversation_id,),
     ).fetchall()
+    messages = [_parse_message_row(r) for r in rows]
+    _attach_citations(conn, conv["course_id"], messages)
     conn.close()
-    conv["messages"] = [_parse_message_row(r) for r in rows]
+    conv["messages"] = messages
     return conv
 
 
 def get_latest_conversation(user_id: str, course_id: str) -> dict | None:
     conn = get_connection()
     row = conn.execute(
-        "SELECT * FROM conversations WHERE user_id = ? AND course_id = ? ORDER BY updated_at DESC LIMIT 1",
+        _LATEST_CONVERSATION_SQL,
         (user_id, course_id),
     ).fetchone()
     conn.close()
@@ -93,6 +217,11 @@ def update_conversation_title(conversation_id: str, title: str) -> dict | None:
 
 def delete_conversation(conversation_id: str) -> bool:
     conn = get_connection()
+    conn.execute(
+        "DELETE FROM message_citations WHERE message_id IN "
+        "(SELECT id FROM messages WHERE conversation_id = ?)",
+        (conversation_id,),
+    )
     conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
     cursor = conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
     conn.commit()
@@ -102,44 +231,252 @@ def delete_conversation(conversation_id: str) -> bool:
 
 
 def add_message(conversation_id: str, role: str, content: str, citations: list | None = None) -> dict:
-    msg_id = generate_id("msg")
     ts = now_iso()
-    citations_json = json.dumps(citations or [], ensure_ascii=False)
-    conn = get_connection()
-    conn.execute(
-        "INSERT INTO messages (id, conversation_id, role, content, citations, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-        (msg_id, conversation_id, role, content, citations_json, ts),
-    )
-    conn.execute(
-        "UPDATE conversations SET updated_at = ? WHERE id = ?",
-        (ts, conversation_id),
-    )
-    conn.commit()
-    row = conn.execute("SELECT * FROM messages WHERE id = ?", (msg_id,)).fetchone()
-    conn.close()
-    return _parse_message_row(row)
+    with transaction() as conn:
+        message = _insert_message(conn, conversation_id, role, content, citations, ts)
+        conn.execute(
+            "UPDATE conversations SET updated_at = ? WHERE id = ?",
+            (ts, conversation_id),
+        )
+    return message
 
 
 def get_recent_messages(conversation_id: str, limit: int = MAX_HISTORY_MESSAGES) -> list[dict]:
+    """Recent messages for prompting; citations are not loaded."""
     conn = get_connection()
     rows = conn.execute(
-        "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at DESC LIMIT ?",
+        _RECENT_MESSAGES_SQL,
         (conversation_id, limit),
     ).fetchall()
     conn.close()
-    messages = [_parse_message_row(r) for r in reversed(rows)]
-    return messages
+    return [{**dict(r), "citations": []} for r in reversed(rows)]
+
+
+def _title_from_question(question: str) -> str:
+    title = question[:TITLE_MAX_LENGTH].strip()
+    if len(question) > TITLE_MAX_LENGTH:
+        title += "…"
+    return title
 
 
 def auto_title_from_question(conversation_id: str, question: str) -> None:
     """Set conversation title from first user question if still default."""
     conv = get_conversation(conversation_id)
-    if not conv or conv["title"] != "新对话":
+    if not conv or conv["title"] != DEFAULT_TITLE:
         return
-    title = question[:TITLE_MAX_LENGTH].strip()
-    if len(question) > TITLE_MAX_LENGTH:
-        title += "…"
-    update_conversation_title(conversation_id, title)
+    update_conversation_title(conversation_id, _title_from_question(question))
+
+
+# ── Conversation turn API ──
+#
+# 一轮问答只需两个事务：begin_turn（定位/创建对话 + 读历史 + 写用户消息 + 自动标题）
+# 与 complete_turn（写助手消息）。写入均使用 RETURNING，不再回查。
+
+
+def _resolve_conversation(
+    conn: sqlite3.Connection,
+    user_id: str,
+    course_id: str,
+    conversation_id: str | None,
+    ts: str,
+) -> dict:
+    row = None
+    if conversation_id:
+        row = conn.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+    if row is None:
+        row = conn.execute(
+            _LATEST_CONVERSATION_SQL,
+            (user_id, course_id),
+        ).fetchone()
+    if row is None:
+        row = conn.execute(
+            "INSERT INTO conversations (id, user_id, course_id, title, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) RETURNING *",
+            (generate_id("conv"), user_id, course_id, DEFAULT_TITLE, ts, ts),
+        ).fetchone()
+    return dict(row)
+
+
+def _insert_message(
+    conn: sqlite3.Connection,
+    conversation_id: str,
+    role: str,
+    content: str,
+    citations: list | None,
+    ts: str,
+) -> dict:
+    refs, extra = _split_citations(citations or [])
+    row = conn.execute(
+        "INSERT INTO messages (id, conversation_id, role, content, citations, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?) RETURNING id, conversation_id, role, content, created_at",
+        (
+            generate_id("msg"),
+            conversation_id,
+            role,
+            content,
+            json.dumps(extra, ensure_ascii=False),
+            ts,
+        ),
+    ).fetchone()
+    message = dict(row)
+    if refs:
+        conn.executemany(
+            "INSERT INTO message_citations "
+            "(message_id, position, chunk_id, score, rerank_score, bm25_score, hybrid_score) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(message["id"], position, *ref) for position, ref in enumerate(refs)],
+        )
+    message["citations"] = list(citations or [])
+    return message
+
+
+def _touch_conversation(
+    conn: sqlite3.Connection,
+    conversation_id: str,
+    ts: str,
+    question: str | None = None,
+) -> dict:
+    """Bump updated_at and, for the first question, replace the default title."""
+    row = conn.execute(
+        "UPDATE conversations SET updated_at = ?, "
+        "title = CASE WHEN title = ? AND ? IS NOT NULL THEN ? ELSE title END "
+        "WHERE id = ? RETURNING *",
+        (
+            ts,
+            DEFAULT_TITLE,
+            question,
+            _title_from_question(question) if question else None,
+            conversation_id,
+        ),
+    ).fetchone()
+    return dict(row)
+
+
+def begin_turn(
+    user_id: str,
+    course_id: str,
+    conversation_id: str | None,
+    question: str,
+    history_limit: int = MAX_HISTORY_MESSAGES,
+) -> tuple[dict, list[dict]]:
+    """Open a QA turn in one transaction; returns (conversation, history before this question).
+
+    The history only holds messages not yet folded into ``conversation["summary"]``.
+    """
+    ts = now_iso()
+    with transaction(immediate=True) as conn:
+        conv = _resolve_conversation(conn, user_id, course_id, conversation_id, ts)
+        # 已并入滚动摘要的消息不再加载（见 history_manager）；拼 prompt 不需要引用
+        rows = conn.execute(
+            _UNSUMMARIZED_MESSAGES_SQL,
+            (conv["id"], conv.get("summary_upto") or "", history_limit),
+        ).fetchall()
+        history = [{**dict(r), "citations": []} for r in reversed(rows)]
+        _insert_message(conn, conv["id"], "user", question, None, ts)
+        conv = _touch_conversation(conn, conv["id"], ts, question)
+    return conv, history
+
+
+def complete_turn(conversation_id: str, answer: str, citations: list | None = None) -> dict:
+    """Persist the assistant reply of a turn opened by :func:`begin_turn`."""
+    ts = now_iso()
+    with transaction() as conn:
+        message = _insert_message(conn, conversation_id, "assistant", answer, citations, ts)
+        _touch_conversation(conn, conversation_id, ts)
+    return message
+
+
+def record_turn(
+    user_id: str,
+    course_id: str,
+    conversation_id: str | None,
+    question: str,
+    answer: str,
+    citations: list | None = None,
+) -> dict:
+    """Write a finished question/answer pair in a single transaction (no history needed)."""
+    ts = now_iso()
+    with transaction(immediate=True) as conn:
+        conv = _resolve_conversation(conn, user_id, course_id, conversation_id, ts)
+        _insert_message(conn, conv["id"], "user", question, None, ts)
+        # 助手消息单独取时间戳，保证按 created_at 排序时排在提问之后
+        answered_at = now_iso()
+        _insert_message(conn, conv["id"], "assistant", answer, citations, answered_at)
+        return _touch_conversation(conn, conv["id"], answered_at, question)
+
+
+# ── Citations ──
+#
+# 指向课程分块的引用只在 message_citations 中存 chunk_id 与各项分数，读取时再从
+# 分块目录补全摘录、文档名与标题路径；没有 chunk_id 的引用（如外部来源）仍以 JSON
+# 存在 messages.citations 中。
+
+
+def _as_score(value) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _split_citations(citations: list) -> tuple[list[tuple], list[dict]]:
+    refs: list[tuple] = []
+    extra: list[dict] = []
+    for citation in citations:
+        chunk_id = citation.get("chunk_id") if isinstance(citation, dict) else None
+        if chunk_id:
+            refs.append((chunk_id, *(_as_score(citation.get(f)) for f in CITATION_SCORE_FIELDS)))
+        else:
+            extra.append(citation)
+    return refs, extra
+
+
+def _chunk_lookup(course_id: str, chunk_ids: list[str]) -> dict[str, dict]:
+    if not course_id or not chunk_ids:
+        return {}
+    from .knowledge_base import get_chunks_by_ids
+
+    return get_chunks_by_ids(course_id, chunk_ids)
+
+
+def _hydrate_citation(ref, chunks: dict[str, dict]) -> dict:
+    chunk = chunks.get(ref["chunk_id"]) or {}
+    citation = {
+        "chunk_id": ref["chunk_id"],
+        "source_doc_id": chunk.get("source_doc_id", ""),
+        "source_doc_name": chunk.get("source_doc_name", "unknown"),
+        "title_path": chunk.get("title_path", ""),
+        "excerpt": chunk.get("content", ""),
+    }
+    citation.update({field: ref[field] for field in CITATION_SCORE_FIELDS})
+    return citation
+
+
+def _attach_citations(conn: sqlite3.Connection, course_id: str, messages: list[dict]) -> None:
+    """Prepend hydrated chunk citations to each message's ``citations`` list in place."""
+    ids = [message["id"] for message in messages]
+    refs_by_message: dict[str, list] = {}
+    for start in range(0, len(ids), _SQLITE_MAX_PARAMS):
+        batch = ids[start:start + _SQLITE_MAX_PARAMS]
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(
+            f"SELECT * FROM message_citations WHERE message_id IN ({placeholders}) "
+            "ORDER BY message_id, position",
+            batch,
+        ).fetchall()
+        for row in rows:
+            refs_by_message.setdefault(row["message_id"], []).append(row)
+    if not refs_by_message:
+        return
+    chunks = _chunk_lookup(
+        course_id,
+        list({ref["chunk_id"] for refs in refs_by_message.values() for ref in refs}),
+    )
+    for message in messages:
+        refs = refs_by_message.get(message["id"])
+        if refs:
+            hydrated = [_hydrate_citation(ref, chunks) for ref in refs]
+            message["citations"] = hydrated + message.get("citations", [])
 
 
 def _parse_message_row(row) -> dict:
@@ -0,0 +1,199 @@
+"""课程级题库：保存过的题目去重入库，出题时优先复用。
+
+每道题按题干（含选项）计算 64 位 SimHash。海明距离不超过
+``QUESTION_BANK_SIMHASH_DISTANCE``（默认 3）的同题型题目视为近似重复。签名拆成 4 段
+16 位分别建索引：距离 ≤ 3 时至少有一段完全相同（抽屉原理），候选集只需按段等值查询。
+
+题库随练习批次的保存 / 更新 / 删除同步维护（与 exercise_index 同一事务），
+只收录模型生成或教师编辑过的题目，占位题不入库。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from collections import Counter
+
+from .. import metrics
+from ..db import transaction
+from ..utils import now_iso
+
+SIMHASH_BITS = 64
+BAND_BITS = 16
+SHINGLE_SIZE = 3
+
+_BANK_REUSED = metrics.counter(
+    "question_bank_reused_total",
+    "Exercises served from the course question bank instead of the model.",
+    labelnames=("type",),
+)
+_BANK_DUPLICATES = metrics.counter(
+    "question_bank_duplicates_total",
+    "Saved exercises not added to the bank because a near-duplicate exists.",
+)
+
+_NOISE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def _max_distance() -> int:
+    return max(0, int(os.getenv("QUESTION_BANK_SIMHASH_DISTANCE", "3")))
+
+
+def signature_text(exercise: dict) -> str:
+    parts = [str(exercise.get("question") or "")]
+    for option in exercise.get("options") or []:
+        if isinstance(option, dict):
+            parts.append(str(option.get("text") or ""))
+    return " ".join(parts)
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over character shingles of the normalized text."""
+    normalized = _NOISE.sub("", text.lower())
+    if not normalized:
+        return 0
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = Counter([normalized])
+    else:
+        shingles = Counter(
+            normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)
+        )
+    weights = [0] * SIMHASH_BITS
+    for shingle, count in shingles.items():
+        digest = int.from_bytes(
+            hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if digest >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(left: int, right: int) -> int:
+    return bin(left ^ right).count("1")
+
+
+def _to_signed(value: int) -> int:
+    # SQLite INTEGER 为有符号 64 位
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << SIMHASH_BITS) if value < 0 else value
+
+
+def _bands(value: int) -> list[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [value >> (BAND_BITS * i) & mask for i in range(SIMHASH_BITS // BAND_BITS)]
+
+
+def _find_near_duplicate(
+    conn: sqlite3.Connection,
+    course_id: str,
+    exercise_type: str,
+    signature: int,
+) -> str | None:
+    bands = _bands(signature)
+    rows = conn.execute(
+        "SELECT exercise_id, simhash FROM question_bank WHERE course_id = ? AND type = ? "
+        "AND (band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)",
+        (course_id, exercise_type, *bands),
+    ).fetchall()
+    limit = _max_distance()
+    for row in rows:
+        if hamming_distance(signature, _to_unsigned(row["simhash"])) <= limit:
+            return row["exercise_id"]
+    return None
+
+
+def sync_batch(
+    conn: sqlite3.Connection,
+    course_id: str,
+    batch_id: str,
+    exercises: list[dict] | None,
+) -> list[dict]:
+    """Replace the bank entries of one batch inside the caller's transaction.
+
+    Callers pass only questions worth reusing (placeholders already filtered out).
+
+    Returns ``[{exercise_id, duplicate_of}]`` for exercises skipped as near-duplicates
+    of a question already in the bank (or earlier in the same batch).
+    """
+    conn.execute(
+        "DELETE FROM question_bank WHERE course_id = ? AND batch_id = ?",
+        (course_id, batch_id),
+    )
+    duplicates: list[dict] = []
+    ts = now_iso()
+    for exercise in exercises or []:
+        if not isinstance(exercise, dict) or not exercise.get("exercise_id"):
+            continue
+        if not exercise.get("question"):
+            continue
+        exercise_type = str(exercise.get("type") or "")
+        signature = simhash(signature_text(exercise))
+        duplicate_of = _find_near_duplicate(conn, course_id, exercise_type, signature)
+        if duplicate_of:
+            _BANK_DUPLICATES.inc()
+            duplicates.append({"exercise_id": exercise["exercise_id"], "duplicate_of": duplicate_of})
+            continue
+        knowledge_points = exercise.get("knowledge_points") or [""]
+        conn.execute(
+            "INSERT OR REPLACE INTO question_bank "
+            "(exercise_id, course_id, batch_id, knowledge_point, type, difficulty, simhash, "
+            "band0, band1, band2, band3, payload, use_count, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)",
+            (
+                exercise["exercise_id"],
+                course_id,
+                batch_id,
+                str(knowledge_points[0]),
+                exercise_type,
+                str(exercise.get("difficulty") or ""),
+                _to_signed(signature),
+                *_bands(signature),
+                json.dumps(exercise, ensure_ascii=False),
+                ts,
+            ),
+        )
+    return duplicates
+
+
+def take_questions(
+    course_id: str,
+    knowledge_point: str,
+    exercise_type: str,
+    difficulty: str,
+    limit: int,
+) -> list[dict]:
+    """Check out up to ``limit`` stored questions, least used first, and bump their use count."""
+    if limit <= 0:
+        return []
+    # 先读后标记：BEGIN IMMEDIATE 先取写锁，并发出题不会选中同一批题，
+    # 也不会在读锁升级为写锁时遇到 SQLITE_BUSY
+    with transaction(immediate=True) as conn:
+        rows = conn.execute(
+            "SELECT exercise_id, payload FROM question_bank "
+            "WHERE course_id = ? AND knowledge_point = ? AND type = ? AND difficulty = ? "
+            "ORDER BY use_count ASC, created_at ASC LIMIT ?",
+            (course_id, knowledge_point, exercise_type, difficulty, limit),
+        ).fetchall()
+        if rows:
+            conn.execute(
+                "UPDATE question_bank SET use_count = use_count + 1 "
+                "WHERE exercise_id IN (SELECT value FROM json_each(?))",
+                (json.dumps([row["exercise_id"] for row in rows]),),
+            )
+    questions = []
+    for row in rows:
+        try:
+            payload = json.loads(row["payload"])
+        except (TypeError, ValueError):
+            continue
+        if isinstance(payload, dict):
+            questions.append(payload)
+    if questions:
+        _BANK_REUSED.inc(len(questions), type=exercise_type)
+    return questions
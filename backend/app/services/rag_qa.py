@@ -1,19 +1,136 @@
 import json
+import logging
 import os
+import threading
+from collections import OrderedDict
 from typing import Any, Iterable
 
-from dashscope import Assistants, Generation, Runs, Threads
-
-from .knowledge_base import get_course_title, list_documents, search_documents
-from .langchain_client import is_dashscope_configured
-from .memory_store import (
-    add_message,
-    auto_title_from_question,
-    get_or_create_conversation,
-    get_recent_messages,
+from dashscope import Assistants, Generation, Messages, Runs, Threads
+
+from .. import metrics
+from ..tracing import RequestTrace
+from ..utils import estimate_tokens
+from . import answer_cache, history_manager
+from .knowledge_base import (
+    get_course_title,
+    get_index_generation,
+    list_documents,
+    search_documents,
 )
+from .langchain_client import is_dashscope_configured
+from .memory_store import begin_turn, complete_turn
 from .rag_utils import build_answer_from_results, build_citations, format_context
 
+logger = logging.getLogger(__name__)
+
+QA_ASSISTANT_NAME = "RAG QA Stream"
+QA_ASSISTANT_INSTRUCTIONS = (
+    "你是教学问答助手。基于提供的检索内容回答问题，"
+    "若材料不足则依据你自己的知识储备回答。"
+    "结合对话历史理解追问与指代关系。"
+)
+MAX_CACHED_THREADS = 512
+
+# (model, instructions) -> assistant_id；每个进程只创建一次 Assistant
+_ASSISTANT_REGISTRY: dict[tuple[str, str], str] = {}
+# conversation_id -> (thread_id, 建 thread 时历史摘要的 summary_upto, thread 内容的估算 token 数)；
+# 按 LRU 淘汰，仅在 RAG_QA_REUSE_THREADS 开启时使用。每轮追加的消息带着完整检索资料，
+# 估算 token 超过历史预算后按“摘要 + 窗口”重建，thread 不会无限增长
+_THREAD_REGISTRY: "OrderedDict[str, tuple[str, str, int]]" = OrderedDict()
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _chat_model_name() -> str:
+    return os.getenv("DASHSCOPE_CHAT_MODEL", "qwen-plus").strip() or "qwen-plus"
+
+
+def _thread_reuse_enabled() -> bool:
+    return os.getenv("RAG_QA_REUSE_THREADS", "false").strip().lower() in {"1", "true", "yes"}
+
+
+def _get_assistant_id(model: str, instructions: str = QA_ASSISTANT_INSTRUCTIONS) -> str:
+    """Return a cached assistant id for (model, instructions), creating it on first use."""
+    key = (model, instructions)
+    with _REGISTRY_LOCK:
+        cached = _ASSISTANT_REGISTRY.get(key)
+    if cached:
+        return cached
+    assistant = Assistants.create(
+        model=model,
+        name=QA_ASSISTANT_NAME,
+        instructions=instructions,
+    )
+    with _REGISTRY_LOCK:
+        # 并发首次请求时以先写入者为准，避免同一进程持有多个 id
+        return _ASSISTANT_REGISTRY.setdefault(key, assistant.id)
+
+
+def _evict_assistant(model: str, instructions: str = QA_ASSISTANT_INSTRUCTIONS) -> None:
+    with _REGISTRY_LOCK:
+        _ASSISTANT_REGISTRY.pop((model, instructions), None)
+
+
+def _is_missing_assistant_error(exc: Exception) -> bool:
+    """DashScope 返回的 assistant 不存在 / 无效错误（404 或错误码含 assistant + not found / invalid）。"""
+    status = getattr(exc, "http_code", None) or getattr(exc, "status_code", None)
+    text = " ".join(
+        str(part) for part in (getattr(exc, "code", ""), getattr(exc, "name", ""), exc) if part
+    ).lower()
+    if "assistant" not in text:
+        return status == 404
+    return status == 404 or any(
+        marker in text for marker in ("not found", "notfound", "not_found", "invalid", "not exist")
+    )
+
+
+def _get_cached_thread(conversation_id: str | None, summary_upto: str = "") -> str | None:
+    """Return the conversation's thread if it was seeded from the same summary and
+    its estimated size still fits the history token budget."""
+    if not conversation_id:
+        return None
+    with _REGISTRY_LOCK:
+        entry = _THREAD_REGISTRY.get(conversation_id)
+        if not entry:
+            return None
+        if entry[1] != summary_upto or entry[2] > history_manager.history_token_budget():
+            # 摘要已推进，或 thread 内累积的问答与检索资料超出预算：重建
+            _THREAD_REGISTRY.pop(conversation_id, None)
+            return None
+        _THREAD_REGISTRY.move_to_end(conversation_id)
+        return entry[0]
+
+
+def _remember_thread(
+    conversation_id: str | None,
+    thread_id: str,
+    summary_upto: str = "",
+    tokens: int = 0,
+) -> None:
+    if not conversation_id:
+        return
+    with _REGISTRY_LOCK:
+        _THREAD_REGISTRY[conversation_id] = (thread_id, summary_upto, tokens)
+        _THREAD_REGISTRY.move_to_end(conversation_id)
+        while len(_THREAD_REGISTRY) > MAX_CACHED_THREADS:
+            _THREAD_REGISTRY.popitem(last=False)
+
+
+def _add_thread_tokens(conversation_id: str | None, thread_id: str, tokens: int) -> None:
+    """Account for content appended to a cached thread (new question or answer)."""
+    if not conversation_id or tokens <= 0:
+        return
+    with _REGISTRY_LOCK:
+        entry = _THREAD_REGISTRY.get(conversation_id)
+        if entry and entry[0] == thread_id:
+            _THREAD_REGISTRY[conversation_id] = (thread_id, entry[1], entry[2] + tokens)
+
+
+def _forget_thread(conversation_id: str | None) -> None:
+    if not conversation_id:
+        return
+    with _REGISTRY_LOCK:
+        _THREAD_REGISTRY.pop(conversation_id, None)
+
 
 def _extract_delta_text(data: Any) -> str:
     try:
@@ -27,6 +144,17 @@ def _extract_delta_text(data: Any) -> str:
             return ""
 
 
+def _build_user_content(question: str, context: str, course_name: str | None) -> str:
+    user_content = (
+        f"课程：{course_name or '未知课程'}\n"
+        f"问题：{question}\n\n"
+    )
+    if context:
+        user_content += f"检索资料：\n{context}\n\n"
+    user_content += "回答："
+    return user_content
+
+
 def _build_thread_messages(
     question: str,
     context: str,
@@ -37,14 +165,7 @@ def _build_thread_messages(
     messages: list[dict] = []
     for msg in history:
         messages.append({"role": msg["role"], "content": msg["content"]})
-    user_content = (
-        f"课程：{course_name or '未知课程'}\n"
-        f"问题：{question}\n\n"
-    )
-    if context:
-        user_content += f"检索资料：\n{context}\n\n"
-    user_content += "回答："
-    messages.append({"role": "user", "content": user_content})
+    messages.append({"role": "user", "content": _build_user_content(question, context, course_name)})
     return messages
 
 
@@ -60,26 +181,15 @@ def _stream_generation_answer(
     Yields str chunks for text content. When enable_search is True, also yields
     a dict ``{"web_sources": [...]}`` once when the search results arrive.
     """
-    model = os.getenv("DASHSCOPE_CHAT_MODEL", "qwen-plus").strip() or "qwen-plus"
-    system_prompt = (
-        "你是教学问答助手。基于提供的检索内容回答问题，"
-        "若材料不足则依据你自己的知识储备回答。"
-        "结合对话历史理解追问与指代关系。"
-    )
+    model = _chat_model_name()
+    system_prompt = QA_ASSISTANT_INSTRUCTIONS
     if enable_search:
         system_prompt += "你还可以结合联网搜索获取的最新信息来补充回答。"
 
     messages: list[dict] = [{"role": "system", "content": system_prompt}]
     for msg in (history or []):
         messages.append({"role": msg["role"], "content": msg["content"]})
-    user_content = (
-        f"课程：{course_name or '未知课程'}\n"
-        f"问题：{question}\n\n"
-    )
-    if context:
-        user_content += f"检索资料：\n{context}\n\n"
-    user_content += "回答："
-    messages.append({"role": "user", "content": user_content})
+    messages.append({"role": "user", "content": _build_user_content(question, context, course_name)})
 
     extra_kwargs: dict[str, Any] = {}
     if enable_search:
@@ -126,12 +236,52 @@ def _stream_generation_answer(
                     yield delta
 
 
+def _open_thread(
+    assistant_id: str,
+    question: str,
+    context: str,
+    course_name: str | None,
+    history: list[dict],
+    conversation_id: str | None,
+    summary_upto: str = "",
+) -> str:
+    """Return a thread id holding the new question.
+
+    With thread reuse enabled, the conversation's existing thread only receives the
+    new user message (earlier turns are already in it); otherwise a fresh thread is
+    seeded with the history.
+    """
+    reuse = _thread_reuse_enabled()
+    thread_id = _get_cached_thread(conversation_id, summary_upto) if reuse else None
+    if thread_id:
+        user_content = _build_user_content(question, context, course_name)
+        try:
+            Messages.create(thread_id, content=user_content, role="user")
+            _add_thread_tokens(conversation_id, thread_id, estimate_tokens(user_content))
+            return thread_id
+        except Exception:
+            logger.warning("Cached thread %s unusable, creating a new one", thread_id, exc_info=True)
+            _forget_thread(conversation_id)
+    thread_messages = _build_thread_messages(question, context, course_name, history)
+    thread = Threads.create(assistant_id=assistant_id, messages=thread_messages)
+    if reuse:
+        _remember_thread(
+            conversation_id,
+            thread.id,
+            summary_upto,
+            sum(estimate_tokens(message["content"]) for message in thread_messages),
+        )
+    return thread.id
+
+
 def _stream_dashscope_answer(
     question: str,
     context: str,
     course_name: str | None = None,
     history: list[dict] | None = None,
     use_web_search: bool = False,
+    conversation_id: str | None = None,
+    summary_upto: str = "",
 ) -> Iterable[str | dict]:
     if use_web_search:
         yield from _stream_generation_answer(
@@ -140,29 +290,64 @@ def _stream_dashscope_answer(
         )
         return
 
-    assistant = Assistants.create(
-        model=os.getenv("DASHSCOPE_CHAT_MODEL", "qwen-plus").strip() or "qwen-plus",
-        name="RAG QA Stream",
-        instructions=(
-            "你是教学问答助手。基于提供的检索内容回答问题，"
-            "若材料不足则依据你自己的知识储备回答。"
-            "结合对话历史理解追问与指代关系。"
-        ),
-    )
-    thread_messages = _build_thread_messages(question, context, course_name, history or [])
-    thread = Threads.create(assistant_id=assistant.id, messages=thread_messages)
-    run_iterator = Runs.create(thread.id, assistant_id=assistant.id, stream=True)
-    for event, data in run_iterator:
-        if event == "thread.message.delta":
-            chunk = _extract_delta_text(data)
-            if chunk:
-                yield chunk
+    model = _chat_model_name()
+    assistant_id = _get_assistant_id(model)
+    try:
+        thread_id = _open_thread(
+            assistant_id, question, context, course_name, history or [], conversation_id,
+            summary_upto,
+        )
+    except Exception as exc:
+        # 缓存的 assistant 可能已在控制台被删除：仅此时淘汰后重建一次；
+        # 超时、限流、5xx 等直接抛出，避免故障期间反复重建 assistant
+        if not _is_missing_assistant_error(exc):
+            raise
+        logger.warning("Cached assistant %s is gone, recreating it", assistant_id)
+        _evict_assistant(model)
+        _forget_thread(conversation_id)
+        assistant_id = _get_assistant_id(model)
+        thread_id = _open_thread(
+            assistant_id, question, context, course_name, history or [], conversation_id,
+            summary_upto,
+        )
+    run_iterator = Runs.create(thread_id, assistant_id=assistant_id, stream=True)
+    answer_chunks: list[str] = []
+    try:
+        for event, data in run_iterator:
+            if event == "thread.message.delta":
+                chunk = _extract_delta_text(data)
+                if chunk:
+                    answer_chunks.append(chunk)
+                    yield chunk
+    finally:
+        # 模型回答也留在 thread 中，计入其 token 估算
+        if _thread_reuse_enabled():
+            _add_thread_tokens(conversation_id, thread_id, estimate_tokens("".join(answer_chunks)))
 
 
 def _format_sse(event: str, data: dict) -> str:
     return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
+def _stream_cached_answer(cached: dict, conv: dict | None, trace: RequestTrace) -> Iterable[str]:
+    answer = cached["answer"]
+    if conv:
+        with trace.span("persistence"):
+            complete_turn(conv["id"], answer, cached["citations"])
+    for piece in answer_cache.split_for_stream(answer):
+        yield _format_sse("delta", {"text": piece})
+    done_payload: dict[str, Any] = {
+        "answer": answer,
+        "citations": cached["citations"],
+        "conversation_id": conv["id"] if conv else None,
+        "cache": answer_cache.cache_meta(cached),
+    }
+    if cached["disclaimer"]:
+        done_payload["disclaimer"] = cached["disclaimer"].strip()
+    done_payload["timings"] = trace.finish()
+    yield _format_sse("done", done_payload)
+
+
 def stream_answer_events(
     course_id: str,
     question: str,
@@ -171,21 +356,44 @@ def stream_answer_events(
     user_id: str | None = None,
     conversation_id: str | None = None,
 ) -> Iterable[str]:
+    trace = RequestTrace("qa_stream")
     course_name = get_course_title(course_id)
-    results = search_documents(course_id, question, top_k)
-    citations, _contexts = build_citations(results)
-    context = format_context(results)
 
     conv = None
     history: list[dict] = []
+    summary_upto = ""
     if user_id:
-        conv = get_or_create_conversation(user_id, course_id, conversation_id)
-        history = get_recent_messages(conv["id"])
-        add_message(conv["id"], "user", question)
-        auto_title_from_question(conv["id"], question)
+        with trace.span("history_load"):
+            conv, recent = begin_turn(
+                user_id, course_id, conversation_id, question,
+                history_limit=history_manager.HISTORY_FETCH_LIMIT,
+            )
+            window = history_manager.build_window(
+                conv, recent, fetch_limit=history_manager.HISTORY_FETCH_LIMIT,
+            )
+            history = window.messages
+            summary_upto = window.summary_upto
+            if window.truncated and _thread_reuse_enabled():
+                # 本轮有消息被挤出窗口：复用的 thread 里仍有它们，需用“摘要 + 近期消息”重建
+                _forget_thread(conv["id"])
 
     resolved_conv_id = conv["id"] if conv else None
 
+    embedding = None
+    generation = get_index_generation(course_id)
+    if answer_cache.is_cacheable(history, use_web_search):
+        with trace.span("cache_lookup"):
+            embedding = answer_cache.embed_question(question)
+            cached = answer_cache.lookup(course_id, embedding)
+        if cached:
+            yield from _stream_cached_answer(cached, conv, trace)
+            return
+
+    with trace.span("retrieval"), trace.activate():
+        results = search_documents(course_id, question, top_k, query_embedding=embedding)
+    citations, _contexts = build_citations(results)
+    context = format_context(results)
+
     disclaimer = ""
     if not citations:
         docs = list_documents(course_id)
@@ -197,14 +405,24 @@ def stream_answer_events(
     if not is_dashscope_configured():
         answer = disclaimer + "（占位）模型服务未配置，待接入后可生成回答。"
         if conv:
-            add_message(conv["id"], "assistant", answer, [])
+            with trace.span("persistence"):
+                complete_turn(conv["id"], answer, [])
         yield _format_sse("delta", {"text": answer})
-        yield _format_sse("done", {"answer": answer, "citations": citations, "conversation_id": resolved_conv_id})
+        yield _format_sse(
+            "done",
+            {
+                "answer": answer,
+                "citations": citations,
+                "conversation_id": resolved_conv_id,
+                "timings": trace.finish(),
+            },
+        )
         return
 
     answer_chunks: list[str] = []
     web_sources: list[dict] = []
     has_llm_content = False
+    llm_failed = False
 
     if disclaimer:
         yield _format_sse("delta", {"text": disclaimer})
@@ -212,16 +430,23 @@ def stream_answer_events(
 
     try:
         for chunk in _stream_dashscope_answer(
-            question, context, course_name=course_name, history=history, use_web_search=bool(use_web_search),
+            question, context, course_name=course_name, history=history,
+            use_web_search=bool(use_web_search), conversation_id=resolved_conv_id,
+            summary_upto=summary_upto,
         ):
             if isinstance(chunk, dict):
                 web_sources = chunk.get("web_sources", [])
                 yield _format_sse("web_sources", {"sources": web_sources})
             else:
+                trace.mark("first_token")
+                trace.mark("last_token", overwrite=True)
                 has_llm_content = True
                 answer_chunks.append(chunk)
                 yield _format_sse("delta", {"text": chunk})
+        metrics.LLM_REQUESTS.inc(component="qa_stream", outcome="ok")
     except Exception:
+        metrics.LLM_REQUESTS.inc(component="qa_stream", outcome="error")
+        llm_failed = True
         fallback = "模型响应失败，请稍后重试。"
         if not has_llm_content:
             yield _format_sse("delta", {"text": fallback})
@@ -234,7 +459,13 @@ def stream_answer_events(
 
     if conv:
         citations_for_db = [c for c in citations]
-        add_message(conv["id"], "assistant", answer, citations_for_db)
+        with trace.span("persistence"):
+            complete_turn(conv["id"], answer, citations_for_db)
+    if has_llm_content and not llm_failed:
+        answer_cache.store(
+            course_id, question, embedding, answer, citations,
+            disclaimer=disclaimer, generation=generation,
+        )
 
     done_payload: dict[str, Any] = {
         "answer": answer,
@@ -245,6 +476,7 @@ def stream_answer_events(
         done_payload["web_sources"] = web_sources
     if disclaimer:
         done_payload["disclaimer"] = disclaimer.strip()
+    done_payload["timings"] = trace.finish(output_text=answer if has_llm_content else "")
     yield _format_sse("done", done_payload)
 
 
@@ -256,8 +488,48 @@ def answer_question(
     user_id: str | None = None,
     conversation_id: str | None = None,
 ) -> dict[str, Any]:
+    trace = RequestTrace("qa")
     course_name = get_course_title(course_id)
-    results = search_documents(course_id, question, top_k)
+
+    conv = None
+    history: list[dict] = []
+    if user_id:
+        with trace.span("history_load"):
+            conv, recent = begin_turn(
+                user_id, course_id, conversation_id, question,
+                history_limit=history_manager.HISTORY_FETCH_LIMIT,
+            )
+            window = history_manager.build_window(
+                conv, recent, fetch_limit=history_manager.HISTORY_FETCH_LIMIT,
+            )
+            history = window.messages
+            if window.truncated and _thread_reuse_enabled():
+                # 本轮有消息被挤出窗口：复用的 thread 里仍有它们，需用“摘要 + 近期消息”重建
+                _forget_thread(conv["id"])
+
+    embedding = None
+    generation = get_index_generation(course_id)
+    if answer_cache.is_cacheable(history, use_web_search):
+        with trace.span("cache_lookup"):
+            embedding = answer_cache.embed_question(question)
+            cached = answer_cache.lookup(course_id, embedding)
+        if cached:
+            if conv:
+                with trace.span("persistence"):
+                    complete_turn(conv["id"], cached["answer"], cached["citations"])
+            trace.finish()
+            result: dict[str, Any] = {
+                "answer": cached["answer"],
+                "citations": cached["citations"],
+                "conversation_id": conv["id"] if conv else None,
+                "cache": answer_cache.cache_meta(cached),
+            }
+            if cached["disclaimer"]:
+                result["disclaimer"] = cached["disclaimer"].strip()
+            return result
+
+    with trace.span("retrieval"), trace.activate():
+        results = search_documents(course_id, question, top_k, query_embedding=embedding)
 
     disclaimer = ""
     if not results:
@@ -267,22 +539,23 @@ def answer_question(
         else:
             disclaimer = "**注意：** 未在课程知识库中检索到直接相关的资料，以下回答基于模型自身知识，仅供参考。\n\n"
 
-    conv = None
-    history: list[dict] = []
-    if user_id:
-        conv = get_or_create_conversation(user_id, course_id, conversation_id)
-        history = get_recent_messages(conv["id"])
-        add_message(conv["id"], "user", question)
-        auto_title_from_question(conv["id"], question)
-
-    payload = build_answer_from_results(
-        question, results, course_name=course_name, history=history, disclaimer=disclaimer,
-    )
+    with trace.span("generation"):
+        payload = build_answer_from_results(
+            question, results, course_name=course_name, history=history, disclaimer=disclaimer,
+        )
 
     if conv:
-        add_message(conv["id"], "assistant", payload["answer"], payload.get("citations", []))
+        with trace.span("persistence"):
+            complete_turn(conv["id"], payload["answer"], payload.get("citations", []))
+    trace.finish()
+    if payload.get("from_model"):
+        # 与流式路径一致：只缓存模型真正生成的回答，占位 / 兜底文案不入缓存
+        answer_cache.store(
+            course_id, question, embedding, payload["answer"], payload["citations"],
+            disclaimer=disclaimer, generation=generation,
+        )
 
-    result: dict[str, Any] = {
+    result = {
         "answer": payload["answer"],
         "citations": payload["citations"],
         "conversation_id": conv["id"] if conv else None,
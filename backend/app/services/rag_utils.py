@@ -4,6 +4,7 @@ from typing import Any
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
+from .. import metrics
 from .langchain_client import get_chat_model, is_dashscope_configured
 
 
@@ -118,7 +119,8 @@ def _select_mcp_tool(
     chain = build_mcp_router_chain()
     if not chain:
         return None, {}
-    raw = chain.invoke({"instruction": instruction, "tool_list": _tool_list_text(tools)})
+    with metrics.track_llm_call("mcp_router"):
+        raw = chain.invoke({"instruction": instruction, "tool_list": _tool_list_text(tools)})
     if not raw:
         return None, {}
     try:
@@ -166,7 +168,7 @@ def build_answer_from_results(
 
     if answer_override is not None:
         answer = disclaimer + answer_override if disclaimer else answer_override
-        return {"answer": answer, "citations": citations, "contexts": contexts}
+        return {"answer": answer, "citations": citations, "contexts": contexts, "from_model": False}
 
     answer = None
     has_history = bool(history)
@@ -179,10 +181,18 @@ def build_answer_from_results(
         }
         if has_history:
             invoke_args["history"] = _format_history(history)  # type: ignore[arg-type]
-        answer = chain.invoke(invoke_args)
+        with metrics.track_llm_call("qa"):
+            answer = chain.invoke(invoke_args)
 
+    # from_model=False 表示占位回答（未配置模型或模型返回空），调用方不应缓存
+    from_model = bool(answer)
     if not answer:
         answer = "（占位）基于检索到的资料生成回答，待接入模型后替换。"
 
     full_answer = disclaimer + answer if disclaimer else answer
-    return {"answer": full_answer, "citations": citations, "contexts": contexts}
+    return {
+        "answer": full_answer,
+        "citations": citations,
+        "contexts": contexts,
+        "from_model": from_model,
+    }
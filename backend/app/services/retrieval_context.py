@@ -0,0 +1,104 @@
+"""单次 Agent 运行内共享的检索结果。
+
+备课等多步任务里，search_kb / lesson_outline / generate_exercise 会围绕同一章节反复检索。
+RetrievalContext 记录本次运行已经拿到的片段：完全相同的查询直接复用；
+提纲与出题只为尚未被已有片段覆盖的知识点补充检索。
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+
+from .. import metrics
+from .knowledge_base import search_documents
+
+
+def _query_key(course_id: str, query: str, filters: dict | None) -> tuple[str, str, str]:
+    return (
+        course_id,
+        " ".join(query.split()),
+        json.dumps(filters or {}, ensure_ascii=False, sort_keys=True),
+    )
+
+
+def _mentions(result: dict, knowledge_point: str) -> bool:
+    needle = knowledge_point.strip().lower()
+    if not needle:
+        return False
+    haystack = f"{result.get('title_path') or ''}\n{result.get('content') or ''}".lower()
+    return needle in haystack
+
+
+class RetrievalContext:
+    """Per-run store of ``search_documents`` results, safe to share across threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # (course_id, query, filters) -> (top_k, results)，按首次记录的顺序保存
+        self._queries: dict[tuple[str, str, str], tuple[int, list[dict]]] = {}
+
+    def record(
+        self,
+        course_id: str,
+        query: str,
+        results: list[dict],
+        top_k: int | None = None,
+        filters: dict | None = None,
+    ) -> None:
+        key = _query_key(course_id, query, filters)
+        with self._lock:
+            self._queries[key] = (top_k if top_k is not None else len(results), list(results))
+
+    def search(
+        self,
+        course_id: str,
+        query: str,
+        top_k: int = 5,
+        filters: dict | None = None,
+    ) -> list[dict]:
+        """Return recorded results for the same query, otherwise search and record them."""
+        key = _query_key(course_id, query, filters)
+        with self._lock:
+            cached = self._queries.get(key)
+        if cached and cached[0] >= top_k:
+            metrics.record_cache("agent_retrieval", True)
+            return cached[1][:top_k]
+        metrics.record_cache("agent_retrieval", False)
+        results = search_documents(course_id, query, top_k, filters)
+        self.record(course_id, query, results, top_k=top_k, filters=filters)
+        return results
+
+    def chunks(self, course_id: str) -> list[dict]:
+        """Every distinct chunk retrieved for the course so far, in retrieval order."""
+        with self._lock:
+            records = [
+                results for (cid, _, _), (_, results) in self._queries.items() if cid == course_id
+            ]
+        seen: set[str] = set()
+        merged: list[dict] = []
+        for results in records:
+            for result in results:
+                chunk_id = result.get("chunk_id")
+                if chunk_id in seen:
+                    continue
+                if chunk_id:
+                    seen.add(chunk_id)
+                merged.append(result)
+        return merged
+
+    def covering(self, course_id: str, knowledge_point: str, limit: int) -> list[dict]:
+        """Chunks already retrieved for ``knowledge_point``.
+
+        A direct query for the point wins; otherwise chunks whose title path or
+        content mention it. An empty list means the point is still uncovered.
+        """
+        key = _query_key(course_id, knowledge_point, None)
+        with self._lock:
+            direct = self._queries.get(key)
+        if direct and direct[1]:
+            return direct[1][:limit]
+        mentioned = [
+            result for result in self.chunks(course_id) if _mentions(result, knowledge_point)
+        ]
+        return mentioned[:limit]
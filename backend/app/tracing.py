@@ -0,0 +1,120 @@
+"""请求级阶段计时（QA / Agent 流式链路）。
+
+用法：
+    trace = RequestTrace("qa_stream")
+    with trace.span("retrieval"), trace.activate():
+        results = search_documents(...)   # 内部的 span("rerank") 会记到同一 trace
+    trace.mark("first_token")
+    ...
+    payload["timings"] = trace.finish(output_text=answer)
+
+``activate`` 基于 contextvars，只在同一次同步调用内有效；SSE 生成器每次
+``next()`` 可能落在不同线程上，因此跨 yield 的阶段需显式传递 trace 对象。
+"""
+
+from __future__ import annotations
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from .metrics import histogram
+from .utils import estimate_tokens
+
+STAGE_SECONDS = histogram(
+    "request_stage_seconds",
+    "Per-request stage latency for QA and agent flows.",
+    labelnames=("flow", "stage"),
+)
+OUTPUT_TOKENS_PER_SECOND = histogram(
+    "llm_output_tokens_per_second",
+    "Estimated LLM output throughput between first and last token.",
+    labelnames=("flow",),
+    buckets=(1, 5, 10, 20, 40, 60, 80, 120, 200, 400),
+)
+
+_CURRENT_TRACE: contextvars.ContextVar["RequestTrace | None"] = contextvars.ContextVar(
+    "current_request_trace", default=None,
+)
+
+
+class RequestTrace:
+    """Accumulates stage durations and point-in-time marks for one request."""
+
+    def __init__(self, flow: str) -> None:
+        self.flow = flow
+        self._started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.marks: dict[str, float] = {}
+        self._finished = False
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + max(0.0, seconds)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def mark(self, name: str, overwrite: bool = False) -> None:
+        """Record seconds since the request started; first write wins unless ``overwrite``."""
+        if overwrite or name not in self.marks:
+            self.marks[name] = self.elapsed()
+
+    @contextmanager
+    def activate(self) -> Iterator["RequestTrace"]:
+        token = _CURRENT_TRACE.set(self)
+        try:
+            yield self
+        finally:
+            _CURRENT_TRACE.reset(token)
+
+    def finish(self, output_text: str = "") -> dict:
+        """Freeze the trace, feed the histograms once, and return the ``timings`` payload."""
+        total = self.elapsed()
+        payload: dict = {f"{stage}_ms": int(seconds * 1000) for stage, seconds in self.stages.items()}
+        payload.update({f"{name}_ms": int(seconds * 1000) for name, seconds in self.marks.items()})
+        payload["total_ms"] = int(total * 1000)
+
+        tokens_per_second = None
+        if output_text:
+            tokens = estimate_tokens(output_text)
+            payload["output_tokens"] = tokens
+            first = self.marks.get("first_token")
+            last = self.marks.get("last_token")
+            if first is not None and last is not None and last > first:
+                tokens_per_second = tokens / (last - first)
+                payload["tokens_per_second"] = round(tokens_per_second, 1)
+
+        if not self._finished:
+            self._finished = True
+            for stage, seconds in self.stages.items():
+                STAGE_SECONDS.observe(seconds, flow=self.flow, stage=stage)
+            for name, seconds in self.marks.items():
+                STAGE_SECONDS.observe(seconds, flow=self.flow, stage=name)
+            STAGE_SECONDS.observe(total, flow=self.flow, stage="total")
+            if tokens_per_second is not None:
+                OUTPUT_TOKENS_PER_SECOND.observe(tokens_per_second, flow=self.flow)
+        return payload
+
+
+def current_trace() -> RequestTrace | None:
+    return _CURRENT_TRACE.get()
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time ``stage`` on the active trace, or do nothing when no trace is active."""
+    trace = _CURRENT_TRACE.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
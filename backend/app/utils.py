@@ -8,3 +8,12 @@ def generate_id(prefix: str) -> str:
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, ~4 characters per token otherwise."""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
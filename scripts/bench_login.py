@@ -0,0 +1,113 @@
+"""Login throughput under a burst of concurrent logins: inline PBKDF2 vs hashing pool.
+
+运行方式：
+  cd <项目根>
+  backend/venv/bin/python scripts/bench_login.py [concurrency]
+
+inline：旧实现——同步 handler 在 Starlette 线程池（默认 40 个 token）里直接跑 PBKDF2；
+pool：新实现——async handler，PBKDF2 提交到 AUTH_HASH_WORKERS 个进程。
+
+同时每 20ms 向线程池提交一个空任务作为“其他请求”探针，报告其排队延迟，
+用来观察登录洪峰期间其余同步接口是否被饿死。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = PROJECT_ROOT / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi.concurrency import run_in_threadpool  # noqa: E402
+
+from app import auth, db  # noqa: E402
+from app.routers import auth as auth_router  # noqa: E402
+from app.schemas import LoginRequest  # noqa: E402
+
+EMAIL = "bench@example.com"
+PASSWORD = "bench-password"
+
+
+def _seed_user() -> None:
+    password_hash, salt = auth.create_password_hash(PASSWORD)
+    with db.transaction() as conn:
+        conn.execute(
+            "INSERT INTO users (id, name, email, role, password_hash, password_salt, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ("user_bench", "bench", EMAIL, "student", password_hash, salt, "2024-01-01T00:00:00+00:00"),
+        )
+
+
+def _inline_login(payload: LoginRequest) -> str:
+    row = auth_router._get_user_by_email(payload.email)
+    expected = auth.hash_password(payload.password, row["password_salt"])
+    if expected != row["password_hash"]:
+        raise RuntimeError("invalid credentials")
+    return auth.create_session(row["id"])
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def _probe(stop: asyncio.Event, samples: list[float]) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await run_in_threadpool(lambda: None)
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.02)
+
+
+async def _run(mode: str, concurrency: int) -> None:
+    payload = LoginRequest(email=EMAIL, password=PASSWORD)
+    latencies: list[float] = []
+    probe_samples: list[float] = []
+
+    async def one() -> None:
+        started = time.perf_counter()
+        if mode == "inline":
+            await run_in_threadpool(_inline_login, payload)
+        else:
+            await auth_router.login(payload)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(stop, probe_samples))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    probe_p95 = _percentile(probe_samples, 0.95)
+    print(
+        f"{mode:<6} n={concurrency} wall={elapsed:.2f}s throughput={concurrency / elapsed:.1f}/s "
+        f"p50={statistics.median(latencies):.0f}ms p95={_percentile(latencies, 0.95):.0f}ms "
+        f"p99={_percentile(latencies, 0.99):.0f}ms threadpool-probe p95={probe_p95:.1f}ms"
+    )
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    db.DB_PATH = Path(tempfile.mkdtemp()) / "bench_login.db"
+    db.init_db()
+    _seed_user()
+    try:
+        asyncio.run(_run("inline", concurrency))
+        # 先预热进程池，避免把 spawn 启动时间计入吞吐
+        asyncio.run(auth.hash_password_async(PASSWORD, "00" * 16))
+        asyncio.run(_run("pool", concurrency))
+    finally:
+        auth.shutdown_hash_executor()
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure QA stream time-to-first-token with and without the assistant registry.
+
+运行方式：
+  cd <项目根>
+  DASHSCOPE_API_KEY=... backend/venv/bin/python scripts/bench_qa_ttft.py [rounds]
+
+cold：每轮清空 assistant 注册表，等价于旧实现每次提问都 Assistants.create；
+warm：复用同一 assistant，仅 Threads.create + Runs.create。
+设置 RAG_QA_REUSE_THREADS=true 时 warm 组还会复用同一 thread。
+"""
+
+from __future__ import annotations
+
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = PROJECT_ROOT / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.services import rag_qa  # noqa: E402
+
+QUESTION = "RAG 中 Rerank 的作用是什么？请用一句话回答。"
+CONTEXT = "[1] Rerank 对召回的候选片段按与问题的相关性重新排序。"
+
+
+def _ttft_ms(conversation_id: str | None) -> float:
+    started = time.perf_counter()
+    stream = rag_qa._stream_dashscope_answer(
+        QUESTION, CONTEXT, course_name="基准测试", history=[], conversation_id=conversation_id,
+    )
+    for chunk in stream:
+        if isinstance(chunk, str) and chunk:
+            elapsed = (time.perf_counter() - started) * 1000
+            stream.close()
+            return elapsed
+    return (time.perf_counter() - started) * 1000
+
+
+def _report(label: str, samples: list[float]) -> None:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{label:<5} n={len(samples)} mean={statistics.mean(samples):.0f}ms "
+        f"median={statistics.median(samples):.0f}ms p95={p95:.0f}ms"
+    )
+
+
+def main() -> None:
+    if not os.getenv("DASHSCOPE_API_KEY"):
+        print("DASHSCOPE_API_KEY 未设置，无法测量。")
+        return
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    cold: list[float] = []
+    for _ in range(rounds):
+        rag_qa._ASSISTANT_REGISTRY.clear()
+        rag_qa._THREAD_REGISTRY.clear()
+        cold.append(_ttft_ms(None))
+
+    warm: list[float] = []
+    rag_qa._get_assistant_id(rag_qa._chat_model_name())
+    for _ in range(rounds):
+        warm.append(_ttft_ms("conv_bench_ttft"))
+
+    _report("cold", cold)
+    _report("warm", warm)
+    print(f"median saving: {statistics.median(cold) - statistics.median(warm):.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Verify that hot queries use the secondary indexes (EXPLAIN QUERY PLAN).
+
+运行方式：
+  cd <项目根>
+  backend/venv/bin/python scripts/check_query_plans.py
+
+在临时数据库上执行全部迁移，再逐条检查服务模块中热点查询的计划：计划中出现对目标表的
+``SCAN``（全表扫描）或 ``USE TEMP B-TREE FOR ORDER BY``（额外排序）即视为失败。
+SQL 直接从 memory_store / knowledge_tracking 导入，查询改动后无需同步本脚本。
+"""
+
+from __future__ import annotations
+
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = PROJECT_ROOT / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app import db  # noqa: E402
+from app.services import knowledge_tracking, memory_store  # noqa: E402
+
+# (目标表, 服务模块中实际执行的 SQL, 示例参数)；SQL 从模块导入，不在此处另抄一份
+HOT_QUERIES: list[tuple[str, str, tuple | dict]] = [
+    ("messages", memory_store._RECENT_MESSAGES_SQL, ("conv", 10)),
+    ("messages", memory_store._UNSUMMARIZED_MESSAGES_SQL, ("conv", "2024-01-01", 10)),
+    ("messages", memory_store._MESSAGES_CHRONOLOGICAL_SQL, ("conv",)),
+    ("conversations", memory_store._CONVERSATIONS_BY_COURSE_SQL, ("user", "course")),
+    ("conversations", memory_store._CONVERSATIONS_BY_USER_SQL, ("user",)),
+    ("conversations", memory_store._LATEST_CONVERSATION_SQL, ("user", "course")),
+    *(
+        (
+            "conversations",
+            memory_store._conversations_page_sql(by_course, after_cursor),
+            ("user", *(("course",) if by_course else ()),
+             *(("2024-01-01", "conv") if after_cursor else ()), 21),
+        )
+        for by_course in (True, False)
+        for after_cursor in (False, True)
+    ),
+    *(
+        (
+            "messages",
+            memory_store._messages_page_sql(include_citations, after_cursor),
+            ("conv", *(("2024-01-01", "msg") if after_cursor else ()), 51),
+        )
+        for include_citations in (True, False)
+        for after_cursor in (False, True)
+    ),
+    ("exercise_attempts", knowledge_tracking._EXERCISE_ATTEMPTS_SQL, ("student", "course", 50)),
+    ("knowledge_points", knowledge_tracking._COURSE_POINTS_SQL, ("course",)),
+    (
+        "knowledge_mastery",
+        knowledge_tracking._CLASS_MASTERY_SQL,
+        {"course_id": "course", "threshold": knowledge_tracking.WEAK_THRESHOLD},
+    ),
+]
+
+
+def main() -> int:
+    db.DB_PATH = Path(tempfile.mkdtemp()) / "plan_check.db"
+    db.init_db()
+    failures = 0
+    for table, sql, params in HOT_QUERIES:
+        plan = db.explain_query_plan(sql, params)
+        bad = [
+            detail
+            for detail in plan
+            if detail.startswith(f"SCAN {table}") or "TEMP B-TREE FOR ORDER BY" in detail
+        ]
+        status = "FAIL" if bad else "ok"
+        failures += bool(bad)
+        print(f"[{status}] {sql}\n       {' | '.join(plan)}")
+    db.close_pool()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
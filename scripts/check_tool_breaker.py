@@ -0,0 +1,88 @@
+"""Regression check for the per-tool circuit breaker in tool_executor.
+
+运行方式：
+  cd <项目根>
+  backend/venv/bin/python scripts/check_tool_breaker.py
+
+用桩函数替换 get_mastery 的 runner，不访问数据库或模型：
+1. 连续上游故障使熔断器打开；
+2. 参数校验失败的步骤不得关闭、重置熔断器，也不占用半开试探（工具根本没被调用）；
+3. 冷却后成功的试探调用关闭熔断器。
+任一断言失败即以非零状态退出。
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = PROJECT_ROOT / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ["AGENT_TOOL_BREAKER_FAILURES"] = "2"
+os.environ["AGENT_TOOL_BREAKER_COOLDOWN_SECONDS"] = "0.5"
+os.environ["AGENT_RETRY_BACKOFF_SECONDS"] = "0"
+
+from app.agents.nodes import tool_executor  # noqa: E402
+from app.agents.tools import REGISTRY  # noqa: E402
+
+TOOL = "get_mastery"
+VALID_STEP = {
+    "step_id": "s1",
+    "tool_name": TOOL,
+    "tool_args": {"student_id": "student", "course_id": "course"},
+}
+INVALID_STEP = {"step_id": "s2", "tool_name": TOOL, "tool_args": {"student_id": "", "course_id": ""}}
+
+
+def _upstream_down(args: dict, **kwargs) -> dict:
+    raise RuntimeError("upstream unavailable")
+
+
+def _upstream_ok(args: dict, **kwargs) -> dict:
+    return {"items": [], "weak_points": []}
+
+
+def _circuit_open(result: dict) -> bool:
+    return (result.get("error") or "").startswith("CircuitOpen")
+
+
+def main() -> int:
+    spec = REGISTRY[TOOL]
+    original_runner = spec.runner
+    checks: list[tuple[str, bool]] = []
+    try:
+        spec.runner = _upstream_down
+        for _ in range(2):
+            tool_executor.execute_step(dict(VALID_STEP))
+        checks.append(
+            ("breaker opens after upstream failures", _circuit_open(tool_executor.execute_step(dict(VALID_STEP))))
+        )
+
+        invalid = tool_executor.execute_step(dict(INVALID_STEP))
+        checks.append(("invalid args fail before the breaker", not invalid["success"] and not _circuit_open(invalid)))
+        checks.append(
+            ("breaker stays open after an invalid-args step", _circuit_open(tool_executor.execute_step(dict(VALID_STEP))))
+        )
+
+        time.sleep(0.6)
+        tool_executor.execute_step(dict(INVALID_STEP))
+        spec.runner = _upstream_ok
+        checks.append(
+            ("invalid args do not consume the half-open probe", tool_executor.execute_step(dict(VALID_STEP))["success"])
+        )
+        checks.append(("successful probe closes the breaker", tool_executor.execute_step(dict(VALID_STEP))["success"]))
+    finally:
+        spec.runner = original_runner
+        tool_executor.shutdown_tool_executor()
+
+    for label, passed in checks:
+        print(f"[{'ok' if passed else 'FAIL'}] {label}")
+    return 0 if all(passed for _, passed in checks) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())